@@ -0,0 +1,426 @@
+import json
+import math
+import os
+import pickle
+import re
+import threading
+import time
+from camera_settings import conversion_path, negotiate
+from capture_engine import CaptureEngine
+from frame_composer import FrameComposer, check_roi
+from frame_integrity import FrameIntegrity
+from frame_log import FrameLogWriter, SYNC_LEVEL, SYNC_TOGGLED, read_frame_log
+from frame_scheduler import FrameScheduler
+from profiling import StageProfiler, format_summary
+from rolling_stats import RollingIntervalStats
+from frame_writer import FrameWriter
+from writer_backends import BACKENDS
+from recording_format import TimestampIndexWriter, embed_mp4_timestamps
+from sync_driver import SyncDriver, SyncSchedule, next_level
+
+# Acquisition state and recording logic shared by the Qt window (vid_acq.py) and the
+# headless runner (vid_acq_headless.py). Nothing in here depends on Qt.
+
+
+class DummyArduino:
+    def write(self, data):
+        print(f"Dummy Arduino received data: {data}")
+
+
+def open_arduino(port):
+    try:
+        import serial
+    except ImportError:
+        return DummyArduino()
+    try:
+        arduino = serial.Serial(port, 9600)
+        print('Arduino detected')
+        return arduino
+    except serial.SerialException:
+        return DummyArduino()
+
+
+# <date>_<session>_<animal>, e.g. '2024-01-15_01_ESPM101'. The animal names the directory.
+EXPERIMENT_ID = re.compile(r'\d{4}-\d{2}-\d{2}_\d{2}_[\w-]+')
+
+
+def session_directory(data_root, experiment_id):
+    # DATA_ROOT/<animal>/<experiment_id>/, the animal is the part of the id after the date and
+    # session number, e.g. '2024-01-15_01_ESPM101' -> 'ESPM101'
+    return os.path.join(data_root, experiment_id[14:], experiment_id)
+
+
+def sidecar_filename(video_filename, suffix):
+    # '<id>_eye1.mp4' -> '<id>_eyeMeta1.pickle' for suffix '_eyeMeta1.pickle'. Names picked in
+    # the file dialog that do not follow the convention get the suffix appended instead.
+    base = os.path.splitext(video_filename)[0]
+    if base.endswith('_eye1'):
+        base = base[:-len('_eye1')]
+    return base + suffix
+
+
+class Acquisition:
+    def __init__(self, captures, data_root, fps, save_size, disp_size, arduino=None, backend='mp4v',
+                 camera_ids=None, multi_stream=False, save_pickle=True, sync_schedule=None, segment_frames=None,
+                 rois=None, camera_settings=None, save_profile=False, camera_info=None):
+        self.camera_ids = list(camera_ids) if camera_ids is not None else list(range(len(captures)))
+        # One file per camera instead of all cameras side by side in one file
+        self.multi_stream = multi_stream
+        # Also export the per-frame log as the legacy _eyeMeta1.pickle when recording stops
+        self.save_pickle = save_pickle
+        self.data_root = data_root
+        self.target_fps = fps
+        self.save_size = save_size
+        self.disp_size = disp_size
+        # Box (x, y, width, height) in camera pixels that is saved instead of the whole frame,
+        # per camera in camera_ids order, from a {camera id: box} dict
+        rois = rois or {}
+        self.rois = [tuple(rois[cam]) if rois.get(cam) is not None else None for cam in self.camera_ids]
+        self.backend = backend  # Default writer backend, see writer_backends.BACKENDS
+        # Roll the recording over to a new file every segment_frames frames, None for one file
+        self.segment_frames = segment_frames
+        # Stage timing histograms (metrics_server.py), saved per recording as _eyeProfile1.json
+        self.profiler = StageProfiler()
+        self.save_profile = save_profile
+        self.profile_start = None
+
+        # Ask each camera for its settings (camera_settings maps camera ids to CameraSettings)
+        # and the frame rate, and keep what the drivers granted for the session metadata.
+        # camera_info holds the negotiate() result of cameras startup.py already negotiated, the
+        # others (and all cameras without it) are negotiated here.
+        camera_settings = camera_settings or {}
+        camera_info = camera_info or [None] * len(captures)
+        negotiated = [(capture, info) if info is not None else negotiate(capture, camera_settings.get(cam), fps)
+                      for capture, cam, info in zip(captures, self.camera_ids, camera_info)]
+        self.captures = [capture for capture, _ in negotiated]
+        self.cameras = [info for _, info in negotiated]
+        for cam, info, roi in zip(self.camera_ids, self.cameras, self.rois):
+            granted = info['granted']
+            if roi is not None:
+                try:
+                    check_roi(roi, granted['frame_shape'])  # Not checked for a camera without frames
+                except ValueError as error:
+                    for capture in self.captures:
+                        capture.release()
+                    raise ValueError(f'Camera {cam}: {error}') from None
+            info['path'] = conversion_path(granted['frame_shape'], save_size, roi, granted['y_plane'])
+            print(f"Camera {cam}: {granted['width']}x{granted['height']} {granted['fourcc'] or '?'} "
+                  f"at {granted['fps']:g} fps, {info['path']}")
+
+        # One reader thread per camera so grabs run in parallel and off the GUI thread
+        self.capture_engine = CaptureEngine(self.captures, profiler=self.profiler)
+        self.capture_engine.start()
+
+        # Save and display canvases are allocated once. The combined file is always at least 3
+        # cameras wide, per-camera files have exactly one slot per camera.
+        n_slots = len(self.captures) if multi_stream else max(3, len(self.captures))
+        self.composer = FrameComposer(n_slots, save_size, disp_size, stacked=not multi_stream, rois=self.rois)
+
+        # Drives tick() at the target rate with absolute deadlines, see start()
+        self.scheduler = FrameScheduler(self.tick, fps)
+
+        self.recording = False
+        self.frame_count = 0
+        self.final_filename = None
+        self.writers = []
+        self.last_time = time.perf_counter()
+        self.fps = 0
+        # Session metadata. Per-frame data goes to the frame log, the live overlay gets its
+        # numbers from the rolling interval statistics over the last 100 recorded frames.
+        self.frame_data = {'frame_count': 0}
+        self.interval_stats = RollingIntervalStats(100, 1.0 / fps)
+        self.sync_level = 0
+        self.experiment_id = None
+        self.acquisition_start_time = None
+        self.start_perf = None  # perf_counter time recording started and stopped
+        self.stop_perf = None
+        self.first_frame_time = None
+        self.grab_times = []
+        self.seqs = []
+        self.frames_valid = []  # Per camera, False if the ring slot was overwritten while composing
+        # Stale, duplicate and missing camera frames of the recording
+        self.integrity = FrameIntegrity(self.capture_engine)
+        # Commands may arrive from a listener thread while tick() runs
+        self.lock = threading.Lock()
+
+        self.arduino = arduino if arduino is not None else DummyArduino()
+        # Serial writes happen on the sync driver thread, the frame loop only queues commands
+        self.sync_schedule = sync_schedule or SyncSchedule()
+        self.sync_driver = SyncDriver(self.arduino)
+        self.sync_driver.start()
+        self.sync_driver.send(b'L')  # Set Arduino to low at startup
+
+    def start(self):
+        self.scheduler.start()
+
+    def tick(self):
+        # Composes the newest frame of every camera and records it when recording.
+        # Returns the combined save frame. The preview is rendered separately, see preview.py.
+        # Taken before composing so frame times follow the scheduler deadlines, not compose time
+        current_time = time.perf_counter()
+        frames, self.grab_times, self.seqs = self.capture_engine.latest_set()
+        t_read = time.perf_counter()
+        self.profiler.add('read', t_read - current_time)
+        combined_frame_save = self.composer.compose_save(frames)
+        # The frames are live ring slots, a reader that lapped the ring may have rewritten one
+        self.frames_valid = self.capture_engine.latest_valid(self.seqs)
+        t_compose = time.perf_counter()
+        self.profiler.add('compose_save', t_compose - t_read)
+
+        # Update the FPS calculation
+        self.fps = 1.0 / (current_time - self.last_time)
+        self.last_time = current_time
+
+        with self.lock:
+            # A scheduled recording is armed before its start time and records from then on
+            if self.recording and current_time >= self.start_perf:
+                self._record_frame(combined_frame_save, current_time)
+        self.profiler.add('tick', time.perf_counter() - current_time)
+        return combined_frame_save
+
+    def _record_frame(self, combined_frame_save, current_time):
+        # All streams must stay frame aligned, so a frame is only written if every writer has room.
+        # Dropped frames are counted by the writers and left out of frame_times.
+        t_write = time.perf_counter()
+        if not all([writer.can_write() for writer in self.writers]):
+            for writer in self.writers:
+                writer.drop()
+            return
+        if self.multi_stream:
+            for writer, frame in zip(self.writers, combined_frame_save):
+                writer.write(frame)
+        else:
+            self.writers[0].write(combined_frame_save)
+        t_log = time.perf_counter()
+        self.profiler.add('writer_submit', t_log - t_write)
+        frame_index = self.frame_count
+        if frame_index == 0:
+            self.first_frame_time = current_time
+        self.frame_count += 1
+        self.frame_data['frame_count'] = self.frame_count
+        frame_time = current_time - self.start_perf
+        self.interval_stats.add_time(frame_time)
+        self.timestamps.append(frame_time)
+        sync = 0
+        command = self.sync_schedule.command_for(self.frame_count)
+        if command is not None:
+            self.sync_driver.send(command, frame_index)
+            self.sync_level = next_level(self.sync_level, command)
+            sync = SYNC_TOGGLED
+        cam_flags, cam_seq = self.integrity.check(self.seqs, self.frames_valid)
+        self.frame_log.append(frame_index, frame_time, [t - self.start_perf for t in self.grab_times],
+                              sync | (SYNC_LEVEL if self.sync_level else 0), cam_seq, cam_flags)
+        self.profiler.add('frame_log', time.perf_counter() - t_log)
+
+    def start_recording(self, filename, backend=None, start_at=None):
+        # start_at is a perf_counter time to start recording at, e.g. to start several rigs
+        # together. Everything is opened now and the tick grid is moved so a frame falls on it.
+        backend = backend or self.backend
+        # The backend decides the container, e.g. '<id>_eye1.mp4' becomes '<id>_eye1.mkv' for ffv1
+        filename = os.path.splitext(filename)[0] + BACKENDS[backend].extension
+        start_time = time.time()
+        if start_at is not None:
+            start_time += max(start_at - time.perf_counter(), 0.0)  # Wall clock time of a scheduled start
+        # Encoding runs in separate processes so a slow encode never delays the next capture
+        if self.multi_stream:
+            base, extension = os.path.splitext(filename)
+            video_filenames = [f'{base}_cam{cam}{extension}' for cam in self.camera_ids]
+            frame_size = self.save_size
+        else:
+            video_filenames = [filename]
+            frame_size = self.composer.save_canvas.shape[::-1]  # Combined width of all camera slots
+        # Opened first: a backend that cannot be opened raises before anything else is written.
+        # Whatever fails, the writer processes and their shared memory are released again.
+        writers = []
+        timestamps = None
+        try:
+            for name in video_filenames:
+                writers.append(FrameWriter(name, backend, self.target_fps, frame_size, is_color=False,
+                                           segment_frames=self.segment_frames))
+            timestamps = TimestampIndexWriter(sidecar_filename(filename, '_eyeTimes1.bin'), self.target_fps,
+                                              start_time)
+            frame_data = {'frame_count': 0, 'start_time': start_time, 'target_fps': self.target_fps,
+                          'sync_schedule': self.sync_schedule.describe(),
+                          'backend': backend, 'camera_ids': self.camera_ids, 'save_size': self.save_size,
+                          'rois': [list(roi) if roi else None for roi in self.rois], 'cameras': self.cameras,
+                          'multi_stream': self.multi_stream, 'segment_frames': self.segment_frames,
+                          'video_files': [os.path.basename(name) for name in video_filenames]}
+            # Written as the recording goes, so a crash loses at most one batch of frames
+            frame_log = FrameLogWriter(sidecar_filename(filename, '_eyeFrames1.bin'), len(self.captures),
+                                       frame_data)
+        except Exception:
+            if timestamps is not None:
+                timestamps.close()
+            for writer in writers:
+                writer.release()
+            raise
+        with self.lock:
+            self.writers = writers
+            self.timestamps = timestamps
+            self.frame_log = frame_log
+            self.final_filename = filename
+            self.frame_count = 0
+            self.frame_data = frame_data
+            self.interval_stats.reset()
+            self.integrity.reset()
+            self.profile_start = self.profiler.copy()
+            self.sync_level = 0
+            # Frame and grab times are relative to this, on the monotonic perf_counter clock
+            now = time.perf_counter()
+            self.start_perf = start_at if start_at is not None and start_at > now else now
+            self.first_frame_time = None
+            self.missed_at_start = self.scheduler.missed_deadlines
+            self.acquisition_start_time = time.time() + (self.start_perf - now)
+            self.sync_driver.take_events()  # Commands sent between recordings are not logged
+            self.sync_driver.send(b'L')  # Set Arduino to low at the start of recording
+            self.recording = True
+        if self.start_perf > now:
+            self.scheduler.align(self.start_perf)
+
+    def stop_recording(self):
+        # Returns False if there was no recording to stop
+        with self.lock:
+            if not self.recording:
+                return False
+            self.recording = False
+            self.stop_perf = time.perf_counter()
+            self.sync_driver.send(b'L')  # Set Arduino to low after stopping recording
+        self.timestamps.close()
+        self.frame_log.close()
+        _, records = read_frame_log(self.frame_log.filename)
+        frame_times = records['host_time']
+        self.report_rate(frame_times)
+        # The encoders drain their queues here, tick() keeps running meanwhile
+        for writer in self.writers:
+            stats = writer.release()
+            if stats['bytes_per_s'] is None:
+                print(f"Writer process for {writer.filename} failed{': ' + stats['error'] if 'error' in stats else ''}, "
+                      f"the file is probably incomplete")
+                continue
+            print(f"Writer backend {stats['backend']}: {stats['bytes_per_s'] / 1e6:.2f} MB/s, "
+                  f"{stats['encode_ms_mean']:.2f} ms/frame, {stats['frames_dropped']} frames dropped")
+            # Replace the nominal 1/fps sample durations in the mp4 with the measured frame times
+            if writer.filename.endswith('.mp4'):
+                segments = stats.get('segments') or [{'file': os.path.basename(writer.filename), 'first_frame': 0,
+                                                       'n_frames': len(frame_times)}]
+                for segment in segments:
+                    first = segment['first_frame']
+                    path = os.path.join(os.path.dirname(writer.filename), segment['file'])
+                    if not embed_mp4_timestamps(path, frame_times[first:first + segment['n_frames']]):
+                        print(f"Could not embed frame timestamps in {path}, see the _eyeTimes1.bin index")
+        if not self.sync_driver.wait_idle():
+            print('Sync commands still pending on the serial port, the sync event log is incomplete')
+        self.frame_data['sync_events'] = self.sync_event_columns(self.sync_driver.take_events())
+        self.frame_data['integrity'] = self.integrity.snapshot()
+        self.report_integrity()
+        self.report_profile()
+        self.save_frame_data(records)
+        del frame_times, records  # Release the memory map of the log
+        self.experiment_id = None
+        return True
+
+    def report_rate(self, frame_times):
+        achieved = (len(frame_times) - 1) / (frame_times[-1] - frame_times[0]) if len(frame_times) > 1 else 0.0
+        self.frame_data['achieved_fps'] = achieved
+        self.frame_data['missed_deadlines'] = self.scheduler.missed_deadlines - self.missed_at_start
+        print(f"Recorded {len(frame_times)} frames at {achieved:.3f} fps (target {self.target_fps:.3f}), "
+              f"{self.frame_data['missed_deadlines']} missed deadlines")
+
+    def report_profile(self):
+        profile = self.profiler.summary(since=self.profile_start)
+        print('Stage times during the recording:\n' + format_summary(profile))
+        if self.save_profile:
+            with open(sidecar_filename(self.final_filename, '_eyeProfile1.json'), 'w') as f:
+                json.dump({'target_interval_ms': 1000 / self.target_fps, 'stages': profile}, f, indent=2)
+
+    def report_integrity(self):
+        counters = self.frame_data['integrity']
+        problems = [f"{name} {counts}" for name, counts in counters.items() if any(counts)]
+        if problems:
+            print(f"Frame integrity per camera {self.camera_ids}: {', '.join(problems)}")
+
+    def stats_snapshot(self):
+        # Live acquisition numbers for the overlay and for status queries, cheap to call often
+        with self.lock:
+            snapshot = self.interval_stats.snapshot()
+            snapshot.update({'recording': self.recording,
+                             'experiment_id': self.experiment_id,
+                             'frame_count': self.frame_count,
+                             'fps': self.fps,
+                             'writer_dropped_frames': sum(writer.frames_dropped for writer in self.writers)
+                             if self.recording else 0,
+                             'writer_failed': self.recording and any(writer.failed for writer in self.writers),
+                             'missed_deadlines': self.scheduler.missed_deadlines,
+                             'tick_errors': self.scheduler.callback_errors,
+                             'last_tick_error': self.scheduler.last_error,
+                             'start_time': self.start_perf,
+                             'first_frame_time': self.first_frame_time,
+                             'integrity': self.integrity.snapshot()})
+        return snapshot
+
+    def handle_command(self, message):
+        # Returns a dict for the command's acknowledgement, times are on the perf_counter clock
+        # GOGO takes an optional start time: GOGO*<experiment_id>*<perf_counter time>
+        command = message[:4]
+        experiment_id, _, start_text = message[5:].partition('*')
+        if command == "STOP":
+            if not self.stop_recording():
+                return {'ok': False, 'error': 'not recording'}
+            return {'stop_time': self.stop_perf, 'frame_count': self.frame_count}
+        elif command == "GOGO":
+            # Checked before anything happens, a malformed GOGO leaves the current recording running
+            if not EXPERIMENT_ID.fullmatch(experiment_id):
+                return {'ok': False, 'error': f'experiment id {experiment_id!r} is not <yyyy-mm-dd>_<nn>_<animal>'}
+            try:
+                start_at = float(start_text) if start_text else None
+            except ValueError:
+                start_at = math.nan
+            if start_at is not None and not math.isfinite(start_at):
+                return {'ok': False, 'error': f'start time {start_text!r} is not a number'}
+            self.stop_recording()  # Close any recording still running before starting the next
+            print(f"[DEBUG] UDP GOGO received: t=0.000s, experiment_id={experiment_id}")
+            save_dir = session_directory(self.data_root, experiment_id)
+            os.makedirs(save_dir, exist_ok=True)
+            filename = os.path.join(save_dir, f"{experiment_id}_eye1.mp4")
+            self.start_recording(filename, start_at=start_at)
+            self.experiment_id = experiment_id
+            return {'experiment_id': experiment_id, 'start_time': self.start_perf,
+                    'late': start_at is not None and self.start_perf > start_at,
+                    'filename': self.final_filename}
+        return None
+
+    def sync_event_columns(self, events):
+        # Serial commands of the recording with times relative to the recording start, like the
+        # frame times. write_end is the best host estimate of the output edge.
+        return {'frame_index': events['frame_index'].tolist(),
+                'command': events['command'].astype(str).tolist(),
+                'queued_time': (events['queued_time'] - self.start_perf).tolist(),
+                'write_start': (events['write_start'] - self.start_perf).tolist(),
+                'write_end': (events['write_end'] - self.start_perf).tolist()}
+
+    def save_frame_data(self, records):
+        if self.final_filename:
+            # Session summary, the per-frame data is in the _eyeFrames1.bin log
+            with open(sidecar_filename(self.final_filename, '_eyeMeta1.json'), 'w') as f:
+                json.dump(self.frame_data, f, indent=2)
+            if self.save_pickle:
+                # Legacy export with per-frame lists, as read by existing analysis scripts
+                frame_data = dict(self.frame_data,
+                                  frame_times=records['host_time'].tolist(),
+                                  grab_times=records['grab_times'].tolist(),
+                                  sync=records['sync'].tolist())
+                with open(sidecar_filename(self.final_filename, '_eyeMeta1.pickle'), 'wb') as f:
+                    pickle.dump(frame_data, f)
+            # Queue depth, dropped frame and encoder underrun counters of each writer process
+            with open(sidecar_filename(self.final_filename, '_eyeWriter1.json'), 'w') as f:
+                json.dump({os.path.basename(writer.filename): writer.stats for writer in self.writers}, f, indent=2)
+
+    def close(self):
+        self.scheduler.stop()
+        self.capture_engine.stop()
+        for capture in self.captures:
+            capture.release()
+        self.stop_recording()
+        self.sync_driver.stop()
+        if hasattr(self.arduino, 'close'):
+            self.arduino.close()
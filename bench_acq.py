@@ -0,0 +1,85 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from acquisition import Acquisition
+from config import DISP_HEIGHT, DISP_WIDTH
+from frame_log import read_frame_log
+from frame_sources import SyntheticSource
+from sync_driver import LoopbackSerial
+from writer_backends import BACKENDS
+
+
+def parse_size(text):
+    width, height = (int(v) for v in text.lower().split('x'))
+    return width, height
+
+
+def bench_one(n_cameras, save_size, source_size, fps, duration, out_dir, backend, multi_stream):
+    captures = [SyntheticSource(source_size[0], source_size[1], fps, seed=i) for i in range(n_cameras)]
+    acq = Acquisition(captures, out_dir, fps, save_size, (DISP_WIDTH, DISP_HEIGHT), arduino=LoopbackSerial(),
+                      backend=backend, multi_stream=multi_stream)
+    time.sleep(0.5)  # Let the reader threads deliver their first frames
+
+    acq.start_recording(os.path.join(out_dir, f'bench_{n_cameras}_{save_size[0]}x{save_size[1]}_eye1.mp4'))
+    reader_cpu0 = [s['cpu_time'] for s in acq.capture_engine.stats()]
+    t0 = os.times()
+    acq.start()
+    time.sleep(duration)
+    acq.scheduler.stop()
+    reader_cpu = [s['cpu_time'] - c for s, c in zip(acq.capture_engine.stats(), reader_cpu0)]
+    acq.stop_recording()  # Waits for the encoder so its CPU time shows up in the children counters
+    t1 = os.times()
+    acq.close()
+
+    frame_times = np.asarray(read_frame_log(acq.frame_log.filename)[1]['host_time'])
+    intervals = np.diff(frame_times) * 1000
+    cpu = (t1.user - t0.user) + (t1.system - t0.system) + (t1.children_user - t0.children_user) \
+        + (t1.children_system - t0.children_system)
+    return {
+        'fps': (len(frame_times) - 1) / (frame_times[-1] - frame_times[0]),
+        'p50': np.percentile(intervals, 50),
+        'p95': np.percentile(intervals, 95),
+        'p99': np.percentile(intervals, 99),
+        'max': intervals.max(),
+        'cpu_per_camera': 100 * cpu / duration / n_cameras,
+        'reader_cpu_per_camera': 100 * np.mean(reader_cpu) / duration,
+        'missed': acq.frame_data['missed_deadlines'],
+        'dropped': acq.writers[0].stats['frames_dropped'],
+        'mb_per_s': sum(w.stats['bytes_per_s'] or 0 for w in acq.writers) / 1e6,
+        'encode_ms': np.mean([w.stats['encode_ms_mean'] or 0 for w in acq.writers]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sustained throughput of the acquisition loop with synthetic cameras')
+    parser.add_argument('--cameras', default='1,2,3,4,5,6,7,8', help='comma separated camera counts')
+    parser.add_argument('--save-sizes', default='744x480,372x240', help='comma separated WxH save sizes')
+    parser.add_argument('--source-size', default='640x480', help='WxH of the synthetic camera frames')
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--backend', default='mp4v', choices=sorted(BACKENDS))
+    parser.add_argument('--multi-stream', action='store_true', help='one file and writer process per camera')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds recorded per configuration')
+    args = parser.parse_args()
+
+    source_size = parse_size(args.source_size)
+    out_dir = tempfile.mkdtemp(prefix='py_eye_bench_')
+    print(f'{"cams":>4} {"save size":>10} {"fps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8} '
+          f'{"CPU%/cam":>9} {"reader%/cam":>11} {"missed":>7} {"dropped":>8} {"MB/s":>7} {"enc ms":>7}')
+    try:
+        for save_size in (parse_size(s) for s in args.save_sizes.split(',')):
+            for n_cameras in (int(n) for n in args.cameras.split(',')):
+                r = bench_one(n_cameras, save_size, source_size, args.fps, args.duration, out_dir, args.backend,
+                              args.multi_stream)
+                print(f'{n_cameras:>4} {save_size[0]:>5}x{save_size[1]:<4} {r["fps"]:>8.3f} {r["p50"]:>8.2f} '
+                      f'{r["p95"]:>8.2f} {r["p99"]:>8.2f} {r["max"]:>8.2f} {r["cpu_per_camera"]:>9.1f} '
+                      f'{r["reader_cpu_per_camera"]:>11.1f} {r["missed"]:>7} {r["dropped"]:>8} {r["mb_per_s"]:>7.2f} '
+                      f'{r["encode_ms"]:>7.2f}')
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from config import DISP_HEIGHT, DISP_WIDTH, SAVE_HEIGHT, SAVE_WIDTH
+from frame_composer import FrameComposer
+
+
+def compose_legacy(frames, n_slots):
+    # The per-frame pipeline update_frame used before FrameComposer
+    frames_disp = []
+    frames_save = []
+    for frame in frames:
+        resized_frame_disp = cv2.resize(frame, (DISP_WIDTH, DISP_HEIGHT))
+        resized_frame_save = cv2.resize(frame, (SAVE_WIDTH, SAVE_HEIGHT))
+        frames_disp.append(cv2.cvtColor(resized_frame_disp, cv2.COLOR_BGR2GRAY))
+        frames_save.append(cv2.cvtColor(resized_frame_save, cv2.COLOR_BGR2GRAY))
+    for _ in range(n_slots - len(frames_disp)):
+        frames_disp.append(np.zeros((DISP_HEIGHT, DISP_WIDTH), dtype=np.uint8))
+        frames_save.append(np.zeros((SAVE_HEIGHT, SAVE_WIDTH), dtype=np.uint8))
+    combined_frame_display = np.vstack(frames_disp)
+    combined_frame_save = np.hstack(frames_save)
+    display_frame = cv2.cvtColor(combined_frame_display, cv2.COLOR_GRAY2BGR)
+    return combined_frame_save, display_frame
+
+
+def make_composer_step(n_slots):
+    composer = FrameComposer(n_slots, (SAVE_WIDTH, SAVE_HEIGHT), (DISP_WIDTH, DISP_HEIGHT))
+
+    def step(frames, n_slots):
+        combined_frame_save, _ = composer.compose(frames)
+        return combined_frame_save, composer.display_bgr()
+    return step
+
+
+def measure(step, frames, n_slots, n_frames):
+    for _ in range(10):  # Warm up caches and lazily allocated buffers
+        step(frames, n_slots)
+
+    t0 = time.perf_counter()
+    for _ in range(n_frames):
+        step(frames, n_slots)
+    frame_ms = 1000 * (time.perf_counter() - t0) / n_frames
+
+    # Allocations are counted separately because tracing slows the loop down
+    tracemalloc.start()
+    allocated = 0
+    for _ in range(n_frames):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        step(frames, n_slots)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+    tracemalloc.stop()
+    return frame_ms, allocated / n_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-frame cost of composing the save and display frames')
+    parser.add_argument('--cameras', type=int, default=3)
+    parser.add_argument('--slots', type=int, default=3)
+    parser.add_argument('--width', type=int, default=640, help='camera frame width')
+    parser.add_argument('--height', type=int, default=480, help='camera frame height')
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8) for _ in range(args.cameras)]
+    n_slots = max(args.slots, args.cameras)
+
+    print(f'{args.cameras} cameras at {args.width}x{args.height}, {n_slots} slots, {args.frames} frames')
+    print(f'{"pipeline":<10} {"ms/frame":>10} {"KiB allocated/frame":>22}')
+    for name, step in [('legacy', compose_legacy), ('composer', make_composer_step(n_slots))]:
+        frame_ms, allocated = measure(step, frames, n_slots, args.frames)
+        print(f'{name:<10} {frame_ms:>10.3f} {allocated / 1024:>22.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import startup as startup_module
+from acquisition import Acquisition
+from camera_settings import negotiate
+from config import DISP_HEIGHT, DISP_WIDTH, SAVE_HEIGHT, SAVE_WIDTH
+from control_server import ControlServer
+from frame_sources import SyntheticSource
+from startup import Startup
+from sync_driver import LoopbackSerial
+
+# Time to ready with fake devices that take as long to open as real ones: DirectShow cameras
+# (about a second or two each) and an Arduino, whose serial open waits for its reset. A client
+# sends GOGO right after launch and PINGs until the control server answers. 'sequential' is the
+# old path (devices one after another, control server last), 'parallel' the startup.py path.
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def client(port, t0, gogo_at, timeout, results):
+    # Records when the first PING is answered and what happens to a GOGO sent gogo_at after t0
+    ping = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    ping.settimeout(0.02)
+    gogo = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sent_gogo = False
+    while time.perf_counter() - t0 < timeout:
+        if not sent_gogo and time.perf_counter() - t0 >= gogo_at:
+            gogo.sendto(b'GOGO*2026-01-01_01_BENCH', ('127.0.0.1', port))
+            sent_gogo = True
+        if 'listening_s' not in results:
+            try:
+                ping.sendto(b'PING', ('127.0.0.1', port))
+                ping.recvfrom(65536)
+                results['listening_s'] = time.perf_counter() - t0
+            except OSError:  # Timeout, or connection refused before the server binds
+                time.sleep(0.01)
+        elif sent_gogo:
+            break
+    gogo.settimeout(max(timeout - (time.perf_counter() - t0), 0.01))
+    try:
+        ack = json.loads(gogo.recvfrom(65536)[0])
+        results['gogo'] = ack
+    except OSError:
+        results['gogo'] = None
+    ping.close()
+    gogo.close()
+
+
+def run(mode, n_cameras, camera_delay, serial_delay, hung, data_root, fps):
+    port = free_port()
+    results = {}
+    t0 = time.perf_counter()
+    client_thread = threading.Thread(target=client, args=(port, t0, 0.05, 30.0, results), daemon=True)
+    client_thread.start()
+
+    def open_camera(cam):
+        time.sleep(60.0 if cam < hung else camera_delay)
+        return SyntheticSource(320, 240, fps, seed=cam)
+
+    def open_serial():
+        time.sleep(serial_delay)
+        return LoopbackSerial()
+
+    def build(captures, arduino, camera_info=None):
+        acq = Acquisition(captures, data_root, fps, (SAVE_WIDTH, SAVE_HEIGHT), (DISP_WIDTH, DISP_HEIGHT),
+                          arduino=arduino, save_pickle=False, camera_info=camera_info)
+        acq.start()
+        return acq
+
+    cameras = list(range(n_cameras))
+    if mode == 'sequential':
+        captures = [open_camera(cam) for cam in cameras]
+        acq = build(captures, open_serial())
+        control_server = ControlServer(acq, port, host='127.0.0.1')
+        control_server.start()
+        ready_s = time.perf_counter() - t0
+    else:
+        startup = Startup(t0)
+        control_server = ControlServer(None, port, host='127.0.0.1', startup=startup)
+        control_server.start()
+        acq = startup.run(cameras, open_camera, open_serial, build, control_server,
+                          configure=lambda position, capture: negotiate(capture, None, fps))
+        ready_s = startup.phases['ready']
+    client_thread.join()
+    time.sleep(0.5)  # Record a few frames before stopping
+    if acq.recording:
+        acq.stop_recording()
+    control_server.stop()
+    acq.close()
+    ack = results.get('gogo')
+    return {'listening_s': results.get('listening_s'), 'ready_s': ready_s,
+            'recording_s': ack['start_time'] - t0 if ack and ack.get('ok') else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time to ready of the acquisition with fake devices')
+    parser.add_argument('--cameras', type=int, default=3)
+    parser.add_argument('--camera-delay', type=float, default=1.5, help='seconds to open each camera')
+    parser.add_argument('--serial-delay', type=float, default=2.0, help='seconds to open the serial port')
+    parser.add_argument('--hung', type=int, default=0, help='number of cameras whose open never returns')
+    parser.add_argument('--timeout', type=float, default=startup_module.CAMERA_OPEN_TIMEOUT,
+                        help='camera open timeout of the parallel path')
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--modes', default='sequential,parallel')
+    args = parser.parse_args()
+
+    startup_module.CAMERA_OPEN_TIMEOUT = args.timeout
+    data_root = tempfile.mkdtemp(prefix='py_eye_bench_startup_')
+    print(f'{"mode":>10} {"listening s":>12} {"ready s":>8} {"early GOGO recording at s":>26}')
+    try:
+        for mode in args.modes.split(','):
+            if mode == 'sequential' and args.hung:
+                print(f'{mode:>10} {"never ready, a camera open hangs":>48}')
+                continue
+            r = run(mode, args.cameras, args.camera_delay, args.serial_delay, args.hung, data_root, args.fps)
+            listening = f"{r['listening_s']:.3f}" if r['listening_s'] is not None else '-'
+            recording = f"{r['recording_s']:.3f}" if r['recording_s'] is not None else 'lost'
+            print(f"{mode:>10} {listening:>12} {r['ready_s']:>8.3f} {recording:>26}")
+    finally:
+        shutil.rmtree(data_root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import cv2
+import numpy as np
+
+# Camera negotiation: asks the driver for a resolution, pixel format, exposure, gain and buffer
+# size through CAP_PROP_*, reads back what was granted (drivers silently pick the nearest mode
+# they support) and grabs one frame to see what actually arrives. With y_plane the camera's raw
+# YUY2 buffer is used and its luma plane is the gray frame, which skips the colour decode and
+# the gray conversion on every frame.
+
+YUV_FOURCCS = ('YUY2', 'YUYV')  # Formats whose raw buffer interleaves Y with chroma (Y0 U Y1 V)
+
+
+class CameraSettings:
+    # What to request from one camera, None leaves the driver default. exposure, gain and
+    # auto_exposure are passed to the driver as they are, their units depend on the backend
+    # (DirectShow exposure is log2 seconds, e.g. -6 for 1/64 s).
+    def __init__(self, width=None, height=None, fourcc=None, exposure=None, gain=None, auto_exposure=None,
+                 buffer_size=None, y_plane=False):
+        self.width = width
+        self.height = height
+        self.fourcc = fourcc
+        self.exposure = exposure
+        self.gain = gain
+        self.auto_exposure = auto_exposure
+        self.buffer_size = buffer_size
+        self.y_plane = y_plane
+
+    def describe(self):
+        return {'width': self.width, 'height': self.height, 'fourcc': self.fourcc, 'exposure': self.exposure,
+                'gain': self.gain, 'auto_exposure': self.auto_exposure, 'buffer_size': self.buffer_size,
+                'y_plane': self.y_plane}
+
+
+def parse_camera_settings(spec):
+    # 'CAM:width=640,height=480,fourcc=YUY2,y_plane=1' -> (CAM, CameraSettings)
+    cam, _, params = spec.partition(':')
+    values = {}
+    for item in filter(None, params.split(',')):
+        key, _, value = item.partition('=')
+        if key == 'fourcc':
+            values[key] = value
+        elif key == 'y_plane':
+            values[key] = value not in ('0', 'false', 'no')
+        else:
+            values[key] = float(value) if key in ('exposure', 'gain', 'auto_exposure') else int(value)
+    return int(cam), CameraSettings(**values)
+
+
+def fourcc_string(code):
+    code = int(code)
+    return ''.join(chr((code >> 8 * i) & 0xFF) for i in range(4)).strip('\x00') if code > 0 else ''
+
+
+def y_plane(raw, width, height):
+    # Luma view of a raw YUY2 buffer, which backends return as (h, w, 2) or as flat bytes.
+    # None if raw does not look like YUY2 at that size.
+    if raw is None:
+        return None
+    if raw.ndim == 3 and raw.shape == (height, width, 2):
+        return raw[:, :, 0]
+    if raw.size == width * height * 2 and raw.flags.c_contiguous:
+        return raw.reshape(height, width, 2)[:, :, 0]
+    return None
+
+
+class YPlaneCapture:
+    # Wraps a capture delivering raw YUY2 and retrieves its luma as a contiguous gray frame,
+    # copied straight into the reader's ring slot
+    def __init__(self, capture, width, height):
+        self.capture = capture
+        self.width = width
+        self.height = height
+        self.raw = None
+
+    def grab(self):
+        return self.capture.grab()
+
+    def retrieve(self, image=None, flag=0):
+        ret, raw = self.capture.retrieve(self.raw)
+        luma = y_plane(raw, self.width, self.height) if ret else None
+        if luma is None:
+            return False, None
+        self.raw = raw
+        if image is None or image.shape != luma.shape:
+            image = np.empty(luma.shape, dtype=np.uint8)
+        np.copyto(image, luma)
+        return True, image
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def __getattr__(self, name):
+        # set, get, isOpened and release go to the wrapped capture
+        return getattr(self.capture, name)
+
+
+def negotiate(capture, settings, fps):
+    # Requests settings (a CameraSettings or None) and fps from capture. Returns (capture to
+    # read frames from, dict of requested and granted settings for the session metadata).
+    settings = settings or CameraSettings()
+    # DirectShow and V4L2 apply the pixel format before the size, and the size before the rate
+    if settings.fourcc:
+        capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*settings.fourcc))
+    if settings.width and settings.height:
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, settings.width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, settings.height)
+    capture.set(cv2.CAP_PROP_FPS, fps)
+    if settings.buffer_size is not None:
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, settings.buffer_size)
+    if settings.auto_exposure is not None:
+        capture.set(cv2.CAP_PROP_AUTO_EXPOSURE, settings.auto_exposure)
+    if settings.exposure is not None:
+        capture.set(cv2.CAP_PROP_EXPOSURE, settings.exposure)
+    if settings.gain is not None:
+        capture.set(cv2.CAP_PROP_GAIN, settings.gain)
+
+    granted = {'width': int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+               'height': int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+               'fourcc': fourcc_string(capture.get(cv2.CAP_PROP_FOURCC)),
+               'fps': float(capture.get(cv2.CAP_PROP_FPS)),
+               'exposure': float(capture.get(cv2.CAP_PROP_EXPOSURE)),
+               'gain': float(capture.get(cv2.CAP_PROP_GAIN)),
+               'buffer_size': int(capture.get(cv2.CAP_PROP_BUFFERSIZE)),
+               'y_plane': False}
+
+    # The luma plane is only used when the raw buffer really is YUY2 at the granted size
+    if settings.y_plane and granted['fourcc'] in YUV_FOURCCS + ('',) and capture.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+        ret, raw = capture.read()
+        if ret and y_plane(raw, granted['width'], granted['height']) is not None:
+            capture = YPlaneCapture(capture, granted['width'], granted['height'])
+            granted['y_plane'] = True
+        else:
+            capture.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+    ret, frame = capture.read()
+    granted['frame_shape'] = list(frame.shape) if ret else None
+    if ret:
+        # Some backends report 0 for the size until streaming starts
+        granted['height'], granted['width'] = frame.shape[:2]
+    return capture, {'requested': settings.describe(), 'granted': granted}
+
+
+def conversion_path(frame_shape, save_size, roi=None, y_plane=False):
+    # Per-frame work between the camera frame and the saved frame, for the startup report
+    if frame_shape is None:
+        return 'no frames'
+    height, width = frame_shape[:2]
+    if roi is not None:
+        width, height = min(roi[2], width - roi[0]), min(roi[3], height - roi[1])
+    steps = ['y plane' if y_plane else 'gray' if len(frame_shape) == 2 else 'bgr->gray']
+    if roi is not None:
+        steps.append(f'roi {width}x{height}')
+    steps.append('copy' if (width, height) == tuple(save_size) else f'resize {width}x{height}->{save_size[0]}x{save_size[1]}')
+    return ', '.join(steps)
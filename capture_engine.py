@@ -0,0 +1,170 @@
+import threading
+import time
+import zlib
+import numpy as np
+
+# Number of frames kept per camera. Only the newest frame is normally used, the
+# extra slots give the consumer time to read a frame before it is overwritten. Nothing
+# locks a slot while it is read: a consumer that falls RING_SIZE frames behind can see it
+# rewritten, so it checks is_valid() once it is done with the frame (see latest_valid()).
+RING_SIZE = 8
+# Every SIGNATURE_STEP-th pixel in both directions goes into the checksum used to spot a camera
+# delivering the same image twice
+SIGNATURE_STEP = 16
+
+
+class FrameRingBuffer:
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        self.frames = None  # Allocated once the first frame tells us the shape
+        self.grab_times = np.zeros(size, dtype=np.float64)
+        self.seqs = np.full(size, -1, dtype=np.int64)
+        self.duplicate = np.zeros(size, dtype=bool)  # Same content as the frame grabbed before it
+        self.latest_seq = -1
+        self.writing_seq = -1  # Frame the reader is copying into its slot, see claim()
+        self.lock = threading.Lock()
+
+    def allocate(self, shape, dtype):
+        self.frames = np.zeros((self.size,) + tuple(shape), dtype=dtype)
+
+    def slot_for(self, seq):
+        return self.frames[seq % self.size]
+
+    def claim(self, seq):
+        # Called by the reader before it writes the slot of seq, which still holds seq - size
+        with self.lock:
+            self.writing_seq = seq
+
+    def publish(self, seq, grab_time, duplicate=False):
+        slot = seq % self.size
+        with self.lock:
+            self.grab_times[slot] = grab_time
+            self.duplicate[slot] = duplicate
+            self.seqs[slot] = seq
+            self.latest_seq = seq
+
+    def latest(self):
+        # Returns (seq, grab_time, frame view) or (-1, nan, None) before the first frame
+        with self.lock:
+            seq = self.latest_seq
+            if seq < 0:
+                return -1, float('nan'), None
+            slot = seq % self.size
+            return seq, float(self.grab_times[slot]), self.frames[slot]
+
+    def is_valid(self, seq):
+        # False once the reader has wrapped around and started to reuse the slot of seq. A view
+        # of the slot read before this returns True was not overwritten while it was read.
+        with self.lock:
+            return bool(self.seqs[seq % self.size] == seq and self.writing_seq < seq + self.size)
+
+    def is_duplicate(self, seq):
+        with self.lock:
+            return bool(self.seqs[seq % self.size] == seq and self.duplicate[seq % self.size])
+
+
+class CameraReader(threading.Thread):
+    def __init__(self, capture, index, ring_size=RING_SIZE, profiler=None):
+        super().__init__(daemon=True, name=f'CameraReader-{index}')
+        self.capture = capture
+        self.index = index
+        self.profiler = profiler  # Times retrieve (decode and copy) per camera, see profiling.py
+        self.stage = f'retrieve_cam{index}'
+        self.ring = FrameRingBuffer(ring_size)
+        self.running = True
+        self.frames_grabbed = 0
+        self.grab_failures = 0
+        self.duplicate_frames = 0
+        self.cpu_time = 0.0
+        self.signature_buffer = None
+        self.last_signature = None
+
+    def run(self):
+        seq = 0
+        cpu_start = time.thread_time()
+        while self.running:
+            # grab() returns as soon as the driver hands over a buffer, so timestamping
+            # straight after it is the closest we get to the exposure time on DirectShow
+            if not self.capture.grab():
+                self.grab_failures += 1
+                time.sleep(0.001)
+                continue
+            grab_time = time.perf_counter()
+            self.ring.claim(seq)
+            if self.ring.frames is None:
+                ret, frame = self.capture.retrieve()
+                if not ret:
+                    self.grab_failures += 1
+                    continue
+                self.ring.allocate(frame.shape, frame.dtype)
+                np.copyto(self.ring.slot_for(seq), frame)
+            else:
+                slot = self.ring.slot_for(seq)
+                ret, frame = self.capture.retrieve(slot)
+                if not ret:
+                    self.grab_failures += 1
+                    continue
+                if frame is not slot:
+                    np.copyto(slot, frame)
+            if self.profiler is not None:
+                self.profiler.add(self.stage, time.perf_counter() - grab_time)
+            signature = self._signature(self.ring.slot_for(seq))
+            duplicate = signature == self.last_signature
+            self.last_signature = signature
+            if duplicate:
+                self.duplicate_frames += 1
+            self.ring.publish(seq, grab_time, duplicate)
+            seq += 1
+            self.frames_grabbed = seq
+            self.cpu_time = time.thread_time() - cpu_start
+
+    def _signature(self, frame):
+        # CRC of a sparse pixel grid, a few microseconds per frame. Two grabs with the same
+        # signature are the same buffer delivered twice (sensor noise makes real frames differ).
+        subsample = frame[::SIGNATURE_STEP, ::SIGNATURE_STEP]
+        if self.signature_buffer is None or self.signature_buffer.shape != subsample.shape:
+            self.signature_buffer = np.empty(subsample.shape, dtype=frame.dtype)
+        np.copyto(self.signature_buffer, subsample)
+        return zlib.crc32(self.signature_buffer)
+
+    def stop(self):
+        self.running = False
+
+
+class CaptureEngine:
+    def __init__(self, captures, ring_size=RING_SIZE, profiler=None):
+        self.captures = captures
+        self.readers = [CameraReader(capture, i, ring_size, profiler) for i, capture in enumerate(captures)]
+
+    def start(self):
+        for reader in self.readers:
+            reader.start()
+
+    def stop(self):
+        for reader in self.readers:
+            reader.stop()
+        for reader in self.readers:
+            reader.join(timeout=2.0)
+
+    def latest_set(self):
+        # Newest frame of every camera. Cameras that have not delivered a frame yet
+        # are returned as None so the caller can pad them.
+        frames, grab_times, seqs = [], [], []
+        for reader in self.readers:
+            seq, grab_time, frame = reader.ring.latest()
+            frames.append(frame)
+            grab_times.append(grab_time)
+            seqs.append(seq)
+        return frames, grab_times, seqs
+
+    def latest_valid(self, seqs):
+        # Call after using the frames of latest_set(). False for each camera whose slot the
+        # reader started to overwrite meanwhile, i.e. the frame that was used may be torn.
+        # The preview does not check, a torn preview frame is redrawn on the next refresh.
+        return [seq < 0 or reader.ring.is_valid(seq) for reader, seq in zip(self.readers, seqs)]
+
+    def stats(self):
+        return [{'frames_grabbed': r.frames_grabbed,
+                 'grab_failures': r.grab_failures,
+                 'duplicate_frames': r.duplicate_frames,
+                 'cpu_time': r.cpu_time} for r in self.readers]
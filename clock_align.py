@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+import pickle
+import time
+import numpy as np
+from acquisition import sidecar_filename
+from frame_log import SYNC_TOGGLED, read_frame_log_arrays
+
+# Offline alignment of recorded frame times to an external DAQ clock using the Arduino sync
+# output. The host send times of the sync commands are matched to the edge times the DAQ
+# recorded, then a piecewise-linear host -> DAQ mapping is fitted by least squares and applied
+# to every frame time. Matching starts from a short window at the beginning of the recording
+# (any first-edge offset is tried, so missing or extra edges at the start do not matter) and
+# grows the window while refitting, so clock drift over multi-hour sessions is followed.
+# Host edges without a DAQ edge nearby and DAQ edges without a host command are left out.
+
+KNOT_SPACING = 60.0  # Seconds of host time between knots of the piecewise-linear mapping
+MATCH_TOLERANCE = 0.25  # Largest host/DAQ mismatch accepted while matching, as a fraction of the edge period
+START_EDGES = 20  # Edges at the start of both series tried as the first matching pair
+CANDIDATE_EDGES = 48 * START_EDGES  # Host edges all candidate alignments are tracked over
+CANDIDATE_RMS = 2.0  # Candidates with a residual RMS within this factor of the best one are tracked to the end
+OUTLIER_MADS = 6.0  # Matches with residuals beyond this many (scaled) MADs are dropped before the final fit
+MIN_OUTLIER_RESIDUAL = 0.002  # Seconds, residuals below this are never treated as outliers
+SMOOTHING = 1e-3  # Weight of the second difference penalty that keeps empty segments defined
+
+
+def _match(pred, daq_edges, tol):
+    # Nearest DAQ edge of every predicted edge time within tol. Each DAQ edge is used at most
+    # once, by the closest prediction. Returns (host indices, DAQ indices).
+    right = np.clip(np.searchsorted(daq_edges, pred), 1, len(daq_edges) - 1)
+    left = right - 1
+    nearest = np.where(np.abs(daq_edges[left] - pred) <= np.abs(daq_edges[right] - pred), left, right)
+    error = np.abs(daq_edges[nearest] - pred)
+    host_idx = np.flatnonzero(error <= tol)
+    daq_idx = nearest[host_idx]
+    # DAQ indices are nearly sorted already, so only the predictions sharing a DAQ edge need
+    # to be ordered by error
+    order = np.argsort(daq_idx, kind='stable')
+    shared = daq_idx[order]
+    dup = np.flatnonzero(shared[1:] == shared[:-1])
+    keep = np.ones(len(order), dtype=bool)
+    if len(dup):
+        runs = np.union1d(dup, dup + 1)
+        runs = runs[np.lexsort((error[host_idx][order][runs], shared[runs]))]
+        keep[runs[1:][shared[runs][1:] == shared[runs][:-1]]] = False
+    keep = np.sort(order[keep])
+    return host_idx[keep], daq_idx[keep]
+
+
+def _candidate_offsets(host_edges, daq_edges, tol, n_start=START_EDGES, window=3 * START_EDGES):
+    # Offsets from every pairing of the first n_start host and DAQ edges that match at least
+    # half of the first `window` host edges, assuming equal clock rates
+    host = host_edges[:window]
+    offsets = np.unique((daq_edges[:n_start, None] - host_edges[None, :n_start]).ravel())
+    pred = host[None, :] + offsets[:, None]
+    right = np.clip(np.searchsorted(daq_edges, pred), 1, len(daq_edges) - 1)
+    error = np.minimum(np.abs(daq_edges[right] - pred), np.abs(daq_edges[right - 1] - pred))
+    count = (error <= tol).sum(axis=1)
+    offsets = offsets[count >= count.max() / 2]
+    # Pairings that describe the same alignment give offsets within tol of each other
+    return offsets[np.append(True, np.diff(offsets) > tol)]
+
+
+def _linear_fit(x, y):
+    # Least squares y = offset + rate * x, x centred for precision
+    x0 = x.mean()
+    rate = np.dot(x - x0, y - y.mean()) / max(np.dot(x - x0, x - x0), 1e-300) if len(x) > 1 else 1.0
+    return y.mean() - rate * x0, rate
+
+
+class ClockMapping:
+    # Host time -> DAQ time: offset + rate * t plus a correction interpolated linearly between
+    # knots. Outside the knots the correction is held, i.e. the global rate extrapolates.
+    def __init__(self, offset, rate, knots, correction):
+        self.offset = offset
+        self.rate = rate
+        self.knots = knots
+        self.correction = correction
+
+    def __call__(self, host_times):
+        host_times = np.asarray(host_times, dtype=np.float64)
+        return self.offset + self.rate * host_times + np.interp(host_times, self.knots, self.correction)
+
+
+def _fit_piecewise(x, y, knot_spacing, smoothing=SMOOTHING):
+    offset, rate = _linear_fit(x, y)
+    residual = y - (offset + rate * x)
+    n_knots = max(int(np.ceil((x.max() - x.min()) / knot_spacing)), 1) + 1
+    knots = x.min() + knot_spacing * np.arange(n_knots)
+    # Each point is a weighted sum of the two knots around it (linear B-splines), which gives
+    # tridiagonal normal equations
+    k = np.minimum(((x - knots[0]) / knot_spacing).astype(np.int64), n_knots - 2) if n_knots > 1 else np.zeros(len(x), np.int64)
+    w = np.clip((x - knots[k]) / knot_spacing, 0.0, 1.0) if n_knots > 1 else np.zeros(len(x))
+    normal = np.zeros((n_knots, n_knots))
+    rhs = np.zeros(n_knots)
+    k1 = np.minimum(k + 1, n_knots - 1)
+    np.add.at(normal, (k, k), (1 - w) ** 2)
+    np.add.at(normal, (k1, k1), w ** 2)
+    np.add.at(normal, (k, k1), w * (1 - w))
+    np.add.at(normal, (k1, k), w * (1 - w))
+    np.add.at(rhs, k, (1 - w) * residual)
+    np.add.at(rhs, k1, w * residual)
+    if n_knots > 2:
+        second_diff = np.diff(np.eye(n_knots), 2, axis=0)
+        normal += smoothing * max(np.trace(normal) / n_knots, 1.0) * second_diff.T @ second_diff
+    normal += 1e-12 * np.eye(n_knots)
+    correction = np.linalg.solve(normal, rhs)
+    return ClockMapping(offset, rate, knots, correction)
+
+
+def _track(host_edges, daq_edges, tol, offset, rate=1.0, window=3 * START_EDGES, last=None):
+    # Matches a growing prefix of the first `last` host edges (all by default), refitting offset
+    # and rate on each step so drift over long sessions stays within the matching tolerance.
+    # Returns (host indices, DAQ indices, offset, rate) of the last step.
+    last = len(host_edges) if last is None else min(last, len(host_edges))
+    while True:
+        window = min(window, last)
+        host_idx, daq_idx = _match(offset + rate * host_edges[:window], daq_edges, tol)
+        if len(host_idx) >= 2:
+            offset, rate = _linear_fit(host_edges[host_idx], daq_edges[daq_idx])
+        if window == last:
+            return host_idx, daq_idx, offset, rate
+        window *= 2
+
+
+def _score(host_edges, daq_edges, tol, host_idx, daq_idx, last=None):
+    # (host edges without a match among the first `last` whose predicted time is within the
+    # DAQ recording, RMS residual of the matches) for a linear fit to the matches. Lower is
+    # better. Edges predicted before the DAQ started or after it stopped do not count, else a
+    # late DAQ start would favour alignments shifted towards it.
+    if len(host_idx) < 2:
+        return last or len(host_edges), np.inf
+    offset, rate = _linear_fit(host_edges[host_idx], daq_edges[daq_idx])
+    pred = offset + rate * host_edges[:last]
+    inside = (pred >= daq_edges[0] - tol) & (pred <= daq_edges[-1] + tol)
+    residual = daq_edges[daq_idx] - (offset + rate * host_edges[host_idx])
+    return int(inside.sum() - inside[host_idx].sum()), float(np.sqrt(np.mean(residual ** 2)))
+
+
+def align_clocks(host_edges, daq_edges, knot_spacing=KNOT_SPACING, tolerance=MATCH_TOLERANCE, start_hint=None):
+    # host_edges: host times of the sync commands (seconds, recording clock), daq_edges: edge
+    # times recorded by the DAQ (seconds, DAQ clock), start_hint: optional approximate DAQ time
+    # of the recording start, used to pick among alignments shifted by whole periods.
+    # Returns (ClockMapping, diagnostics dict).
+    host_edges = np.asarray(host_edges, dtype=np.float64)
+    daq_edges = np.sort(np.asarray(daq_edges, dtype=np.float64))
+    if len(host_edges) < 2 or len(daq_edges) < 2:
+        raise ValueError('Need at least two sync edges on both clocks')
+    tol = tolerance * np.median(np.diff(host_edges))
+
+    # A periodic pulse train also fits shifted by whole periods. Every plausible alignment of
+    # the first edges is tracked over the first CANDIDATE_EDGES host edges. Those with residuals
+    # close to the smallest are tracked through the rest of the session, and the one with the
+    # fewest unmatched edges wins, then the one with the smallest residuals: under a wrong
+    # shift, intervals that differ (dropped frames, scheduler jitter) leave host edges without
+    # a match or residuals of up to the matching tolerance. start_hint (approximate DAQ time of
+    # the recording start, e.g. when the DAQ sent GOGO) settles it for strictly regular trains,
+    # where every alignment is tracked to the end.
+    candidates = _candidate_offsets(host_edges, daq_edges, tol)
+    if start_hint is not None:
+        near = np.abs(candidates - start_hint) <= tol
+        candidates = candidates[near] if near.any() else candidates[[np.argmin(np.abs(candidates - start_hint))]]
+    tracked = []
+    for offset in candidates:
+        host_idx, daq_idx, offset, rate = _track(host_edges, daq_edges, tol, offset, last=CANDIDATE_EDGES)
+        tracked.append((_score(host_edges, daq_edges, tol, host_idx, daq_idx, CANDIDATE_EDGES),
+                        host_idx, daq_idx, offset, rate))
+    # The number of unmatched edges among the first edges depends on where the few missing DAQ
+    # edges fall, so only the residuals decide which alignments go on
+    smallest = min(rms for (_, rms), *_ in tracked)
+    best = None
+    for score, host_idx, daq_idx, offset, rate in tracked:
+        if score[1] > CANDIDATE_RMS * smallest:
+            continue
+        if len(host_edges) > CANDIDATE_EDGES:
+            host_idx, daq_idx, _, _ = _track(host_edges, daq_edges, tol, offset, rate, window=2 * CANDIDATE_EDGES)
+            score = _score(host_edges, daq_edges, tol, host_idx, daq_idx)
+        if best is None or score < best[0]:
+            best = (score, host_idx, daq_idx)
+    _, host_idx, daq_idx = best
+
+    # Piecewise fit, drop outliers, then rematch against the piecewise model and refit
+    mapping = _fit_piecewise(host_edges[host_idx], daq_edges[daq_idx], knot_spacing)
+    for _ in range(2):
+        host_idx, daq_idx = _match(mapping(host_edges), daq_edges, tol)
+        residual = daq_edges[daq_idx] - mapping(host_edges[host_idx])
+        mad = 1.4826 * np.median(np.abs(residual - np.median(residual)))
+        good = np.abs(residual) <= max(OUTLIER_MADS * mad, MIN_OUTLIER_RESIDUAL)
+        host_idx, daq_idx = host_idx[good], daq_idx[good]
+        mapping = _fit_piecewise(host_edges[host_idx], daq_edges[daq_idx], knot_spacing)
+
+    residual = daq_edges[daq_idx] - mapping(host_edges[host_idx])
+    linear_residual = daq_edges[daq_idx] - (mapping.offset + mapping.rate * host_edges[host_idx])
+    unmatched = np.ones(len(host_edges), dtype=bool)
+    unmatched[host_idx] = False
+    missed = np.flatnonzero(unmatched)
+    diagnostics = {'n_host_edges': len(host_edges),
+                   'n_daq_edges': len(daq_edges),
+                   'n_matched': len(host_idx),
+                   'missed_host_edges': missed.tolist(),  # Sync commands without a DAQ edge
+                   'n_unmatched_daq_edges': len(daq_edges) - len(daq_idx),
+                   'offset_s': float(mapping(0.0)),  # DAQ time of the recording start
+                   'rate_ppm': 1e6 * (mapping.rate - 1.0),
+                   'residual_rms_ms': 1000 * float(np.sqrt(np.mean(residual ** 2))),
+                   'residual_p99_ms': 1000 * float(np.percentile(np.abs(residual), 99)),
+                   'residual_max_ms': 1000 * float(np.abs(residual).max()),
+                   'linear_residual_rms_ms': 1000 * float(np.sqrt(np.mean(linear_residual ** 2)))}
+    mapping.host_idx = host_idx
+    mapping.daq_idx = daq_idx
+    mapping.residual = residual
+    return mapping, diagnostics
+
+
+def sync_frame_times(frame_times, sync):
+    # Host times of the frames a sync command was sent on, from the legacy pickle or frame log
+    return np.asarray(frame_times, dtype=np.float64)[np.flatnonzero(np.asarray(sync) & SYNC_TOGGLED)]
+
+
+def _video_filename(filename):
+    # Sidecar files name the recording they belong to, e.g. '<id>_eyeMeta1.json' -> '<id>_eye1.mp4'
+    for suffix in ('_eyeMeta1.json', '_eyeMeta1.pickle', '_eyeFrames1.bin', '_eyeTimes1.bin', '_eyeWriter1.json'):
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)] + '_eye1.mp4'
+    return filename
+
+
+def load_session_edges(filename, commands='TH'):
+    # Frame times and sync command times of a recording, given its video file or one of its
+    # sidecar files. The sync send times in _eyeMeta1.json are used when present (only commands
+    # in `commands` make edges: 'T' both polarities, 'H' rising), else the sync frames' times.
+    # Returns (frame_times, host_edges).
+    filename = _video_filename(filename)
+    meta_json = sidecar_filename(filename, '_eyeMeta1.json')
+    frame_log = sidecar_filename(filename, '_eyeFrames1.bin')
+    if os.path.exists(frame_log):
+        records = read_frame_log_arrays(frame_log)
+        frame_times, sync = records['host_time'], records['sync']
+    else:
+        with open(sidecar_filename(filename, '_eyeMeta1.pickle'), 'rb') as f:
+            frame_data = pickle.load(f)
+        frame_times = np.asarray(frame_data['frame_times'], dtype=np.float64)
+        sync = frame_data.get('sync')
+        if sync is None:
+            # Recordings from before the frame log: a toggle on every 100th frame
+            sync = np.zeros(len(frame_times), dtype=np.uint8)
+            sync[99::100] = SYNC_TOGGLED
+    events = None
+    if os.path.exists(meta_json):
+        with open(meta_json) as f:
+            events = json.load(f).get('sync_events')
+    if events:
+        frame_index = np.asarray(events['frame_index'])
+        command = np.asarray(events['command'])
+        use = (frame_index >= 0) & np.isin(command, list(commands))
+        return frame_times, np.asarray(events['write_end'], dtype=np.float64)[use]
+    return frame_times, sync_frame_times(frame_times, sync)
+
+
+def load_daq_edges(filename):
+    # One edge time in seconds per line (text) or a 1-d .npy array
+    if filename.endswith('.npy'):
+        return np.load(filename).astype(np.float64).ravel()
+    return np.loadtxt(filename, dtype=np.float64, ndmin=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Map recorded frame times onto a DAQ clock using the sync edges')
+    parser.add_argument('recording', help='video file or any of its sidecar files (_eyeMeta1.json, _eyeFrames1.bin, ...)')
+    parser.add_argument('daq_edges', help='DAQ edge times in seconds, .npy or text with one time per line')
+    parser.add_argument('--out', help="per-frame DAQ times as .npy (default '<recording>_eyeDaqTimes1.npy')")
+    parser.add_argument('--knot-spacing', type=float, default=KNOT_SPACING)
+    parser.add_argument('--start-hint', type=float,
+                        help='approximate DAQ time of the recording start, resolves whole-period ambiguity')
+    args = parser.parse_args()
+
+    frame_times, host_edges = load_session_edges(args.recording)
+    daq_edges = load_daq_edges(args.daq_edges)
+    t0 = time.perf_counter()
+    mapping, diagnostics = align_clocks(host_edges, daq_edges, args.knot_spacing, start_hint=args.start_hint)
+    daq_times = mapping(frame_times)
+    elapsed = time.perf_counter() - t0
+    out = args.out or sidecar_filename(_video_filename(args.recording), '_eyeDaqTimes1.npy')
+    np.save(out, daq_times)
+    missed = diagnostics.pop('missed_host_edges')
+    for key, value in diagnostics.items():
+        print(f'{key}: {value:.6g}' if isinstance(value, float) else f'{key}: {value}')
+    print(f"missed_host_edges: {len(missed)}{' ' + str(missed[:20]) if missed else ''}")
+    print(f'Aligned {len(frame_times)} frames in {1000 * elapsed:.1f} ms, saved {out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# Configurable variables of the acquisition, used by the Qt window (vid_acq.py) and the
+# headless runner (vid_acq_headless.py, where most can also be overridden on the command line).
+# Change as needed for each rig.
+UDP_LISTEN_PORT = 1813
+DATA_ROOT = 'C://local_repository//'  # Change as needed to your data root
+CAMERAS = [2,1,0]  # List of camera indices to acquire and in what order
+ARDUINO_PORT = 'COM4'  # Change as needed to your Arduino port
+DESIRED_FPS = 30
+PREVIEW_FPS = 10  # Refresh rate of the preview window, independent of DESIRED_FPS
+RECORDING_BACKEND = 'mp4v'  # 'mp4v', 'ffv1' (lossless, needs ffmpeg) or 'raw' (uncompressed, lowest CPU)
+MULTI_STREAM = False  # True writes one file per camera ({experiment_id}_eye1_cam2.mp4, ...)
+SAVE_PICKLE = True  # Also export the frame log as the legacy _eyeMeta1.pickle when recording stops
+SAVE_PROFILE = False  # Save per-stage timing histograms of each recording as _eyeProfile1.json
+METRICS_PORT = 9813  # Prometheus metrics at http://127.0.0.1:9813/metrics, 0 disables them
+SYNC_EVERY_N_FRAMES = 100  # Frames between sync commands to the Arduino, 1 sends one every frame
+SYNC_MODE = 'toggle'  # 'toggle' flips the output each time, 'pulse' sends a one frame high pulse
+SEGMENT_MINUTES = 0  # Start a new file ({experiment_id}_eye1_000.mp4, _001, ...) every N minutes, 0 for one file
+
+# Display size
+DISP_WIDTH = 350
+DISP_HEIGHT = 350
+
+# Save size
+SAVE_WIDTH = 744
+SAVE_HEIGHT = 480
+
+# Optional box (x, y, width, height) in camera pixels per camera index, e.g. {2: (200, 120, 240, 160)}.
+# Only the box is saved, which cuts the pixels sent to the encoder several-fold.
+CAMERA_ROIS = {}
+ROI_SAVE_SIZE = None  # (width, height) saved per camera when CAMERA_ROIS is set, None keeps SAVE_WIDTH x SAVE_HEIGHT
+
+# Optional driver settings per camera index, what was granted is printed at startup and saved in _eyeMeta1.json.
+# e.g. {2: camera_settings.CameraSettings(640, 480, 'YUY2', y_plane=True)} records the luma plane without colour conversion.
+CAMERA_SETTINGS = {}
@@ -0,0 +1,154 @@
+import asyncio
+import concurrent.futures
+import json
+import math
+import threading
+import time
+
+# UDP control server. Commands are ASCII datagrams, every command gets one JSON reply sent
+# back to the sender's address:
+#   GOGO*<experiment_id>  start recording, replies once the writers are open
+#   STOP                  stop recording, replies once the files are closed
+#   STATUS                live acquisition statistics, or the startup progress while starting
+#   PING[*<tag>]          replies immediately, for round trip measurements. The tag is echoed
+#                         as 'tag', so a late reply can be told apart from the reply to the last PING.
+# Every reply has 'state': 'starting' until the devices are open and the acquisition runs, then
+# 'ready' ('failed' if startup failed). A GOGO sent while starting waits for the acquisition.
+# Times in replies are host time.perf_counter() seconds, a monotonic clock. 'received' is when
+# the datagram was read, so start_time - received is the GOGO to recording latency.
+# The server runs an asyncio loop on its own thread. GOGO and STOP run one at a time on a
+# worker thread so PING and STATUS are answered while a recording is being opened or closed.
+
+UDP_LISTEN_PORT = 1813
+MAX_DATAGRAM = 1024
+STARTUP_WAIT = 60.0  # Longest a GOGO or STOP received during startup waits for the acquisition
+
+
+def _json_safe(value):
+    # NaN is not valid JSON, report it as null
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class _ControlProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        received = time.perf_counter()
+        message = data.decode('utf-8', errors='replace').strip()
+        asyncio.ensure_future(self.server.dispatch(message, received, addr, self.transport))
+
+
+class ControlServer:
+    # acquisition may be None at first, so the server can listen while the devices are opened.
+    # attach() hands it over once startup (a startup.Startup) has built it.
+    def __init__(self, acquisition, port=UDP_LISTEN_PORT, host='0.0.0.0', on_command=None, startup=None):
+        self.acq = acquisition
+        self.startup = startup
+        self.attached = threading.Event()
+        if acquisition is not None:
+            self.attached.set()
+        self.port = port
+        self.host = host
+        # Called with (message, reply) after each GOGO or STOP, from the worker thread
+        self.on_command = on_command
+        self.loop = None
+        self.transport = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='ControlCommand')
+        self.commands_handled = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True, name='ControlServer')
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        print(f'Control server listening on UDP port {self.port}')
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.transport, _ = self.loop.run_until_complete(self.loop.create_datagram_endpoint(
+                lambda: _ControlProtocol(self), local_addr=(self.host, self.port)))
+            if self.port == 0:
+                self.port = self.transport.get_extra_info('sockname')[1]
+        except OSError as error:
+            self.error = error
+            self.ready.set()
+            self.loop.close()
+            return
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.transport.close()
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    def attach(self, acquisition):
+        self.acq = acquisition
+        self.attached.set()
+
+    def state(self):
+        if self.acq is not None:
+            return 'ready'
+        return self.startup.state if self.startup is not None else 'starting'
+
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread is not None:
+            self.thread.join()
+        self.executor.shutdown(wait=True)
+
+    async def dispatch(self, message, received, addr, transport):
+        # The command name is matched case-insensitively and passed on upper-cased
+        name, separator, argument = message.partition('*')
+        command = name.upper()
+        message = command + separator + argument
+        if command == 'PING':
+            reply = {'tag': argument} if separator else {}
+        elif command == 'STATUS':
+            acq = self.acq
+            reply = {} if acq is None else {key: _json_safe(value) for key, value in acq.stats_snapshot().items()}
+            if self.startup is not None:
+                reply['startup'] = self.startup.snapshot()
+        elif command in ('GOGO', 'STOP'):
+            loop = asyncio.get_running_loop()
+            try:
+                reply = await loop.run_in_executor(self.executor, self._run_command, message)
+            except Exception as error:
+                reply = {'ok': False, 'error': f'{type(error).__name__}: {error}'}
+        else:
+            reply = {'ok': False, 'error': f'unknown command {message[:32]!r}'}
+        reply.setdefault('ok', True)
+        reply.update({'ack': command, 'state': self.state(),
+                      'received': received, 'replied': time.perf_counter()})
+        self.commands_handled += 1
+        transport.sendto(json.dumps(reply).encode('utf-8'), addr)
+
+    def _run_command(self, message):
+        # Commands received during startup run once the acquisition is there
+        if not self.attached.is_set():
+            t_wait = time.perf_counter()
+            done = self.startup.done if self.startup is not None else self.attached
+            done.wait(STARTUP_WAIT)
+            if not self.attached.is_set():
+                return {'ok': False, 'error': f'acquisition not ready ({self.state()})'}
+            print(f'{message.split("*")[0]} received during startup ran after {time.perf_counter() - t_wait:.2f} s')
+        reply = self.acq.handle_command(message)
+        if reply is None:
+            reply = {'ok': False, 'error': f'command {message[:32]!r} not handled'}
+        if self.on_command is not None:
+            self.on_command(message, reply)
+        return reply
@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Drives several acquisition nodes (vid_acq.py or vid_acq_headless.py, one per rig) from one
+# controller over their UDP control servers, see control_server.py.
+# Every node has its own perf_counter clock. The coordinator estimates each node's offset from
+# PING round trips (the node time half way through the fastest round trip, every PING is tagged
+# so a late reply to an earlier one is not mistaken for a fast round trip), schedules a
+# shared start time a little in the future on its own clock and sends each node that time
+# converted to the node's clock. Nodes open their writers straight away and start recording
+# on a frame tick placed exactly on the scheduled time.
+
+UDP_LISTEN_PORT = 1813
+START_LEAD = 1.0  # Seconds between sending GOGO and the scheduled start, covers opening the writers
+CLOCK_SYNC_PINGS = 20
+REPLY_TIMEOUT = 5.0
+
+
+class Node:
+    def __init__(self, address, port=UDP_LISTEN_PORT, name=None):
+        self.address = socket.gethostbyname(address)
+        self.port = port
+        self.name = name or f'{address}:{port}'
+        self.offset = None  # Node perf_counter minus coordinator perf_counter, seconds
+        self.rtt = None  # Round trip of the ping the offset was taken from
+
+    def to_node(self, t):
+        return t + self.offset
+
+    def from_node(self, t):
+        return t - self.offset
+
+
+def parse_node(spec):
+    # 'host', 'host:port' or 'name=host:port'
+    name, _, spec = spec.rpartition('=')
+    address, _, port = spec.partition(':')
+    return Node(address, int(port) if port else UDP_LISTEN_PORT, name or None)
+
+
+class Coordinator:
+    def __init__(self, nodes=(), timeout=REPLY_TIMEOUT):
+        self.nodes = list(nodes)
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.ping_count = 0  # Tags the clock sync PINGs
+
+    def add_node(self, address, port=UDP_LISTEN_PORT, name=None):
+        node = Node(address, port, name)
+        self.nodes.append(node)
+        return node
+
+    def discover(self, port=UDP_LISTEN_PORT, timeout=1.0, broadcast='255.255.255.255'):
+        # Adds every node that answers a broadcast PING on the local network
+        known = {(node.address, node.port) for node in self.nodes}
+        self.sock.sendto(b'PING', (broadcast, port))
+        for addr, _ in self._collect(None, timeout):
+            if addr not in known:
+                known.add(addr)
+                self.nodes.append(Node(addr[0], addr[1]))
+        return self.nodes
+
+    def _collect(self, nodes, timeout, match=None):
+        # Yields (addr, reply) until every node in nodes answered or timeout seconds passed.
+        # nodes=None collects from anyone until the timeout. Replies for which match(reply) is
+        # false are skipped, e.g. replies to an earlier PING.
+        waiting = None if nodes is None else {(node.address, node.port) for node in nodes}
+        t_end = time.perf_counter() + timeout
+        while waiting is None or waiting:
+            remaining = t_end - time.perf_counter()
+            if remaining <= 0:
+                return
+            self.sock.settimeout(remaining)
+            try:
+                data, addr = self.sock.recvfrom(65536)
+            except socket.timeout:
+                return
+            try:
+                reply = json.loads(data.decode('utf-8'))
+            except ValueError:
+                continue
+            if match is not None and not match(reply):
+                continue
+            if waiting is not None:
+                if addr not in waiting:
+                    continue  # Late reply to an earlier command
+                waiting.discard(addr)
+            yield addr, reply
+
+    def _send_all(self, messages):
+        # messages maps node to command. Returns {node: reply or None}, replies gathered concurrently.
+        by_addr = {(node.address, node.port): node for node in messages}
+        for node, message in messages.items():
+            self.sock.sendto(message.encode('utf-8'), (node.address, node.port))
+        replies = dict.fromkeys(messages)
+        for addr, reply in self._collect(list(messages), self.timeout):
+            replies[by_addr[addr]] = reply
+        return replies
+
+    def sync_clocks(self, n=CLOCK_SYNC_PINGS):
+        for node in self.nodes:
+            best = None
+            for _ in range(n):
+                self.ping_count += 1
+                tag = str(self.ping_count)
+                t0 = time.perf_counter()
+                self.sock.sendto(f'PING*{tag}'.encode('utf-8'), (node.address, node.port))
+                replies = list(self._collect([node], 1.0, match=lambda reply: reply.get('tag') == tag))
+                t1 = time.perf_counter()
+                if not replies:
+                    continue
+                reply = replies[0][1]
+                if best is None or t1 - t0 < best[0]:
+                    node_mid = (reply['received'] + reply['replied']) / 2
+                    best = (t1 - t0, node_mid - (t0 + t1) / 2)
+            if best is None:
+                raise RuntimeError(f'Node {node.name} does not answer PING')
+            node.rtt, node.offset = best
+            print(f'{node.name}: clock offset {node.offset:+.6f} s, round trip {1000 * node.rtt:.3f} ms')
+
+    def start(self, experiment_id, lead=START_LEAD):
+        # Returns (scheduled start on the coordinator clock, {node: ack})
+        if any(node.offset is None for node in self.nodes):
+            self.sync_clocks()
+        t_start = time.perf_counter() + lead
+        acks = self._send_all({node: f'GOGO*{experiment_id}*{node.to_node(t_start):.6f}' for node in self.nodes})
+        for node, ack in acks.items():
+            if ack is None:
+                print(f'{node.name}: no acknowledgement')
+            elif not ack['ok']:
+                print(f"{node.name}: GOGO failed: {ack.get('error')}")
+            else:
+                armed = node.from_node(ack['replied']) - t_start
+                print(f"{node.name}: armed {1000 * abs(armed):.1f} ms {'after' if armed > 0 else 'before'} the start"
+                      + (' (LATE, started on arrival)' if ack['late'] else ''))
+        return t_start, acks
+
+    def start_offsets(self, t_start):
+        # First recorded frame of every node relative to the scheduled start, in seconds
+        statuses = self._send_all({node: 'STATUS' for node in self.nodes})
+        offsets = {}
+        for node, status in statuses.items():
+            if status is not None and status.get('first_frame_time') is not None:
+                offsets[node] = node.from_node(status['first_frame_time']) - t_start
+        return offsets
+
+    def stop(self):
+        acks = self._send_all({node: 'STOP' for node in self.nodes})
+        stop_times = [node.from_node(ack['stop_time']) for node, ack in acks.items() if ack and ack['ok']]
+        for node, ack in acks.items():
+            if ack is None:
+                print(f'{node.name}: no acknowledgement')
+            elif not ack['ok']:
+                print(f"{node.name}: STOP failed: {ack.get('error')}")
+            else:
+                print(f"{node.name}: stopped after {ack['frame_count']} frames, "
+                      f"{1000 * (node.from_node(ack['stop_time']) - min(stop_times)):.2f} ms after the first node")
+        return acks
+
+    def close(self):
+        self.sock.close()
+
+
+def report_offsets(offsets, n_nodes):
+    for node, offset in offsets.items():
+        print(f'{node.name}: first frame {1000 * offset:+.3f} ms from the scheduled start')
+    if len(offsets) < n_nodes:
+        print(f'{n_nodes - len(offsets)} node(s) did not report a first frame')
+    if offsets:
+        values = np.array(list(offsets.values()))
+        print(f'Start spread across {len(values)} nodes: {1000 * (values.max() - values.min()):.3f} ms')
+
+
+def launch_local_nodes(n, base_port, fps, data_root):
+    # Headless nodes with synthetic cameras on loopback, one data root each
+    processes, nodes = [], []
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vid_acq_headless.py')
+    for i in range(n):
+        port = base_port + i
+        processes.append(subprocess.Popen(
+            [sys.executable, script, '--source', 'synthetic:640x480', '--fps', str(fps), '--port', str(port),
+             '--data-root', os.path.join(data_root, f'node{i}'), '--no-arduino', '--metrics-port', '0']))
+        nodes.append(Node('127.0.0.1', port, f'node{i}'))
+    return processes, nodes
+
+
+def wait_for_nodes(coordinator, timeout=30.0):
+    t_end = time.perf_counter() + timeout
+    pending = list(coordinator.nodes)
+    while pending and time.perf_counter() < t_end:
+        for node in list(pending):
+            coordinator.sock.sendto(b'PING', (node.address, node.port))
+        # Nodes answer PING while they open their cameras, they are ready once they say so
+        answered = {addr for addr, reply in coordinator._collect(pending, 0.5) if reply.get('state', 'ready') == 'ready'}
+        pending = [node for node in pending if (node.address, node.port) not in answered]
+    if pending:
+        raise RuntimeError(f"Nodes not ready: {', '.join(node.name for node in pending)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Start and stop recordings on several acquisition nodes together')
+    parser.add_argument('--node', action='append', default=[], help="node as 'host[:port]' or 'name=host:port' (repeat)")
+    parser.add_argument('--discover', action='store_true', help='find nodes with a broadcast PING')
+    parser.add_argument('--port', type=int, default=UDP_LISTEN_PORT, help='control port for --discover')
+    parser.add_argument('--local', type=int, metavar='N', help='test with N local headless nodes with synthetic cameras')
+    parser.add_argument('--fps', type=float, default=30.0, help='frame rate of the --local nodes')
+    parser.add_argument('--exp-id', default=time.strftime('%Y-%m-%d') + '_01_TEST')
+    parser.add_argument('--lead', type=float, default=START_LEAD, help='seconds from GOGO to the scheduled start')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds instead of waiting for Enter')
+    args = parser.parse_args()
+
+    coordinator = Coordinator([parse_node(spec) for spec in args.node])
+    processes = []
+    data_root = None
+    try:
+        if args.local:
+            data_root = tempfile.mkdtemp(prefix='py_eye_nodes_')
+            processes, nodes = launch_local_nodes(args.local, args.port, args.fps, data_root)
+            coordinator.nodes.extend(nodes)
+            wait_for_nodes(coordinator)
+        if args.discover:
+            coordinator.discover(args.port)
+        if not coordinator.nodes:
+            parser.error('no nodes, use --node, --discover or --local')
+        print(f"Nodes: {', '.join(node.name for node in coordinator.nodes)}")
+
+        coordinator.sync_clocks()
+        t_start, _ = coordinator.start(args.exp_id, args.lead)
+        time.sleep(max(t_start - time.perf_counter(), 0.0) + 0.2)
+        report_offsets(coordinator.start_offsets(t_start), len(coordinator.nodes))
+        if args.duration is not None:
+            time.sleep(args.duration)
+        else:
+            input('Press Enter to stop recording...')
+        coordinator.stop()
+    finally:
+        coordinator.close()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        if data_root is not None:
+            print(f'Local node recordings are in {data_root}')
+
+
+if __name__ == '__main__':
+    main()
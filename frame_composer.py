@@ -0,0 +1,115 @@
+import cv2
+import numpy as np
+
+
+def check_roi(roi, frame_shape=None):
+    # Raises ValueError unless roi is an (x, y, width, height) box inside a frame of frame_shape
+    # (height, width[, channels]), which is None when the frame size is not known yet
+    if len(roi) != 4 or min(roi[:2]) < 0 or min(roi[2:]) <= 0:
+        raise ValueError(f'ROI {tuple(roi)} is not (x, y, width, height) with a positive size')
+    if frame_shape is not None:
+        height, width = frame_shape[:2]
+        x, y, roi_width, roi_height = roi
+        if x + roi_width > width or y + roi_height > height:
+            raise ValueError(f'ROI {tuple(roi)} is not inside the {width}x{height} camera frame')
+
+
+class FrameComposer:
+    # Builds the side by side save frame and the stacked display frame in canvases that are
+    # allocated once. Each camera is converted to gray first and then resized straight into its
+    # slot of the canvas, so composing a frame does not allocate any image sized arrays.
+    # With stacked=False every camera gets its own contiguous save frame instead of a slot in
+    # one wide canvas, for recording one file per camera.
+    # compose_save() and compose_display() share no buffers, so the preview can run on another
+    # thread and at a lower rate than acquisition.
+    # rois holds an optional (x, y, width, height) box in camera pixels per slot. Only the box is
+    # converted and resized for saving (it is a slice of the camera frame, not a copy), the
+    # preview shows the whole frame with the box drawn on it.
+    def __init__(self, n_slots, save_size, disp_size, stacked=True, rois=None):
+        self.n_slots = n_slots
+        self.rois = list(rois or []) + [None] * (n_slots - len(rois or []))
+        for roi in self.rois:
+            if roi is not None:
+                check_roi(roi)
+        self.save_width, self.save_height = save_size
+        self.disp_width, self.disp_height = disp_size
+        self.stacked = stacked
+
+        self.disp_canvas = np.zeros((self.disp_height * n_slots, self.disp_width), dtype=np.uint8)
+        self.disp_bgr = np.zeros((self.disp_height * n_slots, self.disp_width, 3), dtype=np.uint8)
+        if stacked:
+            self.save_canvas = np.zeros((self.save_height, self.save_width * n_slots), dtype=np.uint8)
+            self.save_views = [self.save_canvas[:, i * self.save_width:(i + 1) * self.save_width]
+                               for i in range(n_slots)]
+        else:
+            self.save_canvas = None
+            self.save_views = [np.zeros((self.save_height, self.save_width), dtype=np.uint8) for _ in range(n_slots)]
+        self.disp_views = [self.disp_canvas[i * self.disp_height:(i + 1) * self.disp_height]
+                           for i in range(n_slots)]
+        # Gray copy of each camera at its native resolution, allocated when the first frame arrives
+        self.gray = [None] * n_slots
+        # Colour frames are shrunk to display size before the gray conversion on the display path
+        self.disp_small = [np.zeros((self.disp_height, self.disp_width, 3), dtype=np.uint8) for _ in range(n_slots)]
+
+    def _to_gray(self, i, frame):
+        if frame.ndim == 2:
+            return frame
+        if self.gray[i] is None or self.gray[i].shape != frame.shape[:2]:
+            self.gray[i] = np.empty(frame.shape[:2], dtype=np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray[i])
+        return self.gray[i]
+
+    def _crop(self, i, frame):
+        roi = self.rois[i]
+        if roi is None:
+            return frame
+        x, y, width, height = roi
+        return frame[y:y + height, x:x + width]
+
+    def compose_save(self, frames):
+        # frames holds one image (or None for a missing camera) per slot, extra slots stay black.
+        # Returns the save canvas, or the list of per-camera save frames when not stacked.
+        for i in range(self.n_slots):
+            frame = frames[i] if i < len(frames) else None
+            if frame is not None:
+                frame = self._crop(i, frame)
+            if frame is None or frame.size == 0:  # Missing camera
+                self.save_views[i].fill(0)
+                continue
+            gray = self._to_gray(i, frame)
+            if gray.shape == self.save_views[i].shape:
+                np.copyto(self.save_views[i], gray)  # ROI saved at its own resolution
+            else:
+                cv2.resize(gray, (self.save_width, self.save_height), dst=self.save_views[i])
+        return self.save_canvas if self.stacked else self.save_views
+
+    def compose_display(self, frames):
+        # Same input as compose_save(), returns the stacked gray display canvas. Nearest neighbour
+        # is good enough for a preview and about half the cost of linear interpolation.
+        for i in range(self.n_slots):
+            frame = frames[i] if i < len(frames) else None
+            if frame is None:
+                self.disp_views[i].fill(0)
+            elif frame.ndim == 2:
+                cv2.resize(frame, (self.disp_width, self.disp_height), dst=self.disp_views[i],
+                           interpolation=cv2.INTER_NEAREST)
+            else:
+                cv2.resize(frame, (self.disp_width, self.disp_height), dst=self.disp_small[i],
+                           interpolation=cv2.INTER_NEAREST)
+                cv2.cvtColor(self.disp_small[i], cv2.COLOR_BGR2GRAY, dst=self.disp_views[i])
+            if frame is not None and self.rois[i] is not None:
+                x, y, width, height = self.rois[i]
+                scale_x = self.disp_width / frame.shape[1]
+                scale_y = self.disp_height / frame.shape[0]
+                cv2.rectangle(self.disp_views[i], (int(x * scale_x), int(y * scale_y)),
+                              (int((x + width) * scale_x) - 1, int((y + height) * scale_y) - 1), 255, 1)
+        return self.disp_canvas
+
+    def compose(self, frames):
+        # Both canvases at once, returns (save canvas or per-camera save frames, display canvas)
+        return self.compose_save(frames), self.compose_display(frames)
+
+    def display_bgr(self):
+        # 3-channel copy of the display canvas for coloured text overlays
+        cv2.cvtColor(self.disp_canvas, cv2.COLOR_GRAY2BGR, dst=self.disp_bgr)
+        return self.disp_bgr
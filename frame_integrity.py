@@ -0,0 +1,71 @@
+import numpy as np
+
+# Per-camera integrity of the recorded frames. Every recorded frame gets a flags byte per camera
+# in the frame log, and counters since the recording start are available live (STATUS) and in
+# the session summary, so bad sessions can be rejected without decoding the video.
+
+# Bits of the cam_flags field
+FRAME_MISSING = 1  # The camera has not delivered any frame, its slot was recorded black
+FRAME_STALE = 2  # No new grab since the previous recorded frame, the same image was recorded again
+FRAME_DUPLICATE = 4  # A new grab, but the camera delivered the same image as its previous grab
+FRAME_GAP = 8  # Camera frames were grabbed but not recorded since the previous recorded frame
+FRAME_GRAB_FAILED = 16  # grab() or retrieve() failed since the previous recorded frame
+FRAME_TORN = 32  # The reader overwrote the ring slot while the frame was composed, it may mix two images
+
+COUNTERS = ('missing', 'stale', 'duplicate', 'gap_frames', 'grab_failures', 'torn')
+
+
+class FrameIntegrity:
+    def __init__(self, capture_engine):
+        self.readers = capture_engine.readers
+        n_cameras = len(self.readers)
+        self.flags = np.zeros(n_cameras, dtype=np.uint8)
+        self.seqs = np.zeros(n_cameras, dtype=np.int64)
+        self.counters = {name: np.zeros(n_cameras, dtype=np.int64) for name in COUNTERS}
+        self.reset()
+
+    def reset(self):
+        # Call at the start of a recording
+        for counts in self.counters.values():
+            counts.fill(0)
+        self.last_seqs = [None] * len(self.readers)
+        self.last_failures = [reader.grab_failures for reader in self.readers]
+
+    def check(self, seqs, valid=None):
+        # seqs: reader sequence number of the frame recorded for each camera (-1 before the
+        # first frame). valid: CaptureEngine.latest_valid() after composing, None if not checked.
+        # Returns (flags, seqs) arrays for the frame log, reused between calls.
+        flags = self.flags
+        flags.fill(0)
+        for i, (reader, seq) in enumerate(zip(self.readers, seqs)):
+            self.seqs[i] = seq
+            if valid is not None and not valid[i]:
+                flags[i] |= FRAME_TORN
+                self.counters['torn'][i] += 1
+            failures = reader.grab_failures
+            if failures != self.last_failures[i]:
+                flags[i] |= FRAME_GRAB_FAILED
+                self.counters['grab_failures'][i] += failures - self.last_failures[i]
+                self.last_failures[i] = failures
+            if seq < 0:
+                flags[i] |= FRAME_MISSING
+                self.counters['missing'][i] += 1
+                continue
+            last_seq = self.last_seqs[i]
+            if last_seq is not None:
+                if seq == last_seq:
+                    flags[i] |= FRAME_STALE
+                    self.counters['stale'][i] += 1
+                    continue
+                if seq > last_seq + 1:
+                    flags[i] |= FRAME_GAP
+                    self.counters['gap_frames'][i] += seq - last_seq - 1
+            if reader.ring.is_duplicate(seq):
+                flags[i] |= FRAME_DUPLICATE
+                self.counters['duplicate'][i] += 1
+            self.last_seqs[i] = seq
+        return flags, self.seqs
+
+    def snapshot(self):
+        # Per-camera counters since the recording started, as lists
+        return {name: counts.tolist() for name, counts in self.counters.items()}
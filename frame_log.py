@@ -0,0 +1,91 @@
+import json
+import os
+import struct
+import numpy as np
+
+# Append-only per-frame metadata log written while recording. The file starts with a JSON
+# header (session metadata and the record layout) followed by fixed size records, written
+# in batches so at most FLUSH_EVERY frames are lost if the process dies.
+
+LOG_MAGIC = b'PYEYFL01'
+LOG_PREFIX = struct.Struct('<8sI')  # magic, length of the JSON header in bytes
+FLUSH_EVERY = 30
+
+# Bits of the sync field
+SYNC_LEVEL = 1  # Level of the Arduino sync output after this frame
+SYNC_TOGGLED = 2  # A sync command was sent on this frame (see sync_driver.py)
+
+
+def record_dtype(n_cameras):
+    return np.dtype([('frame_index', '<u8'),
+                     ('host_time', '<f8'),
+                     ('grab_times', '<f8', (n_cameras,)),
+                     ('sync', 'u1'),
+                     ('cam_seq', '<i8', (n_cameras,)),  # Camera reader frame number, gaps are frames not recorded
+                     ('cam_flags', 'u1', (n_cameras,))])  # FRAME_* bits, see frame_integrity.py
+
+
+class FrameLogWriter:
+    def __init__(self, filename, n_cameras, metadata=None):
+        self.filename = filename
+        self.dtype = record_dtype(n_cameras)
+        header = json.dumps({'n_cameras': n_cameras,
+                             'record_dtype': self.dtype.descr,
+                             'metadata': metadata or {}}).encode('utf-8')
+        self.file = open(filename, 'wb')
+        self.file.write(LOG_PREFIX.pack(LOG_MAGIC, len(header)) + header)
+        self.file.flush()
+        # Records are filled in place and written out as one block per batch
+        self.batch = np.zeros(FLUSH_EVERY, dtype=self.dtype)
+        self.pending = 0
+        self.n_records = 0
+
+    def append(self, frame_index, host_time, grab_times, sync, cam_seq=-1, cam_flags=0):
+        record = self.batch[self.pending]
+        record['frame_index'] = frame_index
+        record['host_time'] = host_time
+        record['grab_times'] = grab_times
+        record['sync'] = sync
+        record['cam_seq'] = cam_seq
+        record['cam_flags'] = cam_flags
+        self.pending += 1
+        self.n_records += 1
+        if self.pending == FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.file.write(self.batch[:self.pending].tobytes())
+            self.pending = 0
+        # Data handed to the OS survives a crash of this process (not a power cut)
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_frame_log(filename):
+    # Returns (metadata dict, structured record array memory-mapped from the file). A record
+    # cut short by a crash is ignored. Use read_frame_log_arrays() for plain arrays per field.
+    with open(filename, 'rb') as f:
+        magic, header_len = LOG_PREFIX.unpack(f.read(LOG_PREFIX.size))
+        if magic != LOG_MAGIC:
+            raise ValueError(f'{filename} is not a py_eye frame log')
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    dtype = np.dtype([tuple(field) if len(field) == 2 else (field[0], field[1], tuple(field[2]))
+                      for field in header['record_dtype']])
+    offset = LOG_PREFIX.size + header_len
+    n_records = (os.path.getsize(filename) - offset) // dtype.itemsize
+    if n_records == 0:
+        records = np.zeros(0, dtype=dtype)
+    else:
+        records = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(n_records,))
+    return header['metadata'], records
+
+
+def read_frame_log_arrays(filename):
+    metadata, records = read_frame_log(filename)
+    arrays = {name: np.asarray(records[name]) for name in records.dtype.names}
+    arrays['metadata'] = metadata
+    return arrays
@@ -0,0 +1,125 @@
+import math
+import threading
+import time
+import traceback
+
+# The last part of every wait is spent yielding in a loop instead of sleeping, because
+# sleep() can overshoot by a millisecond or more depending on the OS timer resolution.
+SPIN_MARGIN = 0.002
+REPORT_INTERVAL = 5.0  # Seconds between console summaries of missed deadlines and callback errors
+
+
+class FrameScheduler(threading.Thread):
+    # Calls callback() at a fixed rate on its own thread. Deadlines are computed as
+    # t0 + k / fps from the tick number k on the monotonic perf_counter clock, so rounding
+    # and callback jitter never accumulate. When a callback overruns past the next deadline
+    # the missed ticks are skipped and counted instead of being run back to back. An exception
+    # in callback() is counted and the ticks go on. Both are summarised on the console at most
+    # every REPORT_INTERVAL seconds, so a late loop is not slowed further by printing.
+    def __init__(self, callback, fps, spin_margin=SPIN_MARGIN, name='FrameScheduler'):
+        super().__init__(daemon=True, name=name)
+        self.callback = callback
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.spin_margin = spin_margin
+        self.running = True
+
+        self.t0 = None
+        self.align_time = None  # Set by align(), picked up before the next tick
+        self.ticks = 0
+        self.missed_deadlines = 0
+        self.max_lateness = 0.0
+        self.callback_errors = 0
+        self.last_error = None
+        self.first_tick_time = None
+        self.last_tick_time = None
+        # Misses and errors since the last console summary
+        self.unreported_missed = 0
+        self.unreported_lateness = 0.0
+        self.unreported_errors = 0
+        self.last_report = 0.0
+
+    def _wait_until(self, deadline):
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            if remaining > self.spin_margin:
+                time.sleep(remaining - self.spin_margin)
+            else:
+                time.sleep(0)  # Yield the GIL to the camera reader threads while spinning
+
+    def run(self):
+        self.t0 = time.perf_counter()
+        k = 0
+        while self.running:
+            if self.align_time is not None:
+                # Move the tick grid so one deadline falls exactly on align_time. The next tick
+                # comes less than one period after the current one, so no deadline is missed.
+                align_time, self.align_time = self.align_time, None
+                now = time.perf_counter()
+                self.t0 = align_time - max(math.floor((align_time - now) / self.period), 0) * self.period
+                k = 0
+            deadline = self.t0 + k * self.period
+            self._wait_until(deadline)
+            now = time.perf_counter()
+            lateness = now - deadline
+            if lateness >= self.period:
+                missed = int(lateness / self.period)
+                self.missed_deadlines += missed
+                self.unreported_missed += missed
+                self.unreported_lateness = max(self.unreported_lateness, lateness)
+                k += missed
+                lateness -= missed * self.period
+            self.max_lateness = max(self.max_lateness, lateness)
+
+            if self.first_tick_time is None:
+                self.first_tick_time = now
+            self.last_tick_time = now
+            self.ticks += 1
+            try:
+                self.callback()
+            except Exception as error:
+                if self.callback_errors == 0:
+                    traceback.print_exc()
+                self.callback_errors += 1
+                self.unreported_errors += 1
+                self.last_error = f'{type(error).__name__}: {error}'
+            if (self.unreported_missed or self.unreported_errors) and now - self.last_report >= REPORT_INTERVAL:
+                self.report()
+            k += 1
+        if self.unreported_missed or self.unreported_errors:
+            self.report()
+
+    def report(self):
+        if self.unreported_missed:
+            print(f"[SCHED] Missed {self.unreported_missed} deadline(s), up to {1000 * self.unreported_lateness:.1f} ms late")
+        if self.unreported_errors:
+            print(f"[SCHED] {self.unreported_errors} tick(s) raised, last: {self.last_error}")
+        self.unreported_missed = 0
+        self.unreported_lateness = 0.0
+        self.unreported_errors = 0
+        self.last_report = time.perf_counter()
+
+    def align(self, t):
+        # Makes a future tick happen at perf_counter time t, e.g. a scheduled recording start
+        self.align_time = t
+
+    def stop(self):
+        self.running = False
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout=2.0)
+
+    def achieved_fps(self):
+        if self.ticks < 2:
+            return 0.0
+        return (self.ticks - 1) / (self.last_tick_time - self.first_tick_time)
+
+    def stats(self):
+        return {'target_fps': self.fps,
+                'achieved_fps': self.achieved_fps(),
+                'ticks': self.ticks,
+                'missed_deadlines': self.missed_deadlines,
+                'max_lateness_ms': 1000 * self.max_lateness,
+                'callback_errors': self.callback_errors,
+                'last_error': self.last_error}
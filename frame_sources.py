@@ -0,0 +1,169 @@
+import sys
+import time
+import cv2
+import numpy as np
+
+# Frame sources share the subset of the cv2.VideoCapture interface used by the capture
+# engine (grab, retrieve, read, set, get, isOpened, release), so real cameras, video files
+# and synthetic generators are interchangeable.
+
+
+def open_camera(index):
+    if sys.platform == 'win32':
+        return cv2.VideoCapture(index, cv2.CAP_DSHOW)
+    return cv2.VideoCapture(index)
+
+
+class PacedSource:
+    # Base class for sources that are not clocked by hardware. grab() blocks until the next
+    # frame is due, using absolute deadlines so the rate does not drift.
+    def __init__(self, fps):
+        self.fps = fps
+        self.t0 = None
+        self.frame_index = -1
+        self.opened = True
+
+    def _wait_next(self):
+        now = time.perf_counter()
+        if self.t0 is None:
+            self.t0 = now
+        self.frame_index += 1
+        deadline = self.t0 + self.frame_index / self.fps
+        if deadline > now:
+            time.sleep(deadline - now)
+        elif now - deadline > 1.0:
+            # Consumer stalled for a long time, restart the clock rather than burst
+            self.t0 = now
+            self.frame_index = 0
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FPS and value > 0:
+            self.fps = float(value)
+            self.t0 = None
+            self.frame_index = -1
+            return True
+        return False
+
+    def isOpened(self):
+        return self.opened
+
+    def release(self):
+        self.opened = False
+
+
+class SyntheticSource(PacedSource):
+    # Moving dark "pupil" on a static noise background. The frame counter is stamped into the
+    # first row so consecutive frames always differ. Like a UVC camera it grants any requested
+    # size, and with CAP_PROP_CONVERT_RGB off delivers raw YUY2 as (h, w, 2).
+    def __init__(self, width=640, height=480, fps=30.0, color=True, seed=0):
+        super().__init__(fps)
+        self.color = color
+        self.seed = seed
+        self.convert_rgb = True
+        self._allocate(width, height)
+
+    def _allocate(self, width, height):
+        self.width = width
+        self.height = height
+        rng = np.random.default_rng(self.seed)
+        shape = (height, width, 3) if self.color else (height, width)
+        self.background = rng.integers(96, 160, shape, dtype=np.uint8)
+        self.frame = np.empty_like(self.background)
+        self.yuyv = np.full((height, width, 2), 128, dtype=np.uint8)
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH and value > 0:
+            self._allocate(int(value), self.height)
+            return True
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT and value > 0:
+            self._allocate(self.width, int(value))
+            return True
+        if prop == cv2.CAP_PROP_CONVERT_RGB and self.color:
+            self.convert_rgb = bool(value)
+            return True
+        return super().set(prop, value)
+
+    def grab(self):
+        if not self.opened:
+            return False
+        self._wait_next()
+        return True
+
+    def retrieve(self, image=None, flag=0):
+        raw = not self.convert_rgb
+        shape = self.yuyv.shape if raw else self.background.shape
+        if image is None or image.shape != shape:
+            image = np.empty(shape, dtype=np.uint8)
+        frame = self.frame if raw else image
+        np.copyto(frame, self.background)
+        phase = self.frame_index / self.fps
+        center = (int(self.width * (0.5 + 0.25 * np.cos(phase))), int(self.height * (0.5 + 0.25 * np.sin(phase))))
+        cv2.circle(frame, center, max(2, self.height // 12), (20, 20, 20), -1)
+        frame.flat[:8] = np.frombuffer(np.int64(self.frame_index).tobytes(), dtype=np.uint8)
+        if raw:
+            np.copyto(image, self.yuyv)
+            image[:, :, 0] = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            image[0, :8, 0] = frame.flat[:8]
+        return True, image
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FPS: self.fps,
+                cv2.CAP_PROP_FRAME_WIDTH: self.width,
+                cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+                cv2.CAP_PROP_CONVERT_RGB: float(self.convert_rgb)}.get(prop, 0.0)
+
+
+class VideoFileSource(PacedSource):
+    # Replays a video file at its own frame rate (or fps if given), looping at the end
+    def __init__(self, path, fps=None, loop=True):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f'Cannot open video file {path}')
+        super().__init__(fps or self.capture.get(cv2.CAP_PROP_FPS) or 30.0)
+        self.loop = loop
+
+    def grab(self):
+        if not self.opened:
+            return False
+        self._wait_next()
+        if self.capture.grab():
+            return True
+        if self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return self.capture.grab()
+        return False
+
+    def retrieve(self, image=None, flag=0):
+        return self.capture.retrieve(image)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return self.capture.get(prop)
+
+    def release(self):
+        super().release()
+        self.capture.release()
+
+
+def open_source(spec, fps=30.0):
+    # spec is a camera index (int or digits), 'synthetic[:WxH[@fps]]' or 'file:<path>'
+    if isinstance(spec, int) or str(spec).isdigit():
+        return open_camera(int(spec))
+    if spec.startswith('synthetic'):
+        width, height = 640, 480
+        _, _, params = spec.partition(':')
+        if params:
+            size, _, rate = params.partition('@')
+            width, height = (int(v) for v in size.lower().split('x'))
+            if rate:
+                fps = float(rate)
+        return SyntheticSource(width, height, fps)
+    if spec.startswith('file:'):
+        return VideoFileSource(spec[5:])
+    raise ValueError(f'Unknown frame source: {spec}')
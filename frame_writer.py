@@ -0,0 +1,178 @@
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+# Number of shared memory frame slots between the acquisition loop and the encoder.
+# At 30 fps, 64 slots absorb about two seconds of encoder stalls before frames drop.
+WRITER_QUEUE_SIZE = 64
+# Longest FrameWriter() waits for the encoder process to start and open its backend
+WRITER_OPEN_TIMEOUT = 30.0
+
+
+def _attach_shm(name):
+    try:
+        # The parent owns the segments, so the child must not unlink them on exit
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+def _writer_main(shm_names, shape, filename, backend, fps, segment_frames, filled, freed, result):
+    from segments import SegmentedBackend
+    from writer_backends import make_backend
+
+    shms = [_attach_shm(name) for name in shm_names]
+    frames = [np.ndarray(shape, dtype=np.uint8, buffer=shm.buf) for shm in shms]
+    # The parent waits for this first message before it records anything
+    try:
+        if segment_frames:
+            out = SegmentedBackend(backend, filename, fps, shape, segment_frames)
+        else:
+            out = make_backend(backend, filename, fps, shape)
+    except Exception as error:
+        result.put({'error': f'{type(error).__name__}: {error}'})
+        return
+    result.put({'opened': True})
+
+    underruns = 0
+    try:
+        while True:
+            t_wait = time.perf_counter()
+            slot = filled.get()
+            if slot is None:
+                break
+            # Waiting more than two frame periods means acquisition stopped feeding us
+            if out.frames_written and time.perf_counter() - t_wait > 2.0 / fps:
+                underruns += 1
+            out.write(frames[slot])
+            freed.put(slot)
+        out.close()
+    except Exception as error:
+        # e.g. ffmpeg exited and the pipe broke. The process ends, so the parent stops recording frames.
+        result.put({'error': f'{type(error).__name__}: {error}', 'frames_written': out.frames_written})
+        raise
+    del frames
+    for shm in shms:
+        shm.close()
+    result.put({'underruns': underruns, **out.stats()})
+
+
+class FrameWriter:
+    # Drop-in replacement for cv2.VideoWriter that encodes in a separate process with one of the
+    # backends in writer_backends.py. write() copies the frame into a free shared memory slot
+    # and never waits on the encoder. With segment_frames the output rolls over to a new file
+    # every segment_frames frames, see segments.py. The constructor waits until the encoder
+    # process has opened its backend and raises RuntimeError if it could not.
+    def __init__(self, filename, backend, fps, frame_size, is_color=False, queue_size=WRITER_QUEUE_SIZE,
+                 segment_frames=None):
+        self.filename = filename
+        width, height = frame_size
+        self.shape = (height, width, 3) if is_color else (height, width)
+        nbytes = int(np.prod(self.shape))
+        self.shms = [shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(queue_size)]
+        self.slots = [np.ndarray(self.shape, dtype=np.uint8, buffer=shm.buf) for shm in self.shms]
+        self.free_slots = list(range(queue_size))
+        self.queue_size = queue_size
+
+        ctx = mp.get_context('spawn')
+        self.filled = ctx.Queue()
+        self.freed = ctx.Queue()
+        self.result = ctx.Queue()
+        self.process = ctx.Process(target=_writer_main,
+                                   args=([shm.name for shm in self.shms], self.shape, filename, backend, fps,
+                                         segment_frames, self.filled, self.freed, self.result),
+                                   daemon=True)
+        self.process.start()
+
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.max_queue_depth = 0
+        self.queue_depth_sum = 0
+        self.stats = None
+        self.failed = False  # Set once the encoder process is found dead while recording
+        error = self._wait_opened()
+        if error is not None:
+            self.process.join(timeout=5)
+            self._free_shms()
+            raise RuntimeError(f'Writer process for {filename} could not open the {backend} backend: {error}')
+
+    def _wait_opened(self):
+        # Error message from the encoder process, or None once it opened its backend
+        t_end = time.perf_counter() + WRITER_OPEN_TIMEOUT
+        while time.perf_counter() < t_end:
+            try:
+                message = self.result.get(timeout=0.1)
+            except queue.Empty:
+                if not self.process.is_alive() and self.result.empty():
+                    return f'process exited with code {self.process.exitcode}'
+                continue
+            return message.get('error')
+        self.process.terminate()
+        return f'no answer within {WRITER_OPEN_TIMEOUT:g} s'
+
+    def _reclaim_slots(self):
+        while True:
+            try:
+                self.free_slots.append(self.freed.get_nowait())
+            except queue.Empty:
+                break
+
+    def can_write(self):
+        # False while the queue is full, and for good once the encoder process has died
+        if not self.process.is_alive():
+            if not self.failed:
+                self.failed = True
+                print(f'Writer process for {self.filename} died (exit code {self.process.exitcode}), '
+                      f'frames are no longer recorded')
+            return False
+        self._reclaim_slots()
+        return bool(self.free_slots)
+
+    def drop(self):
+        # Counts a frame that was not submitted, e.g. because another stream of the same
+        # recording had no free slot and all streams must stay frame aligned
+        self.frames_submitted += 1
+        self.frames_dropped += 1
+
+    def write(self, frame):
+        self._reclaim_slots()
+        depth = self.queue_size - len(self.free_slots)
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self.queue_depth_sum += depth
+        if not self.free_slots:
+            # Encoder has fallen behind by a full queue: drop rather than stall acquisition
+            self.drop()
+            return False
+        self.frames_submitted += 1
+        slot = self.free_slots.pop()
+        np.copyto(self.slots[slot], frame)
+        self.filled.put(slot)
+        return True
+
+    def release(self):
+        self.filled.put(None)
+        self.process.join(timeout=60)
+        failed_stats = {'frames_written': None, 'underruns': None, 'bytes_per_s': None, 'encode_ms_mean': None}
+        try:
+            child_stats = self.result.get(timeout=1)
+        except queue.Empty:
+            # Encoder process died or hung, the file is probably incomplete
+            child_stats = failed_stats
+        if 'error' in child_stats:
+            child_stats = dict(failed_stats, **child_stats)
+        self.stats = {'frames_submitted': self.frames_submitted,
+                      'frames_dropped': self.frames_dropped,
+                      'max_queue_depth': self.max_queue_depth,
+                      'mean_queue_depth': self.queue_depth_sum / self.frames_submitted if self.frames_submitted else 0.0,
+                      'queue_size': self.queue_size,
+                      **child_stats}
+        self._free_shms()
+        return self.stats
+
+    def _free_shms(self):
+        del self.slots
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
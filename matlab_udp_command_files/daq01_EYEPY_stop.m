@@ -1,22 +1,38 @@
-function [success,msg] = daq01_EYEPY_start(expID)
+function [success,msg] = daq01_EYEPY_stop(expID, address, port)
 
-% eyepy server
-address = '127.0.0.1';
-port = 12345;
+% eyepy server, port is UDP_LISTEN_PORT in config.py
+if ~exist('address', 'var') || isempty(address)
+    address = '127.0.0.1';
+end
+if ~exist('port', 'var') || isempty(port)
+    port = 1813;
+end
 
-if ~exist('expID')
+if ~exist('expID', 'var')
     expID = '2016-10-14_09_CFAP049';
 end
 
 try
     % Create UDP object
-    udpObj = udpport("datagram", "IPV4");
+    udpObj = udpport("datagram", "IPV4", "Timeout", 10);
     % Send message
     write(udpObj, uint8(['STOP','*', expID]),'uint8', address, port);
+    % Wait for the JSON acknowledgement
+    ack = read(udpObj, 1, "uint8");
     % Clean up
     clear udpObj;
-    success = true;
-    msg = 'All good';
+    if isempty(ack)
+        success = false;
+        msg = 'No acknowledgement from eyepy';
+    else
+        reply = jsondecode(char(ack.Data));
+        success = reply.ok;
+        if success
+            msg = 'All good';
+        else
+            msg = reply.error;
+        end
+    end
 catch
     try
         % Close connection
@@ -27,4 +43,4 @@ catch
     msg = 'Unknown error';
 end
 
-end
\ No newline at end of file
+end
@@ -0,0 +1,92 @@
+import http.server
+import math
+import threading
+
+# Prometheus metrics over HTTP, bound to localhost: GET /metrics returns the stage timing
+# histograms of profiling.py and the live acquisition numbers in the Prometheus text format.
+#   curl http://127.0.0.1:9813/metrics
+
+METRICS_PORT = 9813
+
+
+def _value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'NaN'
+    return repr(float(value))
+
+
+def render_metrics(acq):
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        # samples: list of (labels string, value)
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{name}{labels} {_value(value)}' for labels, value in samples)
+
+    stats = acq.stats_snapshot()
+    metric('eyepy_recording', 'gauge', '1 while recording', [('', stats['recording'])])
+    metric('eyepy_recording_frames', 'gauge', 'Frames recorded in the current recording', [('', stats['frame_count'])])
+    metric('eyepy_fps', 'gauge', 'Instantaneous acquisition rate', [('', stats['fps'])])
+    metric('eyepy_frame_interval_p99_seconds', 'gauge', 'p99 of the last 100 recorded frame intervals',
+           [('', stats['p99_ms'] / 1000)])
+    metric('eyepy_dropped_frames', 'gauge', 'Frames dropped in the current recording (intervals and writer queue)',
+           [('', stats['dropped_frames'] + stats['writer_dropped_frames'])])
+    metric('eyepy_missed_deadlines_total', 'counter', 'Scheduler ticks that started a full period late',
+           [('', stats['missed_deadlines'])])
+    readers = acq.capture_engine.stats()
+    for name, key, help_text in (('eyepy_camera_frames_grabbed_total', 'frames_grabbed', 'Frames grabbed per camera'),
+                                 ('eyepy_camera_grab_failures_total', 'grab_failures', 'Failed grabs per camera'),
+                                 ('eyepy_camera_duplicate_frames_total', 'duplicate_frames',
+                                  'Grabs identical to the previous one per camera'),
+                                 ('eyepy_camera_reader_cpu_seconds_total', 'cpu_time', 'CPU time of each reader thread')):
+        metric(name, 'counter', help_text,
+               [(f'{{camera="{cam}"}}', reader[key]) for cam, reader in zip(acq.camera_ids, readers)])
+    return '\n'.join(lines) + '\n' + acq.profiler.prometheus()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = render_metrics(self.server.acq).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per scrape would flood the console
+
+
+class MetricsServer:
+    def __init__(self, acquisition, port=METRICS_PORT, host='127.0.0.1'):
+        self.acq = acquisition
+        self.port = port
+        self.host = host
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        # Monitoring is optional, a port in use is reported and acquisition goes on without it
+        try:
+            self.httpd = http.server.ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+        except OSError as error:
+            print(f'Metrics server not started on port {self.port}: {error}')
+            return False
+        self.httpd.daemon_threads = True
+        self.httpd.acq = self.acq
+        self.port = self.httpd.server_address[1]  # Resolves port 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name='MetricsServer')
+        self.thread.start()
+        print(f'Metrics at http://{self.host}:{self.port}/metrics')
+        return True
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,122 @@
+import time
+import cv2
+import numpy as np
+
+# Live preview rendered from the newest frame in each camera's ring buffer, independent of
+# the acquisition rate. Everything stays single channel: the text overlay is drawn into cached
+# layers only when one of their lines changes and is stamped onto the gray canvas with a mask,
+# so a refresh costs one small resize per camera and two masked copies. The status lines only
+# change with the recording state. The numbers (frame rate, elapsed time, interval statistics)
+# are updated about once a second, so their layer is not redrawn on every refresh.
+
+OVERLAY_HEIGHT = 140  # Rows at the top of the preview that can hold overlay text
+OVERLAY_FONT = cv2.FONT_HERSHEY_SIMPLEX
+OVERLAY_SCALE = 0.5
+OVERLAY_REFRESH = 1.0  # Seconds between updates of the overlay numbers when not recording
+
+
+class OverlayLayer:
+    def __init__(self, width, height=OVERLAY_HEIGHT):
+        self.ink = np.zeros((height, width), dtype=np.uint8)
+        self.outline = np.zeros((height, width), dtype=np.uint8)
+        self.mask = np.zeros((height, width), dtype=bool)
+        self.lines = None
+        self.redraws = 0
+
+    def update(self, lines):
+        # lines is a list of (text, (x, y)). Returns True if the layer had to be redrawn.
+        if lines == self.lines:
+            return False
+        self.ink.fill(0)
+        self.outline.fill(0)
+        for text, org in lines:
+            # White text on a black outline stays readable on bright and dark images
+            cv2.putText(self.outline, text, org, OVERLAY_FONT, OVERLAY_SCALE, 255, 3, cv2.LINE_8)
+            cv2.putText(self.ink, text, org, OVERLAY_FONT, OVERLAY_SCALE, 255, 1, cv2.LINE_8)
+        # Thin strokes do not always fall inside the outline, so the mask covers both
+        np.bitwise_or(self.outline, self.ink, out=self.outline)
+        np.greater(self.outline, 0, out=self.mask)
+        self.lines = lines
+        self.redraws += 1
+        return True
+
+    def apply(self, canvas):
+        height = min(self.ink.shape[0], canvas.shape[0])
+        np.copyto(canvas[:height], self.ink[:height], where=self.mask[:height])
+
+
+class PreviewRenderer:
+    # Call render() at the preview rate from the GUI thread. It returns the gray display canvas
+    # with the overlay applied, or None when neither the frames nor the text changed since the
+    # last call so the caller can skip the repaint.
+    def __init__(self, acquisition):
+        self.acq = acquisition
+        self.status_overlay = OverlayLayer(acquisition.composer.disp_width)
+        self.numbers_overlay = OverlayLayer(acquisition.composer.disp_width)
+        self.numbers = None
+        self.numbers_key = None  # The numbers are recomputed when this changes
+        self.tick_count = None  # (perf_counter time, scheduler ticks) of the last frame rate update
+        self.fps = 0.0
+        self.last_seqs = None
+        self.renders = 0
+        self.skipped = 0
+
+    def status_lines(self):
+        acq = self.acq
+        lines = [('RECORDING' if acq.recording else 'IDLE', (10, 50))]
+        if acq.recording and acq.experiment_id:
+            lines.append((f'Experiment ID: {acq.experiment_id}', (10, 70)))
+        return lines
+
+    def number_lines(self):
+        # Recomputed once per elapsed second while recording and every OVERLAY_REFRESH seconds
+        # otherwise, the same list is returned in between
+        acq = self.acq
+        now = time.perf_counter()
+        recording = acq.recording and acq.experiment_id
+        if recording:
+            elapsed_time = max(time.time() - acq.acquisition_start_time, 0.0)  # Negative before a scheduled start
+            key = (acq.experiment_id, int(elapsed_time))
+        else:
+            key = (None, int(now / OVERLAY_REFRESH))
+        if key == self.numbers_key:
+            return self.numbers
+        self.numbers_key = key
+
+        # Frame rate averaged over the ticks since the last update instead of the last interval
+        ticks = acq.scheduler.ticks
+        if self.tick_count is not None and now > self.tick_count[0]:
+            self.fps = (ticks - self.tick_count[1]) / (now - self.tick_count[0])
+        self.tick_count = (now, ticks)
+        lines = [(f'FPS: {self.fps:.1f}', (10, 30))]
+        if recording:
+            lines.append((f'Elapsed Time: {time.strftime("%H:%M:%S", time.gmtime(elapsed_time))}', (10, 90)))
+            if acq.frame_count >= 100:
+                stats = acq.stats_snapshot()  # Rolling window of the last 100 intervals, in milliseconds
+                lines.append((f"Avg Interframe: {stats['mean_ms']:.2f}ms +/- {stats['std_ms']:.2f}ms", (10, 110)))
+                dropped = stats['dropped_frames'] + stats['writer_dropped_frames']
+                lines.append((f"p99: {stats['p99_ms']:.1f}ms, dropped: {dropped}", (10, 130)))
+        self.numbers = lines
+        return lines
+
+    def render(self):
+        profiler = self.acq.profiler
+        t0 = time.perf_counter()
+        frames, _, seqs = self.acq.capture_engine.latest_set()
+        status_changed = self.status_overlay.update(self.status_lines())
+        numbers_changed = self.numbers_overlay.update(self.number_lines())
+        overlay_changed = status_changed or numbers_changed
+        t_overlay = time.perf_counter()
+        profiler.add('overlay_text', t_overlay - t0)
+        if seqs == self.last_seqs and not overlay_changed:
+            self.skipped += 1
+            return None
+        self.last_seqs = seqs
+        canvas = self.acq.composer.compose_display(frames)
+        t_compose = time.perf_counter()
+        profiler.add('preview_compose', t_compose - t_overlay)
+        self.status_overlay.apply(canvas)
+        self.numbers_overlay.apply(canvas)
+        profiler.add('overlay_apply', time.perf_counter() - t_compose)
+        self.renders += 1
+        return canvas
@@ -0,0 +1,116 @@
+import bisect
+import threading
+import time
+
+# Stage timing for the acquisition hot path. Each stage adds its perf_counter duration to a
+# fixed-bucket histogram, a bisect and three list updates (about a microsecond), so timing every
+# frame costs nothing noticeable against the frame budget. The histograms are cumulative since
+# startup, in the layout of Prometheus histograms (see metrics_server.py). Per-session numbers
+# are differences between two copy() snapshots.
+
+# Upper bucket bounds in seconds, observations above the last finite bound go to +Inf
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25, 1.0,
+           float('inf'))
+
+
+class StageHistogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def copy(self):
+        histogram = StageHistogram()
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.sum = self.sum
+        histogram.max = self.max
+        return histogram
+
+    def since(self, start):
+        # Observations added after start (an earlier copy()). max is the overall maximum.
+        histogram = self.copy()
+        if start is not None:
+            histogram.counts = [a - b for a, b in zip(self.counts, start.counts)]
+            histogram.count -= start.count
+            histogram.sum -= start.sum
+        return histogram
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        if self.count == 0:
+            return float('nan')
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = min(BUCKETS[i], self.max) if i == len(BUCKETS) - 1 else BUCKETS[i]
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def summary(self):
+        # Milliseconds
+        if self.count == 0:
+            return {'count': 0}
+        return {'count': self.count,
+                'mean_ms': 1000 * self.sum / self.count,
+                'p50_ms': 1000 * self.quantile(0.5),
+                'p90_ms': 1000 * self.quantile(0.9),
+                'p99_ms': 1000 * self.quantile(0.99),
+                'max_ms': 1000 * self.max,
+                'total_s': self.sum}
+
+
+class StageProfiler:
+    # One histogram per stage name. Each stage should be timed from a single thread, readers of
+    # the histograms may see a frame's update half applied, which is fine for monitoring.
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.t_start = time.perf_counter()
+
+    def add(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.stages.setdefault(stage, StageHistogram())
+        histogram.add(seconds)
+
+    def copy(self):
+        return {stage: histogram.copy() for stage, histogram in list(self.stages.items())}
+
+    def summary(self, since=None):
+        # Per-stage summary() of everything after since (a copy()), or since startup
+        since = since or {}
+        return {stage: histogram.since(since.get(stage)).summary()
+                for stage, histogram in sorted(list(self.stages.items()))}
+
+    def prometheus(self, name='eyepy_stage_seconds'):
+        lines = [f'# HELP {name} Time spent in each acquisition stage',
+                 f'# TYPE {name} histogram']
+        for stage, histogram in sorted(list(self.stages.items())):
+            histogram = histogram.copy()
+            cumulative = 0
+            for bound, n in zip(BUCKETS, histogram.counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum!r}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_summary(summary):
+    # One line per stage for the console
+    return '\n'.join(f"  {stage:<16} mean {s['mean_ms']:7.3f} ms, p99 {s['p99_ms']:7.3f} ms, max {s['max_ms']:7.3f} ms "
+                     f"({s['count']} calls)" for stage, s in summary.items() if s['count'])
@@ -0,0 +1,225 @@
+import os
+import struct
+import numpy as np
+
+# Recording format helpers: a binary per-frame timestamp index written next to the video,
+# and rewriting the mp4 sample timing so the container carries the real frame times.
+
+TIMESTAMP_MAGIC = b'PYEYTS01'
+# magic, fps, wall clock start time (time.time()), then one float64 per frame: seconds since start
+TIMESTAMP_HEADER = struct.Struct('<8sdd')
+TIMESTAMP_FLUSH_EVERY = 30
+
+
+class TimestampIndexWriter:
+    def __init__(self, filename, fps, start_time):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.file.write(TIMESTAMP_HEADER.pack(TIMESTAMP_MAGIC, fps, start_time))
+        self.pending = []
+
+    def append(self, frame_time):
+        self.pending.append(frame_time)
+        if len(self.pending) >= TIMESTAMP_FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.file.write(np.asarray(self.pending, dtype='<f8').tobytes())
+            self.pending = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_timestamp_index(filename):
+    # Returns (header dict, memory-mapped float64 array of frame times in seconds).
+    # Frame i lives at a fixed offset, so times[i] is O(1) without reading the whole file.
+    with open(filename, 'rb') as f:
+        magic, fps, start_time = TIMESTAMP_HEADER.unpack(f.read(TIMESTAMP_HEADER.size))
+    if magic != TIMESTAMP_MAGIC:
+        raise ValueError(f'{filename} is not a py_eye timestamp index')
+    n_frames = (os.path.getsize(filename) - TIMESTAMP_HEADER.size) // 8
+    if n_frames == 0:
+        times = np.zeros(0, dtype='<f8')
+    else:
+        times = np.memmap(filename, dtype='<f8', mode='r', offset=TIMESTAMP_HEADER.size, shape=(n_frames,))
+    return {'fps': fps, 'start_time': start_time, 'n_frames': n_frames}, times
+
+
+def frame_at_time(times, t):
+    # Index of the last frame shown at time t (seconds since recording start)
+    return max(int(np.searchsorted(times, t, side='right')) - 1, 0)
+
+
+def _read_box_header(data, pos):
+    size, box_type = struct.unpack_from('>I4s', data, pos)
+    header = 8
+    if size == 1:
+        size = struct.unpack_from('>Q', data, pos + 8)[0]
+        header = 16
+    elif size == 0:
+        size = len(data) - pos
+    return size, box_type, header
+
+
+def _find_boxes(data, start, end, path):
+    # Yields (offset, size, header) of every box matching path, e.g. [b'trak', b'mdia', b'mdhd']
+    pos = start
+    while pos < end:
+        size, box_type, header = _read_box_header(data, pos)
+        if box_type == path[0]:
+            if len(path) == 1:
+                yield pos, size, header
+            else:
+                yield from _find_boxes(data, pos + header, pos + size, path[1:])
+        pos += size
+
+
+def _find_top_level_box(f, box_type):
+    # (offset, size, header) of the first top level box of box_type in an open file, or None.
+    # Walks the boxes by their headers only, mdat can be many GB.
+    file_size = os.fstat(f.fileno()).st_size
+    pos = 0
+    while pos < file_size:
+        f.seek(pos)
+        size, found_type, header = _read_box_header(f.read(16).ljust(16, b'\0'), 0)
+        if size == 0:
+            size = file_size - pos
+        if found_type == box_type:
+            return pos, size, header
+        if size < 8:
+            return None  # Damaged file
+        pos += size
+    return None
+
+
+def _read_moov(filename):
+    # (moov box bytes, its header size) of an mp4
+    with open(filename, 'rb') as f:
+        box = _find_top_level_box(f, b'moov')
+        if box is None:
+            raise ValueError(f'{filename} has no moov box, the recording was probably not closed')
+        moov_pos, moov_size, moov_header = box
+        f.seek(moov_pos)
+        return f.read(moov_size), moov_header
+
+
+def read_mp4_keyframes(filename):
+    # Frame indices (0-based) of the keyframes of an mp4's video track from its stss (sync
+    # sample) box, so a reader can seek to the keyframe before a frame instead of decoding from
+    # the start. Returns None when every frame is a keyframe (no stss box).
+    moov, moov_header = _read_moov(filename)
+    stss = list(_find_boxes(moov, moov_header, len(moov), [b'trak', b'mdia', b'minf', b'stbl', b'stss']))
+    if not stss:
+        return None
+    pos, _, header = stss[0]
+    n_entries = struct.unpack_from('>I', moov, pos + header + 4)[0]
+    return np.frombuffer(moov, dtype='>u4', count=n_entries, offset=pos + header + 8).astype(np.int64) - 1
+
+
+def read_mp4_sample_times(filename):
+    # Presentation time in milliseconds of every frame of an mp4's video track, relative to the
+    # first frame, from its stts (time-to-sample) box. After embed_mp4_timestamps() these are the
+    # measured frame times, not frame index / fps. cv2.VideoWriter writes no B-frames, so there
+    # is no composition offset (ctts) to add.
+    moov, moov_header = _read_moov(filename)
+    mdhd_pos, _, mdhd_header = next(_find_boxes(moov, moov_header, len(moov), [b'trak', b'mdia', b'mdhd']))
+    version = moov[mdhd_pos + mdhd_header]
+    timescale = struct.unpack_from('>I', moov, mdhd_pos + mdhd_header + (20 if version == 1 else 12))[0]
+    stts_pos, _, stts_header = next(_find_boxes(moov, moov_header, len(moov),
+                                                [b'trak', b'mdia', b'minf', b'stbl', b'stts']))
+    n_entries = struct.unpack_from('>I', moov, stts_pos + stts_header + 4)[0]
+    entries = np.frombuffer(moov, dtype='>u4', count=2 * n_entries, offset=stts_pos + stts_header + 8).reshape(-1, 2)
+    deltas = np.repeat(entries[:, 1].astype(np.int64), entries[:, 0])
+    return np.concatenate([[0], np.cumsum(deltas[:-1])])[:len(deltas)] * 1000.0 / timescale
+
+
+def _set_duration(data, pos, header, field_offsets, duration):
+    # field_offsets gives the byte offset of the duration field for version 0 and 1 boxes
+    version = data[pos + header]
+    offset = pos + header + field_offsets[version]
+    if version == 1:
+        struct.pack_into('>Q', data, offset, duration)
+    else:
+        struct.pack_into('>I', data, offset, min(duration, 0xFFFFFFFF))
+
+
+def embed_mp4_timestamps(filename, frame_times):
+    # Rewrites the stts (time-to-sample) table of an mp4 so each sample gets the duration
+    # measured during acquisition instead of the nominal 1/fps. Only the moov box changes, which
+    # cv2.VideoWriter writes after the media data, so no sample offsets move.
+    # Returns False (and leaves the file alone) if the layout is not the expected one. With fewer
+    # than 2 frames there is no interval to write, the file is left alone and True returned.
+    frame_times = np.asarray(frame_times, dtype=np.float64)
+    if len(frame_times) < 2:
+        return True
+    with open(filename, 'r+b') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        moov = _find_top_level_box(f, b'moov')
+        if moov is None:
+            return False
+        moov_pos, moov_size, moov_header = moov
+        if moov_pos + moov_size != file_size:
+            return False
+        f.seek(moov_pos)
+        moov = bytearray(f.read(moov_size))
+
+        traks = list(_find_boxes(moov, moov_header, len(moov), [b'trak']))
+        stts = list(_find_boxes(moov, moov_header, len(moov), [b'trak', b'mdia', b'minf', b'stbl', b'stts']))
+        mdhd = list(_find_boxes(moov, moov_header, len(moov), [b'trak', b'mdia', b'mdhd']))
+        if len(traks) != 1 or len(stts) != 1 or len(mdhd) != 1:
+            return False
+        stts_pos, stts_size, stts_header = stts[0]
+        n_samples = sum(struct.unpack_from('>I', moov, stts_pos + stts_header + 8 + 8 * i)[0]
+                        for i in range(struct.unpack_from('>I', moov, stts_pos + stts_header + 4)[0]))
+        if n_samples != len(frame_times):
+            return False
+
+        mdhd_pos, _, mdhd_header = mdhd[0]
+        version = moov[mdhd_pos + mdhd_header]
+        media_timescale = struct.unpack_from('>I', moov, mdhd_pos + mdhd_header + (20 if version == 1 else 12))[0]
+        pts = np.round((frame_times - frame_times[0]) * media_timescale).astype(np.int64)
+        deltas = np.maximum(np.diff(pts), 1)
+        deltas = np.append(deltas, int(np.median(deltas)))  # The last frame lasts a typical interval
+        media_duration = int(deltas.sum())
+
+        # Run-length encode the sample durations into stts entries
+        starts = np.flatnonzero(np.diff(deltas, prepend=-1))
+        counts = np.diff(np.append(starts, len(deltas)))
+        entries = np.empty((len(starts), 2), dtype='>u4')
+        entries[:, 0] = counts
+        entries[:, 1] = deltas[starts]
+        new_stts = struct.pack('>I4sII', 16 + entries.nbytes, b'stts', 0, len(starts)) + entries.tobytes()
+        growth = len(new_stts) - stts_size
+
+        mvhd_pos, _, mvhd_header = next(_find_boxes(moov, moov_header, len(moov), [b'mvhd']))
+        version = moov[mvhd_pos + mvhd_header]
+        movie_timescale = struct.unpack_from('>I', moov, mvhd_pos + mvhd_header + (20 if version == 1 else 12))[0]
+        movie_duration = int(round(media_duration * movie_timescale / media_timescale))
+
+        _set_duration(moov, mdhd_pos, mdhd_header, {0: 16, 1: 24}, media_duration)
+        _set_duration(moov, mvhd_pos, mvhd_header, {0: 16, 1: 24}, movie_duration)
+        for tkhd_pos, _, tkhd_header in _find_boxes(moov, moov_header, len(moov), [b'trak', b'tkhd']):
+            _set_duration(moov, tkhd_pos, tkhd_header, {0: 20, 1: 28}, movie_duration)
+        for elst_pos, _, elst_header in _find_boxes(moov, moov_header, len(moov), [b'trak', b'edts', b'elst']):
+            if struct.unpack_from('>I', moov, elst_pos + elst_header + 4)[0] == 1:
+                _set_duration(moov, elst_pos, elst_header, {0: 8, 1: 8}, movie_duration)
+
+        # Grow every box that contains stts, then splice the new table in
+        parents = [(0, moov_size, moov_header)]
+        for path in ([b'trak'], [b'trak', b'mdia'], [b'trak', b'mdia', b'minf'], [b'trak', b'mdia', b'minf', b'stbl']):
+            parents.append(next(_find_boxes(moov, moov_header, len(moov), path)))
+        if any(header != 8 for _, _, header in parents):
+            return False  # 64-bit sizes on container boxes, not written by cv2.VideoWriter
+        for pos, size, _ in parents:
+            struct.pack_into('>I', moov, pos, size + growth)
+        moov[stts_pos:stts_pos + stts_size] = new_stts
+
+        f.seek(moov_pos)
+        f.write(moov)
+        f.truncate()
+    return True
+
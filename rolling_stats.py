@@ -0,0 +1,99 @@
+from collections import deque
+import numpy as np
+
+# Histogram used for percentiles: 0.1 ms bins up to HIST_MAX, longer intervals share the last bin
+HIST_BIN = 1e-4
+HIST_MAX = 0.2
+
+
+class RollingIntervalStats:
+    # Inter-frame interval statistics over the last `window` frames, updated in constant
+    # time per frame: running sums for mean/std, monotonic deques for min/max and a fixed
+    # histogram for percentiles. Frames are counted as dropped when an interval spans more
+    # than one target period.
+    def __init__(self, window=100, target_interval=None):
+        self.window = window
+        self.target_interval = target_interval
+        self.values = np.zeros(window, dtype=np.float64)
+        self.hist = np.zeros(int(round(HIST_MAX / HIST_BIN)) + 1, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        self.values.fill(0)
+        self.hist.fill(0)
+        self.n = 0  # Intervals added since reset
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.min_queue = deque()  # (index, value) with increasing values
+        self.max_queue = deque()  # (index, value) with decreasing values
+        self.last_time = None
+        self.dropped_frames = 0
+
+    def _bin(self, value):
+        return min(int(value / HIST_BIN), len(self.hist) - 1)
+
+    def add_time(self, t):
+        if self.last_time is not None:
+            self.add_interval(t - self.last_time)
+        self.last_time = t
+
+    def add_interval(self, dt):
+        pos = self.n % self.window
+        if self.n >= self.window:
+            old = self.values[pos]
+            self.sum -= old
+            self.sumsq -= old * old
+            self.hist[self._bin(old)] -= 1
+        self.values[pos] = dt
+        self.sum += dt
+        self.sumsq += dt * dt
+        self.hist[self._bin(dt)] += 1
+
+        index = self.n
+        while self.min_queue and self.min_queue[-1][1] >= dt:
+            self.min_queue.pop()
+        self.min_queue.append((index, dt))
+        while self.max_queue and self.max_queue[-1][1] <= dt:
+            self.max_queue.pop()
+        self.max_queue.append((index, dt))
+        oldest = index - self.window + 1
+        if self.min_queue[0][0] < oldest:
+            self.min_queue.popleft()
+        if self.max_queue[0][0] < oldest:
+            self.max_queue.popleft()
+
+        if self.target_interval:
+            missing = int(round(dt / self.target_interval)) - 1
+            if missing > 0:
+                self.dropped_frames += missing
+
+        self.n += 1
+        if self.n % self.window == 0:
+            # Recompute the sums once per window so rounding errors cannot build up
+            self.sum = float(self.values.sum())
+            self.sumsq = float(np.dot(self.values, self.values))
+
+    def count(self):
+        return min(self.n, self.window)
+
+    def percentile(self, q):
+        n = self.count()
+        if n == 0:
+            return float('nan')
+        rank = int(np.ceil(q / 100.0 * n))
+        return (int(np.searchsorted(np.cumsum(self.hist), rank)) + 1) * HIST_BIN
+
+    def snapshot(self):
+        # All intervals in milliseconds
+        n = self.count()
+        if n == 0:
+            return {'count': 0, 'mean_ms': float('nan'), 'std_ms': float('nan'), 'min_ms': float('nan'),
+                    'max_ms': float('nan'), 'p99_ms': float('nan'), 'dropped_frames': self.dropped_frames}
+        mean = self.sum / n
+        return {'count': n,
+                'mean_ms': 1000 * mean,
+                'std_ms': 1000 * float(np.sqrt(max(self.sumsq / n - mean * mean, 0.0))),
+                'min_ms': 1000 * float(self.min_queue[0][1]),
+                'max_ms': 1000 * float(self.max_queue[0][1]),
+                'p99_ms': 1000 * self.percentile(99),
+                'dropped_frames': self.dropped_frames}
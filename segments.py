@@ -0,0 +1,230 @@
+import bisect
+import json
+import os
+import time
+import numpy as np
+from recording_format import read_mp4_keyframes, read_mp4_sample_times
+from writer_backends import BACKENDS, make_backend, read_raw
+
+# Segmented recording: the writer process closes the current file every segment_frames frames
+# and opens the next one ('<id>_eye1_000.mp4', '<id>_eye1_001.mp4', ...), so every finished
+# segment is a complete, playable file even if acquisition dies later. A JSON manifest next to
+# the segments maps recording frame indices to files and is rewritten whenever a segment is
+# opened or closed.
+
+MANIFEST_SUFFIX = '_segments.json'
+
+
+def segment_filename(filename, index):
+    base, ext = os.path.splitext(filename)
+    return f'{base}_{index:03d}{ext}'
+
+
+def manifest_filename(filename):
+    # '<id>_eye1.mp4' -> '<id>_eye1_segments.json'
+    return os.path.splitext(filename)[0] + MANIFEST_SUFFIX
+
+
+def write_manifest(filename, manifest):
+    # Written to a temporary file and renamed, so a crash never leaves a truncated manifest
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, filename)
+
+
+def read_manifest(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+class SegmentedBackend:
+    # Wraps a backend from writer_backends.py and rolls it over to a new file every
+    # segment_frames frames. Same interface as the backends.
+    def __init__(self, backend, filename, fps, shape, segment_frames):
+        self.backend = backend
+        self.filename = filename
+        self.fps = fps
+        self.shape = tuple(shape)
+        self.segment_frames = segment_frames
+        self.manifest_filename = manifest_filename(filename)
+        self.manifest = {'backend': backend, 'fps': fps, 'shape': list(self.shape),
+                         'segment_frames': segment_frames, 'complete': False, 'segments': []}
+        self.frames_written = 0
+        self.closed_stats = []
+        self.finished = False
+        self.t_open = time.perf_counter()
+        self.out = None
+        self._open_segment()
+
+    def _open_segment(self):
+        index = len(self.manifest['segments'])
+        self.out = make_backend(self.backend, segment_filename(self.filename, index), self.fps, self.shape)
+        # n_frames stays None until the segment is closed, a reader treats it as possibly damaged
+        self.manifest['segments'].append({'file': os.path.basename(self.out.filename),
+                                          'first_frame': self.frames_written, 'n_frames': None})
+        write_manifest(self.manifest_filename, self.manifest)
+
+    def _close_segment(self):
+        self.out.close()
+        self.manifest['segments'][-1]['n_frames'] = self.out.frames_written
+        self.closed_stats.append(self.out.stats())
+
+    def write(self, frame):
+        if self.out.frames_written == self.segment_frames:
+            self._close_segment()
+            self._open_segment()
+        self.out.write(frame)
+        self.frames_written += 1
+
+    def close(self):
+        self._close_segment()
+        self.finished = True
+        self.manifest['complete'] = True
+        write_manifest(self.manifest_filename, self.manifest)
+
+    def stats(self):
+        stats = self.closed_stats + ([] if self.finished else [self.out.stats()])
+        frames = sum(s['frames_written'] for s in stats)
+        n_bytes = sum(s['bytes_written'] for s in stats)
+        duration = time.perf_counter() - self.t_open
+        return {'backend': self.backend,
+                'frames_written': frames,
+                'bytes_written': n_bytes,
+                'bytes_per_s': n_bytes / duration if duration > 0 else 0.0,
+                'encode_ms_mean': sum(s['encode_ms_mean'] * s['frames_written'] for s in stats) / frames if frames else 0.0,
+                'segments': [dict(segment) for segment in self.manifest['segments']]}
+
+
+def _single_segment_manifest(filename, n_frames=None):
+    extension = os.path.splitext(filename)[1]
+    backend = next((name for name, cls in BACKENDS.items() if cls.extension == extension), 'mp4v')
+    if n_frames is None:
+        if backend == 'raw':
+            n_frames = len(read_raw(filename))
+        else:
+            import cv2
+            capture = cv2.VideoCapture(filename)
+            n_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            capture.release()
+    return {'backend': backend, 'complete': True,
+            'segments': [{'file': os.path.basename(filename), 'first_frame': 0, 'n_frames': n_frames}]}
+
+
+class SegmentedVideoReader:
+    # Random access to a segmented recording: frame i is read by opening only the segment that
+    # holds it. The last opened segment stays open, so sequential reads do not seek. Within an
+    # mp4 segment a seek goes to the keyframe before the frame (from the stss box, read once per
+    # segment) and decodes forward, unless decoding on from the current position is shorter.
+    # mp4 frame times are irregular (the measured times are embedded, see recording_format.py)
+    # while cv2 converts a frame number to a time with the mean frame rate, so seeks go by the
+    # keyframe's presentation time from the stts box, and the frame landed on is identified by
+    # its own presentation time before decoding forward.
+    # A recording without a manifest is read as a single segment.
+    def __init__(self, filename, n_frames=None):
+        # filename: the manifest, or the recording's unsegmented name ('<id>_eye1.mp4').
+        # n_frames: frame count of an unsegmented recording, default from the container.
+        if not filename.endswith(MANIFEST_SUFFIX) and os.path.exists(manifest_filename(filename)):
+            filename = manifest_filename(filename)
+        self.directory = os.path.dirname(os.path.abspath(filename))
+        if filename.endswith(MANIFEST_SUFFIX):
+            self.manifest = read_manifest(filename)
+        else:
+            self.manifest = _single_segment_manifest(filename, n_frames)
+        self.segments = self.manifest['segments']
+        self.keyframes = {}  # Segment index -> keyframe indices, None when every frame is one
+        self.sample_times = {}  # Segment index -> frame presentation times in ms, None if not an mp4
+        self.frames_decoded = 0
+        self.first_frames = [segment['first_frame'] for segment in self.segments]
+        last = self.segments[-1] if self.segments else None
+        self.n_frames = last['first_frame'] + (last['n_frames'] or 0) if last else 0
+        self.current = None  # (segment index, cv2.VideoCapture or raw array, next frame grab() returns)
+
+    def __len__(self):
+        return self.n_frames
+
+    def _find(self, frame_index):
+        if not 0 <= frame_index < self.n_frames:
+            raise IndexError(f'frame {frame_index} out of range, the recording has {self.n_frames} frames')
+        i = bisect.bisect_right(self.first_frames, frame_index) - 1
+        return i, frame_index - self.first_frames[i]
+
+    def locate(self, frame_index):
+        # (segment file, frame index within the segment)
+        i, local = self._find(frame_index)
+        return os.path.join(self.directory, self.segments[i]['file']), local
+
+    def _open(self, i):
+        self.close()
+        path = os.path.join(self.directory, self.segments[i]['file'])
+        if self.manifest['backend'] == 'raw':
+            self.current = [i, read_raw(path), 0]
+            return
+        import cv2
+        if i not in self.keyframes:
+            # FFV1 recordings are intra only and have constant frame times
+            is_mp4 = path.endswith('.mp4')
+            self.keyframes[i] = read_mp4_keyframes(path) if is_mp4 else None
+            self.sample_times[i] = read_mp4_sample_times(path) if is_mp4 else None
+        self.current = [i, cv2.VideoCapture(path), 0]
+
+    def _grabbed_frame(self, i, source):
+        # Grabs a frame and returns its index in segment i from its presentation time, or None
+        import cv2
+        if not source.grab():
+            return None
+        times = self.sample_times[i]
+        t = source.get(cv2.CAP_PROP_POS_MSEC)
+        j = min(int(np.searchsorted(times, t)), len(times) - 1)
+        if j > 0 and t - times[j - 1] < times[j] - t:
+            j -= 1
+        return j if abs(times[j] - t) < 1.0 else None
+
+    def _seek(self, i, key, local):
+        # Moves the open capture of segment i to keyframe key, or any frame from there up to
+        # local, and returns the index of the next frame grab() returns. In an mp4 the frame
+        # landed on has been grabbed already.
+        import cv2
+        source = self.current[1]
+        times = self.sample_times[i]
+        if times is None:
+            source.set(cv2.CAP_PROP_POS_FRAMES, key)
+            return key
+        # If cv2 overshoots, try once from the keyframe before, then from the start of the file
+        keyframes = self.keyframes[i]
+        earlier = [] if keyframes is None else [int(k) for k in keyframes[keyframes < key][-1:]]
+        for target in [key] + earlier:
+            source.set(cv2.CAP_PROP_POS_MSEC, times[target])
+            landed = self._grabbed_frame(i, source)
+            self.frames_decoded += 1
+            if landed is not None and landed <= local:
+                return landed + 1
+        self._open(i)
+        return 0
+
+    def read(self, frame_index):
+        i, local = self._find(frame_index)
+        if self.current is None or self.current[0] != i:
+            self._open(i)
+        _, source, position = self.current
+        if isinstance(source, np.ndarray):
+            return np.asarray(source[local])
+        keyframes = self.keyframes[i]
+        key = local if keyframes is None else int(keyframes[np.searchsorted(keyframes, local, side='right') - 1])
+        # Frame position - 1 was grabbed last, retrieving it again needs no seek
+        if position > local + 1 or position < key:
+            position = self._seek(i, key, local)
+            source = self.current[1]
+        while position <= local and source.grab():
+            position += 1
+            self.frames_decoded += 1
+        ret, frame = source.retrieve() if position == local + 1 else (False, None)
+        if not ret:
+            raise IOError(f'Could not decode frame {frame_index} ({self.segments[i]["file"]}, frame {local})')
+        self.current[2] = position
+        return frame
+
+    def close(self):
+        if self.current is not None and not isinstance(self.current[1], np.ndarray):
+            self.current[1].release()
+        self.current = None
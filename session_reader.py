@@ -0,0 +1,218 @@
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import pickle
+import numpy as np
+from acquisition import session_directory, sidecar_filename
+from frame_log import read_frame_log_arrays
+from recording_format import read_timestamp_index
+from segments import SegmentedVideoReader
+
+# Read access to recorded sessions for analysis. A session is the directory GOGO*<experiment_id>
+# records into (DATA_ROOT/<animal>/<experiment_id>/). Frames are decoded lazily per camera, by
+# index, slice or time range, with the camera's slot already cut out of side by side recordings.
+# Seeks go to the keyframe before the frame, see segments.SegmentedVideoReader.
+#   session = Session.open(DATA_ROOT, '2024-01-15_01_ESPM101')
+#   eye = session.camera(2)
+#   frames = eye[1000:1100]  # (100, height, width) uint8
+#   times, frames = eye.between(60.0, 61.0)
+
+META_SUFFIXES = ('_eyeMeta1.json', '_eyeMeta1.pickle')
+LEGACY_SLOTS = 3  # Recordings from before _eyeMeta1.json hold 3 cameras side by side
+
+
+def _find_meta(directory):
+    for suffix in META_SUFFIXES:
+        found = sorted(glob.glob(os.path.join(glob.escape(directory), '*' + suffix)))
+        if len(found) > 1:
+            raise ValueError(f"{directory} holds several recordings, open one of: {', '.join(found)}")
+        if found:
+            return found[0]
+    return None
+
+
+def find_sessions(data_root, animal=None):
+    # Session directories under data_root, or under one animal's directory, sorted by name
+    directories = glob.glob(os.path.join(glob.escape(data_root), animal or '*', '*'))
+    return sorted(directory for directory in directories if os.path.isdir(directory) and _find_meta(directory))
+
+
+class CameraFrames:
+    # Lazy frames of one camera. An int index gives a (height, width) uint8 frame, a slice or a
+    # list of indices a (n, height, width) array.
+    def __init__(self, session, camera_id, reader, slot):
+        self.session = session
+        self.camera_id = camera_id
+        self.reader = reader
+        self.slot = slot  # Position in a side by side recording, None for a file per camera
+
+    def __len__(self):
+        return self.session.n_frames
+
+    @property
+    def times(self):
+        return self.session.frame_times
+
+    def cut(self, frame):
+        # Recordings are gray, colour decoders return three equal channels
+        if frame.ndim == 3:
+            frame = frame[:, :, 0]
+        if self.slot is not None:
+            width = self.session.slot_width(frame)
+            frame = frame[:, self.slot * width:(self.slot + 1) * width]
+        return frame
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.read_batch(range(*key.indices(len(self))))
+        if np.ndim(key) == 0:
+            return self.read_batch([key])[0]
+        return self.read_batch(key)
+
+    def read_batch(self, indices, out=None):
+        return self.session.read_batch(indices, [self.camera_id], None if out is None else [out])[self.camera_id]
+
+    def between(self, t0, t1):
+        # (times, frames) of the frames recorded from t0 up to t1, seconds since the recording start
+        first, last = np.searchsorted(self.times, [t0, t1])
+        return np.asarray(self.times[first:last]), self[first:last]
+
+    def batches(self, batch_size=256, start=0, stop=None):
+        # Yields (first index, frames) over the recording, decoding each frame once
+        stop = len(self) if stop is None else min(stop, len(self))
+        for first in range(start, stop, batch_size):
+            yield first, self[first:min(first + batch_size, stop)]
+
+
+class Session:
+    def __init__(self, path):
+        # path: a session directory, or the video or _eyeMeta1 file of a recording
+        if os.path.isdir(path):
+            meta = _find_meta(path)
+            if meta is None:
+                raise FileNotFoundError(f'No recording found in {path}')
+        elif path.endswith(META_SUFFIXES):
+            meta = path
+        else:
+            meta = next((sidecar_filename(path, suffix) for suffix in META_SUFFIXES
+                         if os.path.exists(sidecar_filename(path, suffix))), None)
+            if meta is None:
+                raise FileNotFoundError(f'No _eyeMeta1 file next to {path}')
+        self.directory = os.path.dirname(os.path.abspath(meta))
+        base = next(meta[:-len(suffix)] for suffix in META_SUFFIXES if meta.endswith(suffix))
+        self.experiment_id = os.path.basename(base)
+
+        legacy = None
+        if meta.endswith('.json'):
+            with open(meta) as f:
+                self.metadata = json.load(f)
+        else:
+            with open(meta, 'rb') as f:
+                legacy = pickle.load(f)
+            self.metadata = {key: value for key, value in legacy.items()
+                             if key not in ('frame_times', 'grab_times', 'sync')}
+
+        # Frame times in seconds since the recording start, from the most detailed source
+        self.frame_log = None
+        if os.path.exists(base + '_eyeFrames1.bin'):
+            self.frame_log = read_frame_log_arrays(base + '_eyeFrames1.bin')
+            self.frame_times = self.frame_log['host_time']
+        elif os.path.exists(base + '_eyeTimes1.bin'):
+            self.frame_times = np.asarray(read_timestamp_index(base + '_eyeTimes1.bin')[1])
+        else:
+            if legacy is None:
+                with open(base + '_eyeMeta1.pickle', 'rb') as f:
+                    legacy = pickle.load(f)
+            self.frame_times = np.asarray(legacy['frame_times'], dtype=np.float64)
+        self.n_frames = len(self.frame_times)
+
+        self.camera_ids = list(self.metadata.get('camera_ids') or range(LEGACY_SLOTS))
+        self.rois = self.metadata.get('rois') or [None] * len(self.camera_ids)
+        save_size = self.metadata.get('save_size')
+        self.save_width = save_size[0] if save_size else None
+        video_files = self.metadata.get('video_files') or [os.path.basename(base) + '_eye1.mp4']
+        self.readers = [SegmentedVideoReader(os.path.join(self.directory, name), n_frames=self.n_frames)
+                        for name in video_files]
+        if self.metadata.get('multi_stream'):
+            self.cameras = {cam: CameraFrames(self, cam, reader, None) for cam, reader in zip(self.camera_ids, self.readers)}
+        else:
+            self.cameras = {cam: CameraFrames(self, cam, self.readers[0], slot) for slot, cam in enumerate(self.camera_ids)}
+
+    @classmethod
+    def open(cls, data_root, experiment_id):
+        return cls(session_directory(data_root, experiment_id))
+
+    def camera(self, camera_id):
+        if camera_id not in self.cameras:
+            raise KeyError(f'Camera {camera_id} not in this session, it has {self.camera_ids}')
+        return self.cameras[camera_id]
+
+    def slot_width(self, frame):
+        if self.save_width is None:
+            self.save_width = frame.shape[1] // LEGACY_SLOTS
+        return self.save_width
+
+    def read_batch(self, indices, camera_ids=None, out=None):
+        # {camera id: (n, height, width) array} of the frames at indices. Frames are decoded in
+        # index order and every decoded frame serves all cameras stored in it.
+        camera_ids = self.camera_ids if camera_ids is None else list(camera_ids)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        indices = np.where(indices < 0, indices + self.n_frames, indices)
+        cameras = [self.camera(cam) for cam in camera_ids]
+        by_reader = {}
+        for cam in cameras:
+            by_reader.setdefault(id(cam.reader), (cam.reader, []))[1].append(cam)
+        results = dict(zip(camera_ids, out)) if out is not None else {}
+        for reader, reader_cameras in by_reader.values():
+            for j in np.argsort(indices, kind='stable'):
+                frame = reader.read(int(indices[j]))
+                for cam in reader_cameras:
+                    image = cam.cut(frame)
+                    if cam.camera_id not in results:
+                        results[cam.camera_id] = np.empty((len(indices),) + image.shape, dtype=np.uint8)
+                    results[cam.camera_id][j] = image
+        for cam in cameras:
+            if cam.camera_id not in results:  # No indices
+                results[cam.camera_id] = np.zeros((0, 0, 0), dtype=np.uint8)
+        return results
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
+
+
+def _apply(task):
+    function, path = task
+    session = Session(path)
+    try:
+        return path, function(session)
+    finally:
+        session.close()
+
+
+def map_sessions(function, paths, processes=None):
+    # Runs function(session) on every session in a pool of worker processes and yields
+    # (path, result) as they finish. function must be defined at module level so it can be
+    # sent to the workers.
+    with mp.get_context('spawn').Pool(processes) as pool:
+        yield from pool.imap_unordered(_apply, [(function, path) for path in paths])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise recorded sessions')
+    parser.add_argument('path', help='session directory, recording file, or a data root with --all')
+    parser.add_argument('--all', action='store_true', help='every session under the data root path')
+    args = parser.parse_args()
+    for path in find_sessions(args.path) if args.all else [args.path]:
+        session = Session(path)
+        duration = float(session.frame_times[-1]) if session.n_frames else 0.0
+        print(f"{session.experiment_id}: {session.n_frames} frames over {duration:.1f} s, "
+              f"{session.metadata.get('backend', 'mp4v')}, cameras {session.camera_ids}, "
+              f"{sum(len(reader.segments) for reader in session.readers)} video file(s)")
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
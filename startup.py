@@ -0,0 +1,177 @@
+import threading
+import time
+from acquisition import DummyArduino
+
+# Startup path: the control server is started before any device is touched, then every camera
+# and the serial port are opened on their own worker thread with a timeout, and the acquisition
+# is built from whatever opened. A camera's timeout also covers negotiating its settings and
+# reading its first frame (camera_settings.negotiate), which can hang on DirectShow. Commands arriving meanwhile are answered with the startup
+# state, GOGO and STOP wait for the acquisition (see control_server.py). A device that fails or
+# does not open in time is reported and replaced: a camera by an UnavailableCamera whose slot
+# stays black, the Arduino by DummyArduino.
+
+CAMERA_OPEN_TIMEOUT = 10.0  # Seconds, DirectShow can take several seconds per camera
+SERIAL_OPEN_TIMEOUT = 5.0
+
+
+class UnavailableCamera:
+    # Stands in for a camera that could not be opened. grab() fails once a second, so the
+    # reader thread idles and the frames are flagged missing in the frame log.
+    def __init__(self):
+        self.released = threading.Event()
+
+    def grab(self):
+        self.released.wait(1.0)
+        return False
+
+    def retrieve(self, image=None, flag=0):
+        return False, None
+
+    def read(self, image=None):
+        return False, None
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return 0.0
+
+    def isOpened(self):
+        return False
+
+    def release(self):
+        self.released.set()
+
+
+def _release(device):
+    for name in ('release', 'close'):
+        if hasattr(device, name):
+            getattr(device, name)()
+            return
+
+
+class Startup:
+    # Tracks the time from process start to a running acquisition, per device and overall.
+    # Times are perf_counter seconds since t0.
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.state = 'starting'  # 'starting', 'ready' or 'failed'
+        self.devices = {}  # name -> {'state': 'opening'/'ready'/'failed'/'timeout', 'opened_s', 'error'}
+        self.phases = {}  # Phase name -> seconds since t0 it finished
+        self.error = None
+        self.acquisition = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.t0
+
+    def mark(self, phase):
+        self.phases[phase] = self.elapsed()
+
+    def _open(self, name, opener, results):
+        try:
+            device, error = opener(), None
+            if hasattr(device, 'isOpened') and not device.isOpened():
+                error = 'could not be opened'
+            elif isinstance(device, DummyArduino):
+                error = 'no Arduino found'
+        except Exception as exc:
+            device, error = None, f'{type(exc).__name__}: {exc}'
+        with self.lock:
+            entry = self.devices[name]
+            if entry['state'] == 'timeout':
+                # Too late, the acquisition was built without it
+                if device is not None:
+                    _release(device)
+                return
+            entry.update(state='failed' if error else 'ready', opened_s=self.elapsed(), error=error)
+            if error and device is not None:
+                _release(device)
+            results[name] = None if error else device
+
+    def open_devices(self, openers):
+        # openers: {name: (callable returning the device, timeout)}, all opened at the same time.
+        # Returns {name: device, or None if it failed or timed out}.
+        results = {}
+        threads = []
+        for name, (opener, timeout) in openers.items():
+            self.devices[name] = {'state': 'opening', 'opened_s': None, 'error': None}
+            thread = threading.Thread(target=self._open, args=(name, opener, results), daemon=True,
+                                      name=f'Open-{name}')
+            thread.start()
+            threads.append((name, thread, time.perf_counter() + timeout))
+        for name, thread, deadline in threads:
+            thread.join(max(deadline - time.perf_counter(), 0.0))
+            with self.lock:
+                if self.devices[name]['state'] == 'opening':
+                    self.devices[name]['state'] = 'timeout'
+        with self.lock:
+            return {name: results.get(name) for name in openers}
+
+    def run(self, cameras, open_camera, open_serial, build, control_server=None, configure=None):
+        # Opens the cameras and the serial device in parallel, then build(captures, serial,
+        # camera_info) returns the Acquisition, which is handed to the control server. Returns it,
+        # or None if building failed. configure(position, capture) returns (capture, settings info)
+        # like camera_settings.negotiate and runs on the camera's thread once it is open.
+        # camera_info holds its info per camera, None where the camera did not open in time.
+        try:
+            camera_info = [None] * len(cameras)
+            # Cameras opened twice (e.g. two synthetic sources) get one device each
+            names = [f'camera {cam}' if cameras.count(cam) == 1 else f'camera {cam} ({i})'
+                     for i, cam in enumerate(cameras)]
+
+            def open_configured(i, cam):
+                capture = open_camera(cam)
+                if configure is None or not capture.isOpened():
+                    return capture
+                try:
+                    capture, camera_info[i] = configure(i, capture)
+                except Exception:
+                    _release(capture)
+                    raise
+                return capture
+
+            openers = {name: (lambda i=i, cam=cam: open_configured(i, cam), CAMERA_OPEN_TIMEOUT)
+                       for i, (name, cam) in enumerate(zip(names, cameras))}
+            openers['serial'] = (open_serial, SERIAL_OPEN_TIMEOUT)
+            devices = self.open_devices(openers)
+            self.mark('devices')
+            for name, entry in self.devices.items():
+                if entry['state'] != 'ready':
+                    print(f"Startup: {name} {entry['state']}{': ' + entry['error'] if entry['error'] else ''}")
+            captures = [devices[name] or UnavailableCamera() for name in names]
+            camera_info = [info if devices[name] is not None else None for name, info in zip(names, camera_info)]
+            acquisition = build(captures, devices['serial'] or DummyArduino(), camera_info)
+            self.mark('acquisition')
+            if control_server is not None:
+                control_server.attach(acquisition)
+            self.acquisition = acquisition
+            self.state = 'ready'
+            self.mark('ready')
+            print(f"Ready {self.phases['ready']:.2f} s after start (devices {self.phases['devices']:.2f} s, "
+                  f"acquisition {self.phases['acquisition'] - self.phases['devices']:.2f} s)")
+            return acquisition
+        except Exception as error:
+            self.error = f'{type(error).__name__}: {error}'
+            self.state = 'failed'
+            print(f'Startup failed: {self.error}')
+            return None
+        finally:
+            self.done.set()
+
+    def start(self, *args, **kwargs):
+        # run() on a background thread, for the Qt window
+        self.thread = threading.Thread(target=self.run, args=args, kwargs=kwargs, daemon=True, name='Startup')
+        self.thread.start()
+
+    def wait(self, timeout=None):
+        # The acquisition once startup finished, None if it failed or timeout passed
+        self.done.wait(timeout)
+        return self.acquisition
+
+    def snapshot(self):
+        with self.lock:
+            return {'state': self.state, 'elapsed_s': self.elapsed(), 'phases': dict(self.phases),
+                    'devices': {name: dict(entry) for name, entry in self.devices.items()}, 'error': self.error}
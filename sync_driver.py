@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+import numpy as np
+
+# Sync output to the Arduino (vid_acq_arduino.ino: 'T' toggles pin 8, 'H' sets it high, 'L' low).
+# The frame loop only puts commands on a queue. A dedicated thread writes them to the serial
+# port and records host perf_counter times around every write, so the recording can be aligned
+# with ephys or DAQ clocks offline and a slow USB write never delays a frame.
+
+SYNC_MODES = ('toggle', 'pulse')
+
+# Fields of every sent command, times are perf_counter seconds
+EVENT_DTYPE = np.dtype([('frame_index', '<i8'),  # Frame the command belongs to, -1 outside the frame loop
+                        ('command', 'S1'),
+                        ('queued_time', '<f8'),  # Put on the queue by the frame loop
+                        ('write_start', '<f8'),  # Handed to the serial port
+                        ('write_end', '<f8')])  # write() and flush() returned, the bytes have left the host
+
+
+class SyncSchedule:
+    # Which frames get a sync command. mode='toggle' sends 'T' every `every` frames (every=1 gives
+    # a square wave at half the frame rate). mode='pulse' sets the pin high every `every` frames
+    # and low again pulse_frames later.
+    def __init__(self, every=100, mode='toggle', pulse_frames=1):
+        if mode not in SYNC_MODES:
+            raise ValueError(f"Unknown sync mode '{mode}', choose from {', '.join(SYNC_MODES)}")
+        if every < 1 or (mode == 'pulse' and not 0 < pulse_frames < every):
+            raise ValueError('Pulse schedules need 0 < pulse_frames < every')
+        self.every = every
+        self.mode = mode
+        self.pulse_frames = pulse_frames
+
+    def command_for(self, frame_count):
+        # frame_count is the number of frames recorded including this one
+        phase = frame_count % self.every
+        if self.mode == 'toggle':
+            return b'T' if phase == 0 else None
+        if phase == 0:
+            return b'H'
+        if phase == self.pulse_frames and frame_count > self.every:
+            return b'L'
+        return None
+
+    def describe(self):
+        return {'every': self.every, 'mode': self.mode, 'pulse_frames': self.pulse_frames}
+
+
+def next_level(level, command):
+    # Pin level after the Arduino executed command
+    if command == b'T':
+        return level ^ 1
+    return 1 if command == b'H' else 0
+
+
+class SyncDriver(threading.Thread):
+    def __init__(self, serial, name='SyncDriver'):
+        super().__init__(daemon=True, name=name)
+        self.serial = serial
+        self.queue = queue.SimpleQueue()
+        self.events = []
+        self.events_lock = threading.Lock()
+        self.pending = 0  # Commands queued but not written yet
+        self.idle = threading.Condition(self.events_lock)
+        self.write_errors = 0
+
+    def send(self, command, frame_index=-1):
+        # Never blocks, safe to call from the frame loop
+        with self.events_lock:
+            self.pending += 1
+        self.queue.put((command, frame_index, time.perf_counter()))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            command, frame_index, queued_time = item
+            write_start = time.perf_counter()
+            try:
+                self.serial.write(command)
+                if hasattr(self.serial, 'flush'):
+                    self.serial.flush()  # Wait until the bytes are out, so write_end is the send time
+            except Exception as error:
+                self.write_errors += 1
+                print(f'Sync command {command!r} failed: {error}')
+            write_end = time.perf_counter()
+            with self.events_lock:
+                self.events.append((frame_index, command, queued_time, write_start, write_end))
+                self.pending -= 1
+                if self.pending == 0:
+                    self.idle.notify_all()
+
+    def wait_idle(self, timeout=2.0):
+        # Waits until every queued command was written. Returns False on timeout.
+        with self.events_lock:
+            return self.idle.wait_for(lambda: self.pending == 0, timeout)
+
+    def take_events(self):
+        # Structured array (EVENT_DTYPE) of the commands written since the last call
+        with self.events_lock:
+            events, self.events = self.events, []
+        return np.array(events, dtype=EVENT_DTYPE)
+
+    def stop(self):
+        self.queue.put(None)
+        if self.is_alive():
+            self.join(timeout=2.0)
+
+
+class LoopbackSerial:
+    # Stands in for the Arduino in tests and without hardware. Keeps the pin level the sketch
+    # would have and the host time of every command received. latency simulates a slow port.
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.level = 0
+        self.received = []  # (perf_counter time, command)
+
+    def write(self, data):
+        if self.latency:
+            time.sleep(self.latency)
+        for command in bytes(data):
+            command = bytes([command])
+            self.level = next_level(self.level, command)
+            self.received.append((time.perf_counter(), command))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+import pytest
+from acquisition import Acquisition
+from frame_sources import SyntheticSource
+from sync_driver import LoopbackSerial
+
+
+@pytest.fixture
+def acq(tmp_path):
+    acquisition = Acquisition([SyntheticSource(64, 48, 30.0)], str(tmp_path), 30.0, (64, 48), (32, 32),
+                              arduino=LoopbackSerial(), save_pickle=False)
+    yield acquisition
+    acquisition.close()
+
+
+@pytest.mark.parametrize('message', ['GOGO*x*notanumber', 'GOGO*2024-01-15_01_ESPM101*notanumber',
+                                     'GOGO*2024-01-15_01_ESPM101*nan', 'GOGO*short', 'GOGO*2024-01-15_01_',
+                                     'GOGO*2024-01-15_01_../../etc', 'GOGO*'])
+def test_malformed_gogo_has_no_side_effects(acq, tmp_path, message):
+    acq.experiment_id = 'running'
+    reply = acq.handle_command(message)
+    assert reply['ok'] is False
+    assert 'error' in reply
+    assert acq.experiment_id == 'running'
+    assert os.listdir(tmp_path) == []
+
+
+def test_stop_without_recording(acq):
+    assert acq.handle_command('STOP') == {'ok': False, 'error': 'not recording'}
+
+
+@pytest.mark.parametrize('roi', [(40, 0, 32, 16), (0, 40, 16, 16), (70, 50, 8, 8), (-1, 0, 8, 8), (0, 0, 0, 8)])
+def test_roi_outside_the_camera_frame(tmp_path, roi):
+    with pytest.raises(ValueError, match='Camera 0: ROI'):
+        Acquisition([SyntheticSource(64, 48, 30.0)], str(tmp_path), 30.0, (32, 16), (32, 32),
+                    arduino=LoopbackSerial(), rois={0: roi})
+
+
+def test_roi_at_the_frame_edge(tmp_path):
+    acquisition = Acquisition([SyntheticSource(64, 48, 30.0)], str(tmp_path), 30.0, (32, 16), (32, 32),
+                              arduino=LoopbackSerial(), rois={0: (32, 32, 32, 16)})
+    assert acquisition.cameras[0]['path'] == 'bgr->gray, roi 32x16, copy'
+    acquisition.close()
+
+
+def test_failed_start_releases_the_writers(acq, tmp_path):
+    # The frame log cannot be created, after the writer process and the index have been opened
+    os.mkdir(tmp_path / 'x_eyeFrames1.bin')
+    with pytest.raises(OSError):
+        acq.start_recording(str(tmp_path / 'x_eye1.mp4'))
+    assert not acq.recording and acq.writers == []
+    assert not multiprocessing.active_children()
+    reply = acq.handle_command('GOGO*2024-01-15_01_ESPM101')
+    assert reply['experiment_id'] == '2024-01-15_01_ESPM101' and acq.recording
+    acq.stop_recording()
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from clock_align import align_clocks
+
+
+def daq_clock(host_times):
+    # DAQ time of a host time: offset, 30 ppm rate difference and a slow wander of the rate
+    return 12.3 + (1 + 30e-6) * host_times + 0.002 * np.sin(host_times / 300.0)
+
+
+def session(rng, n_frames, sync_every, late_edges=0, missing=0, extra=0, host_jitter=0.001):
+    # Frame times at 30 fps with a few frames dropped, sync edges on every sync_every-th frame.
+    # Host edge times carry the serial write jitter, the DAQ edges are the true edge times.
+    intervals = np.full(n_frames - 1, 1 / 30.0)
+    intervals[rng.choice(n_frames - 1, 5, replace=False)] *= 2
+    frame_times = np.append(0.0, np.cumsum(intervals))
+    true_edges = frame_times[sync_every - 1::sync_every]
+    host_edges = true_edges + rng.normal(0, host_jitter, len(true_edges))
+    daq_edges = np.delete(daq_clock(true_edges), rng.choice(len(true_edges), missing, replace=False))
+    daq_edges = np.sort(np.append(daq_edges, rng.uniform(daq_edges[0], daq_edges[-1], extra)))
+    return frame_times, host_edges, daq_edges[late_edges:]
+
+
+@pytest.mark.parametrize('sync_every, late_edges', [(1, 0), (1, 7), (10, 3)])
+def test_frame_times_on_the_daq_clock(sync_every, late_edges):
+    rng = np.random.default_rng(sync_every + late_edges)
+    frame_times, host_edges, daq_edges = session(rng, 30 * 600, sync_every, late_edges, missing=20, extra=10)
+    mapping, diagnostics = align_clocks(host_edges, daq_edges)
+    assert np.abs(mapping(frame_times) - daq_clock(frame_times)).max() < 0.0005
+    assert abs(diagnostics['rate_ppm'] - 30.0) < 5.0
+    assert diagnostics['n_matched'] >= len(host_edges) - late_edges - 20
+
+
+def test_start_hint_for_a_regular_train():
+    rng = np.random.default_rng(0)
+    frame_times, host_edges, daq_edges = session(rng, 30 * 60, 1, late_edges=4, host_jitter=0.0)
+    mapping, _ = align_clocks(host_edges, daq_edges, start_hint=12.3)
+    assert np.abs(mapping(frame_times) - daq_clock(frame_times)).max() < 0.0005
+
+
+def test_too_few_edges():
+    with pytest.raises(ValueError):
+        align_clocks([1.0], [1.0, 2.0])
@@ -0,0 +1,105 @@
+import json
+import socket
+import threading
+import time
+from control_server import ControlServer
+from coordinator import Coordinator, Node
+
+
+class StaleNode(threading.Thread):
+    # Answers every PING with a reply carrying another tag, as a late reply to an earlier PING
+    # would, and whose times would give a 10 s offset, followed by the real reply
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            tag = data.decode('utf-8').partition('*')[2]
+            now = time.perf_counter()
+            stale = {'ok': True, 'ack': 'PING', 'tag': 'stale', 'received': now + 10.0, 'replied': now + 10.0}
+            self.sock.sendto(json.dumps(stale).encode('utf-8'), addr)
+            time.sleep(0.002)
+            now = time.perf_counter()
+            reply = {'ok': True, 'ack': 'PING', 'tag': tag, 'received': now, 'replied': now}
+            self.sock.sendto(json.dumps(reply).encode('utf-8'), addr)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.sock.close()
+
+
+def test_sync_clocks_ignores_replies_to_other_pings():
+    node_server = StaleNode()
+    node_server.start()
+    coordinator = Coordinator([Node('127.0.0.1', node_server.port)])
+    try:
+        coordinator.sync_clocks(5)
+    finally:
+        coordinator.close()
+        node_server.stop()
+    node = coordinator.nodes[0]
+    # Same clock on both sides, so the offset is within the round trip
+    assert abs(node.offset) < node.rtt
+    assert node.rtt >= 0.002
+
+
+def test_control_server_echoes_ping_tag():
+    server = ControlServer(None, 0, host='127.0.0.1')
+    server.start()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(2.0)
+    try:
+        sock.sendto(b'PING*42', ('127.0.0.1', server.port))
+        reply = json.loads(sock.recvfrom(65536)[0])
+        sock.sendto(b'PING', ('127.0.0.1', server.port))
+        untagged = json.loads(sock.recvfrom(65536)[0])
+    finally:
+        sock.close()
+        server.stop()
+    assert reply['ok'] and reply['ack'] == 'PING' and reply['tag'] == '42'
+    assert 'tag' not in untagged
+
+
+class RecordingAcquisition:
+    # Handles GOGO like Acquisition.handle_command and nothing else
+    def __init__(self):
+        self.messages = []
+
+    def handle_command(self, message):
+        self.messages.append(message)
+        return {'experiment_id': message[5:]} if message.startswith('GOGO*') else None
+
+    def stats_snapshot(self):
+        return {'recording': False}
+
+
+def test_control_server_command_case_and_unhandled_commands():
+    acq = RecordingAcquisition()
+    server = ControlServer(acq, 0, host='127.0.0.1')
+    server.start()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(2.0)
+    replies = []
+    try:
+        for message in (b'gogo*2026-01-01_01_TEST', b'stop', b'STATX', b'status'):
+            sock.sendto(message, ('127.0.0.1', server.port))
+            replies.append(json.loads(sock.recvfrom(65536)[0]))
+    finally:
+        sock.close()
+        server.stop()
+    gogo, stop, statx, status = replies
+    assert acq.messages == ['GOGO*2026-01-01_01_TEST', 'STOP']
+    assert gogo['ok'] and gogo['ack'] == 'GOGO' and gogo['experiment_id'] == '2026-01-01_01_TEST'
+    assert stop['ok'] is False and stop['ack'] == 'STOP'
+    assert statx['ok'] is False and 'recording' not in statx
+    assert status['ok'] and status['ack'] == 'STATUS' and status['recording'] is False
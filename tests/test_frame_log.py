@@ -0,0 +1,52 @@
+import numpy as np
+from frame_log import FLUSH_EVERY, SYNC_LEVEL, SYNC_TOGGLED, FrameLogWriter, read_frame_log, read_frame_log_arrays
+
+
+def write_log(path, n_frames, n_cameras=2):
+    writer = FrameLogWriter(path, n_cameras, {'target_fps': 30.0, 'camera_ids': [2, 1]})
+    for i in range(n_frames):
+        writer.append(i, i / 30.0, [i / 30.0 - 0.01 * (cam + 1) for cam in range(n_cameras)],
+                      SYNC_TOGGLED | SYNC_LEVEL if i % 10 == 0 else 0, [i + cam for cam in range(n_cameras)],
+                      [cam for cam in range(n_cameras)])
+    return writer
+
+
+def test_frame_log_round_trip(tmp_path):
+    path = str(tmp_path / 'rec_eyeFrames1.bin')
+    n_frames = 2 * FLUSH_EVERY + 7
+    write_log(path, n_frames).close()
+
+    metadata, records = read_frame_log(path)
+    assert metadata == {'target_fps': 30.0, 'camera_ids': [2, 1]}
+    assert len(records) == n_frames
+    np.testing.assert_array_equal(records['frame_index'], np.arange(n_frames))
+    np.testing.assert_array_equal(records['host_time'], np.arange(n_frames) / 30.0)
+    np.testing.assert_array_equal(records['grab_times'][:, 1], np.arange(n_frames) / 30.0 - 0.02)
+    np.testing.assert_array_equal(np.flatnonzero(records['sync']), np.arange(0, n_frames, 10))
+    np.testing.assert_array_equal(records['cam_seq'][5], [5, 6])
+    np.testing.assert_array_equal(records['cam_flags'][5], [0, 1])
+
+    arrays = read_frame_log_arrays(path)
+    assert arrays['metadata'] == metadata
+    np.testing.assert_array_equal(arrays['host_time'], records['host_time'])
+
+
+def test_frame_log_flushed_batches_survive_a_crash(tmp_path):
+    # Without close() the records of the last unfinished batch are lost, the rest are readable,
+    # and a record cut short is ignored
+    path = str(tmp_path / 'rec_eyeFrames1.bin')
+    writer = write_log(path, FLUSH_EVERY + 3)
+    writer.file.write(b'\0' * 5)
+    writer.file.flush()
+    _, records = read_frame_log(path)
+    assert len(records) == FLUSH_EVERY
+    np.testing.assert_array_equal(records['frame_index'], np.arange(FLUSH_EVERY))
+    writer.file.close()
+
+
+def test_empty_frame_log(tmp_path):
+    path = str(tmp_path / 'rec_eyeFrames1.bin')
+    write_log(path, 0).close()
+    metadata, records = read_frame_log(path)
+    assert len(records) == 0
+    assert records.dtype.names == ('frame_index', 'host_time', 'grab_times', 'sync', 'cam_seq', 'cam_flags')
@@ -0,0 +1,31 @@
+import time
+from frame_scheduler import FrameScheduler
+
+
+def run_scheduler(callback, fps, duration):
+    scheduler = FrameScheduler(callback, fps)
+    scheduler.start()
+    time.sleep(duration)
+    scheduler.stop()
+    return scheduler
+
+
+def test_ticks_go_on_after_a_callback_raises(capsys):
+    def callback():
+        raise RuntimeError('broken tick')
+
+    scheduler = run_scheduler(callback, 200.0, 0.3)
+    assert scheduler.ticks > 10
+    assert scheduler.callback_errors == scheduler.ticks
+    assert scheduler.stats()['last_error'] == 'RuntimeError: broken tick'
+    output = capsys.readouterr()
+    assert output.err.count('Traceback') == 1
+    assert output.out.count('[SCHED]') <= 2
+
+
+def test_missed_deadlines_are_summarised(capsys):
+    scheduler = run_scheduler(lambda: time.sleep(0.012), 200.0, 0.3)
+    assert scheduler.missed_deadlines > 10
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('[SCHED]')]
+    # One line for the first miss and one summary of the rest when the scheduler stops
+    assert len(lines) == 2
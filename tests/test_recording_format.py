@@ -0,0 +1,106 @@
+import struct
+import cv2
+import numpy as np
+import pytest
+from recording_format import (TIMESTAMP_FLUSH_EVERY, TimestampIndexWriter, _find_boxes, _find_top_level_box,
+                              embed_mp4_timestamps, frame_at_time, read_mp4_keyframes, read_mp4_sample_times,
+                              read_timestamp_index)
+
+FPS = 30.0
+
+
+def write_mp4(path, n_frames, size=(160, 120)):
+    # Moving noise, so mp4v writes predicted frames between keyframes
+    background = np.random.default_rng(0).integers(0, 256, size[::-1], dtype=np.uint8)
+    out = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), FPS, size, isColor=False)
+    for i in range(n_frames):
+        out.write(np.roll(background, 3 * i, axis=1))
+    out.release()
+
+
+def irregular_times(n_frames):
+    # Jittered 30 fps with two missed deadlines
+    rng = np.random.default_rng(1)
+    intervals = 1 / FPS + rng.uniform(-0.004, 0.004, n_frames - 1)
+    intervals[20] += 3 / FPS
+    intervals[41] += 1 / FPS
+    return np.concatenate([[0.0], np.cumsum(intervals)])
+
+
+def read_timing(path):
+    # (media timescale, mdhd duration, per-sample durations from stts) of the only track
+    with open(path, 'rb') as f:
+        moov_pos, moov_size, moov_header = _find_top_level_box(f, b'moov')
+        f.seek(moov_pos)
+        moov = f.read(moov_size)
+    mdhd_pos, _, mdhd_header = next(_find_boxes(moov, moov_header, len(moov), [b'trak', b'mdia', b'mdhd']))
+    assert moov[mdhd_pos + mdhd_header] == 0
+    timescale, duration = struct.unpack_from('>II', moov, mdhd_pos + mdhd_header + 12)
+    stts_pos, _, stts_header = next(_find_boxes(moov, moov_header, len(moov),
+                                                [b'trak', b'mdia', b'minf', b'stbl', b'stts']))
+    n_entries = struct.unpack_from('>I', moov, stts_pos + stts_header + 4)[0]
+    entries = np.frombuffer(moov, dtype='>u4', count=2 * n_entries, offset=stts_pos + stts_header + 8).reshape(-1, 2)
+    return timescale, duration, np.repeat(entries[:, 1], entries[:, 0]).astype(np.int64)
+
+
+def test_embed_mp4_timestamps(tmp_path):
+    path = tmp_path / 'rec_eye1.mp4'
+    n_frames = 60
+    write_mp4(path, n_frames)
+    keyframes = read_mp4_keyframes(str(path))
+    times = irregular_times(n_frames)
+
+    assert embed_mp4_timestamps(str(path), times)
+
+    timescale, duration, deltas = read_timing(path)
+    assert len(deltas) == n_frames
+    assert duration == deltas.sum()
+    np.testing.assert_allclose(np.cumsum(deltas)[:-1] / timescale, times[1:], atol=1.0 / timescale)
+    np.testing.assert_array_equal(read_mp4_keyframes(str(path)), keyframes)
+    np.testing.assert_allclose(read_mp4_sample_times(str(path)), 1000 * times, atol=1000.0 / timescale)
+
+    capture = cv2.VideoCapture(str(path))
+    assert int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) == n_frames
+    positions = []
+    while True:
+        ret, _ = capture.read()
+        if not ret:
+            break
+        positions.append(capture.get(cv2.CAP_PROP_POS_MSEC))
+    capture.release()
+    assert len(positions) == n_frames
+    np.testing.assert_allclose(positions, 1000 * times, atol=1.0)
+
+
+def test_embed_mp4_timestamps_frame_count_mismatch(tmp_path):
+    path = tmp_path / 'rec_eye1.mp4'
+    write_mp4(path, 50)
+    before = path.read_bytes()
+    assert not embed_mp4_timestamps(str(path), irregular_times(60))
+    assert path.read_bytes() == before
+
+
+@pytest.mark.parametrize('n_frames', [0, 1])
+def test_embed_mp4_timestamps_nothing_to_do(tmp_path, n_frames):
+    # A one frame trailing segment or an empty recording is not an error
+    path = tmp_path / 'rec_eye1_001.mp4'
+    write_mp4(path, n_frames)
+    before = path.read_bytes()
+    assert embed_mp4_timestamps(str(path), irregular_times(60)[:n_frames])
+    assert path.read_bytes() == before
+
+
+def test_timestamp_index_round_trip(tmp_path):
+    path = str(tmp_path / 'rec_eyeTimes1.bin')
+    times = irregular_times(2 * TIMESTAMP_FLUSH_EVERY + 5)
+    writer = TimestampIndexWriter(path, FPS, 1700000000.5)
+    for t in times:
+        writer.append(t)
+    writer.close()
+
+    header, read_back = read_timestamp_index(path)
+    assert header == {'fps': FPS, 'start_time': 1700000000.5, 'n_frames': len(times)}
+    np.testing.assert_array_equal(read_back, times)
+    assert frame_at_time(read_back, times[10]) == 10
+    assert frame_at_time(read_back, (times[10] + times[11]) / 2) == 10
+    assert frame_at_time(read_back, -1.0) == 0
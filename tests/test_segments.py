@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+import pytest
+from recording_format import embed_mp4_timestamps, read_mp4_keyframes
+from segments import SegmentedVideoReader
+from test_recording_format import irregular_times, write_mp4
+
+
+def decode_all(path):
+    capture = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+@pytest.fixture
+def vfr_mp4(tmp_path):
+    # Jittered frame times with missed deadlines embedded, as stop_recording leaves them
+    path = tmp_path / 'rec_eye1.mp4'
+    n_frames = 120
+    write_mp4(path, n_frames)
+    times = irregular_times(n_frames)
+    times[60:] += 0.5  # A long stall
+    assert embed_mp4_timestamps(str(path), times)
+    return path
+
+
+def test_random_access_matches_sequential_decode(vfr_mp4):
+    expected = decode_all(vfr_mp4)
+    assert len(expected) == 120
+    assert len(read_mp4_keyframes(str(vfr_mp4))) > 4  # Seeks have to go through keyframes
+    reader = SegmentedVideoReader(str(vfr_mp4))
+    order = [57, 100, 48, 96, 0, 119, 12, 11, 13, 60, 59, 61, 1] + list(np.random.default_rng(2).permutation(120))
+    for i in order:
+        np.testing.assert_array_equal(reader.read(int(i)), expected[i], err_msg=f'frame {i}')
+    reader.close()
+
+
+def test_sequential_reads_do_not_seek(vfr_mp4):
+    reader = SegmentedVideoReader(str(vfr_mp4))
+    reader.read(30)
+    decoded = reader.frames_decoded
+    for i in range(31, 40):
+        reader.read(i)
+    assert reader.frames_decoded == decoded + 9
+    reader.close()
@@ -0,0 +1,64 @@
+import threading
+import time
+import pytest
+import startup as startup_module
+from acquisition import Acquisition
+from camera_settings import negotiate
+from frame_sources import SyntheticSource
+from startup import Startup, UnavailableCamera
+from sync_driver import LoopbackSerial
+
+
+class HangingSource(SyntheticSource):
+    # Opens fine, then never returns from its first read, like a DirectShow camera can
+    def __init__(self, released):
+        super().__init__(64, 48, 30.0)
+        self.released = released
+
+    def read(self, image=None):
+        self.released.wait()
+        return False, None
+
+
+@pytest.fixture
+def released():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def run_startup(tmp_path, cameras, open_camera):
+    def build(captures, arduino, camera_info):
+        return Acquisition(captures, str(tmp_path), 30.0, (64, 48), (32, 32), arduino=arduino, save_pickle=False,
+                           camera_info=camera_info)
+
+    startup = Startup()
+    acq = startup.run(cameras, open_camera, LoopbackSerial, build,
+                      configure=lambda position, capture: negotiate(capture, None, 30.0))
+    return startup, acq
+
+
+def test_camera_hanging_in_negotiation_times_out(tmp_path, monkeypatch, released):
+    monkeypatch.setattr(startup_module, 'CAMERA_OPEN_TIMEOUT', 0.5)
+    t0 = time.perf_counter()
+    startup, acq = run_startup(tmp_path, ['good', 'hung'],
+                               lambda cam: SyntheticSource(64, 48, 30.0) if cam == 'good' else HangingSource(released))
+    try:
+        assert time.perf_counter() - t0 < 5.0
+        assert startup.state == 'ready'
+        assert startup.devices['camera good']['state'] == 'ready'
+        assert startup.devices['camera hung']['state'] == 'timeout'
+        assert isinstance(acq.captures[1], UnavailableCamera)
+        assert acq.cameras[0]['granted']['frame_shape'] == [48, 64, 3]
+        assert acq.cameras[1]['granted']['frame_shape'] is None
+    finally:
+        acq.close()
+
+
+def test_repeated_sources_get_a_device_each(tmp_path):
+    startup, acq = run_startup(tmp_path, ['synthetic', 'synthetic'], lambda cam: SyntheticSource(64, 48, 30.0))
+    try:
+        assert sorted(startup.devices) == ['camera synthetic (0)', 'camera synthetic (1)', 'serial']
+        assert acq.captures[0] is not acq.captures[1]
+    finally:
+        acq.close()
@@ -0,0 +1,77 @@
+import threading
+import numpy as np
+import pytest
+from sync_driver import LoopbackSerial, SyncDriver, SyncSchedule, next_level
+
+
+def commands(schedule, n_frames):
+    # {frame count: command} over the first n_frames recorded frames
+    return {count: schedule.command_for(count) for count in range(1, n_frames + 1)
+            if schedule.command_for(count) is not None}
+
+
+def test_toggle_schedule():
+    assert commands(SyncSchedule(100, 'toggle'), 350) == {100: b'T', 200: b'T', 300: b'T'}
+    assert commands(SyncSchedule(1, 'toggle'), 3) == {1: b'T', 2: b'T', 3: b'T'}
+
+
+def test_pulse_schedule():
+    assert commands(SyncSchedule(5, 'pulse', pulse_frames=2), 16) == {5: b'H', 7: b'L', 10: b'H', 12: b'L',
+                                                                      15: b'H'}
+
+
+@pytest.mark.parametrize('every, mode, pulse_frames', [(0, 'toggle', 1), (5, 'pulse', 5), (5, 'pulse', 0),
+                                                       (5, 'square', 1)])
+def test_invalid_schedules(every, mode, pulse_frames):
+    with pytest.raises(ValueError):
+        SyncSchedule(every, mode, pulse_frames)
+
+
+def test_next_level():
+    assert next_level(0, b'T') == 1
+    assert next_level(1, b'T') == 0
+    assert next_level(0, b'H') == 1
+    assert next_level(1, b'H') == 1
+    assert next_level(1, b'L') == 0
+    assert next_level(0, b'L') == 0
+
+
+def test_driver_records_events_in_order():
+    serial = LoopbackSerial(latency=0.001)
+    driver = SyncDriver(serial)
+    driver.start()
+    sent = [(b'L', -1)] + [(b'T', frame) for frame in range(10)]
+    for command, frame in sent:
+        driver.send(command, frame)
+    assert driver.wait_idle()
+    events = driver.take_events()
+    driver.stop()
+
+    assert [(bytes(e['command']), int(e['frame_index'])) for e in events] == sent
+    assert [command for _, command in serial.received] == [command for command, _ in sent]
+    assert serial.level == 0  # Low, then an even number of toggles
+    assert np.all(events['queued_time'] <= events['write_start'])
+    assert np.all(events['write_start'] < events['write_end'])
+    assert np.all(np.diff(events['write_start']) > 0)
+    assert len(driver.take_events()) == 0  # Taken events are not returned twice
+
+
+def test_wait_idle_drains_a_slow_port():
+    release = threading.Event()
+
+    class BlockedSerial(LoopbackSerial):
+        def write(self, data):
+            release.wait()
+            return super().write(data)
+
+    serial = BlockedSerial()
+    driver = SyncDriver(serial)
+    driver.start()
+    for _ in range(3):
+        driver.send(b'T')
+    assert not driver.wait_idle(timeout=0.05)
+    release.set()
+    assert driver.wait_idle(timeout=2.0)
+    assert len(serial.received) == 3
+    assert serial.level == 1
+    driver.stop()
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from frame_writer import FrameWriter
+from segments import SegmentedBackend, SegmentedVideoReader, manifest_filename, read_manifest
+from writer_backends import RAW_CHUNK_FRAMES, RawBackend, make_backend, read_raw
+
+SHAPE = (24, 32)
+
+
+def frames(n_frames):
+    # Every frame differs from the others in every pixel row
+    return [np.full(SHAPE, i % 256, dtype=np.uint8) + np.arange(SHAPE[1], dtype=np.uint8) for i in range(n_frames)]
+
+
+def test_raw_round_trip(tmp_path):
+    path = str(tmp_path / 'rec_eye1.raw')
+    written = frames(RAW_CHUNK_FRAMES + 10)  # Crosses a memory map chunk
+    backend = RawBackend(path, 30.0, SHAPE)
+    for frame in written:
+        backend.write(frame)
+    backend.close()
+
+    read_back = read_raw(path)
+    assert read_back.shape == (len(written),) + SHAPE
+    np.testing.assert_array_equal(read_back, np.stack(written))
+    assert backend.stats()['bytes_written'] == read_back.nbytes
+
+
+def test_raw_without_frames(tmp_path):
+    path = str(tmp_path / 'rec_eye1.raw')
+    make_backend('raw', path, 30.0, SHAPE).close()
+    assert read_raw(path).shape == (0,) + SHAPE
+
+
+def test_unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        make_backend('h265', str(tmp_path / 'rec_eye1.mp4'), 30.0, SHAPE)
+
+
+def test_mp4v_that_cannot_open(tmp_path):
+    with pytest.raises(IOError):
+        make_backend('mp4v', str(tmp_path / 'missing' / 'rec_eye1.mp4'), 30.0, SHAPE)
+    with pytest.raises(RuntimeError, match='could not open the mp4v backend'):
+        FrameWriter(str(tmp_path / 'missing' / 'rec_eye1.mp4'), 'mp4v', 30.0, SHAPE[::-1])
+
+
+def test_segmented_manifest_and_reader(tmp_path):
+    path = str(tmp_path / 'rec_eye1.raw')
+    written = frames(25)
+    backend = SegmentedBackend('raw', path, 30.0, SHAPE, segment_frames=10)
+    for frame in written[:15]:
+        backend.write(frame)
+    # Rewritten whenever a segment opens, the open segment has no frame count yet
+    manifest = read_manifest(manifest_filename(path))
+    assert not manifest['complete']
+    assert [segment['n_frames'] for segment in manifest['segments']] == [10, None]
+    for frame in written[15:]:
+        backend.write(frame)
+    backend.close()
+
+    manifest = read_manifest(manifest_filename(path))
+    assert manifest['complete']
+    assert [segment['file'] for segment in manifest['segments']] == ['rec_eye1_000.raw', 'rec_eye1_001.raw',
+                                                                   'rec_eye1_002.raw']
+    assert [segment['first_frame'] for segment in manifest['segments']] == [0, 10, 20]
+    assert [segment['n_frames'] for segment in manifest['segments']] == [10, 10, 5]
+    assert backend.stats()['frames_written'] == 25
+
+    reader = SegmentedVideoReader(path)
+    assert len(reader) == 25
+    for i in (24, 3, 10, 9, 0, 17):
+        np.testing.assert_array_equal(reader.read(i), written[i])
+    assert reader.locate(17)[1] == 7
+    with pytest.raises(IndexError):
+        reader.read(25)
+    reader.close()
@@ -1,100 +1,78 @@
 import sys
-import cv2
-import numpy as np
-import socket
-import os
 import time
-import pickle
 from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QFileDialog, QDesktopWidget, QSizePolicy
-from PyQt5.QtCore import QTimer, QThread, pyqtSignal, Qt
+from PyQt5.QtCore import QTimer, Qt
 from PyQt5.QtGui import QImage, QPixmap
-
-# Configurable variables
-UDP_LISTEN_PORT = 1813
-DATA_ROOT = 'C://local_repository//'  # Change as needed to your data root
-CAMERAS = [2,1,0]  # List of camera indices to acquire and in what order
-ARDUINO_PORT = 'COM4'  # Change as needed to your Arduino port
-DESIRED_FPS = 30
-
-# Display size
-DISP_WIDTH = 350
-DISP_HEIGHT = 350
-
-# Save size
-SAVE_WIDTH = 744
-SAVE_HEIGHT = 480
-
-class DummyArduino:
-    def write(self, data):
-        print(f"Dummy Arduino received data: {data}")
-
-class UDPListener(QThread):
-    udp_signal = pyqtSignal(str)
-
-    def __init__(self, port=UDP_LISTEN_PORT):
-        super().__init__()
-        self.port = port
-        self.running = True
-        self.sock = None
-
-    def run(self):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind(("0.0.0.0", self.port))
-        self.sock.settimeout(1.0)  # Set a timeout for the socket operations
-
-        while self.running:
-            try:
-                data, _ = self.sock.recvfrom(1024)
-                message = data.decode('utf-8')
-                self.udp_signal.emit(message)
-            except socket.timeout:
-                continue
-            except OSError:
-                break
-
-    def stop(self):
-        self.running = False
-        if self.sock:
-            self.sock.close()
-        self.wait()
+from acquisition import Acquisition, open_arduino
+from camera_settings import negotiate
+from config import (UDP_LISTEN_PORT, DATA_ROOT, CAMERAS, ARDUINO_PORT, DESIRED_FPS, PREVIEW_FPS,
+                    RECORDING_BACKEND, MULTI_STREAM, SAVE_PICKLE, SAVE_PROFILE, METRICS_PORT,
+                    SYNC_EVERY_N_FRAMES, SYNC_MODE, SEGMENT_MINUTES, DISP_WIDTH, DISP_HEIGHT,
+                    SAVE_WIDTH, SAVE_HEIGHT, CAMERA_ROIS, ROI_SAVE_SIZE, CAMERA_SETTINGS)
+from control_server import ControlServer
+from frame_sources import open_camera
+from metrics_server import MetricsServer
+from preview import PreviewRenderer
+from startup import Startup
+from sync_driver import SyncSchedule
 
 class CameraApp(QWidget):
     def __init__(self):
         super().__init__()
         self.data_root = DATA_ROOT
         self.cameras = CAMERAS
+        self.acq = None
+        self.preview = None
+        # UDP commands are handled and acknowledged off the GUI thread, see control_server.py.
+        # The server listens before the devices are opened, a GOGO sent meanwhile waits for them.
+        self.startup = Startup()
+        self.control_server = ControlServer(None, UDP_LISTEN_PORT, startup=self.startup)
+        self.control_server.start()
+        self.metrics_server = None
         self.initUI()
-        self.captures = [cv2.VideoCapture(cam, cv2.CAP_DSHOW) for cam in self.cameras]
-
-        # Set the frame rate for each camera
-        for i, capture in enumerate(self.captures):
-            capture.set(cv2.CAP_PROP_FPS, DESIRED_FPS)
+        # Cameras and the Arduino are opened and the camera settings negotiated in parallel off the
+        # GUI thread, see startup.py
+        self.startup.start(self.cameras, open_camera, lambda: open_arduino(ARDUINO_PORT), self.build_acquisition,
+                           self.control_server, configure=self.configure_camera)
 
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
-        self.timer.start(int(1000 / DESIRED_FPS))
-        self.recording = False
-        self.frame_count = 0
-        self.final_filename = None
-        self.last_time = time.time()
-        self.fps = 0
-        self.frame_data = {'frame_count': 0, 'frame_times': []}
-        self.experiment_id = None
-        self.acquisition_start_time = None
-        self.debug_t0 = None
-
-        self.udp_listener = UDPListener()
-        self.udp_listener.udp_signal.connect(self.handle_udp_message)
-        self.udp_listener.start()
-
-        # Arduino setup
-        try:
-            import serial
-            self.arduino = serial.Serial(ARDUINO_PORT, 9600)
-            print('Arduino detected')
-        except (ImportError, serial.SerialException):
-            self.arduino = DummyArduino()
-        self.arduino.write(b'L')  # Set Arduino to low at startup
+        self.timer.start(int(1000 / PREVIEW_FPS))
+
+    def configure_camera(self, position, capture):
+        # Runs on the camera's startup thread once it is open
+        return negotiate(capture, CAMERA_SETTINGS.get(self.cameras[position]), DESIRED_FPS)
+
+    def build_acquisition(self, captures, arduino, camera_info):
+        # Runs on the startup thread once the devices are open
+        save_size = ROI_SAVE_SIZE if CAMERA_ROIS and ROI_SAVE_SIZE else (SAVE_WIDTH, SAVE_HEIGHT)
+        acq = Acquisition(captures, self.data_root, DESIRED_FPS, save_size,
+                          (DISP_WIDTH, DISP_HEIGHT), arduino=arduino,
+                          backend=RECORDING_BACKEND, camera_ids=self.cameras, multi_stream=MULTI_STREAM,
+                          save_pickle=SAVE_PICKLE, sync_schedule=SyncSchedule(SYNC_EVERY_N_FRAMES, SYNC_MODE),
+                          segment_frames=int(SEGMENT_MINUTES * 60 * DESIRED_FPS) or None, rois=CAMERA_ROIS,
+                          camera_settings=CAMERA_SETTINGS, save_profile=SAVE_PROFILE, camera_info=camera_info)
+        # Frames are acquired and recorded on the scheduler thread, the timer only refreshes the preview
+        acq.start()
+        return acq
+
+    def on_ready(self, acq):
+        self.acq = acq
+        self.preview = PreviewRenderer(acq)
+        if METRICS_PORT:
+            self.metrics_server = MetricsServer(acq, METRICS_PORT)
+            self.metrics_server.start()
+        self.record_button.setEnabled(True)
+
+    def show_startup(self):
+        snapshot = self.startup.snapshot()
+        lines = [f"Starting ({snapshot['elapsed_s']:.1f} s)"]
+        lines += [f"{name}: {entry['state']}" for name, entry in snapshot['devices'].items()]
+        if snapshot['error']:
+            lines.append(f"Startup failed: {snapshot['error']}")
+        text = '\n'.join(lines)
+        if self.image_label.text() != text:
+            self.image_label.setText(text)
 
     def initUI(self):
         self.image_label = QLabel(self)
@@ -103,10 +81,12 @@ class CameraApp(QWidget):
         self.image_label.setFixedSize(label_width, label_height)  # Set the QLabel size
         self.image_label.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
         self.image_label.setAlignment(Qt.AlignCenter)
+        self.image_label.setScaledContents(True)
 
         self.record_button = QPushButton('Start Recording', self)
         self.record_button.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Fixed)
         self.record_button.clicked.connect(self.toggle_recording)
+        self.record_button.setEnabled(False)  # Until the cameras are open
 
         layout = QVBoxLayout()
         layout.addWidget(self.image_label)
@@ -131,82 +111,29 @@ class CameraApp(QWidget):
         )
 
     def update_frame(self):
-        frames_disp = []
-        frames_save = []
-        for capture in self.captures:
-            ret, frame = capture.read()
-            if ret:
-                resized_frame_disp = cv2.resize(frame, (DISP_WIDTH, DISP_HEIGHT))
-                resized_frame_save = cv2.resize(frame, (SAVE_WIDTH, SAVE_HEIGHT))
-                frames_disp.append(cv2.cvtColor(resized_frame_disp, cv2.COLOR_BGR2GRAY))
-                frames_save.append(cv2.cvtColor(resized_frame_save, cv2.COLOR_BGR2GRAY))
-
-        if len(frames_disp) < 3:
-            for _ in range(3 - len(frames_disp)):
-                frames_disp.append(np.zeros((DISP_HEIGHT, DISP_WIDTH), dtype=np.uint8))
-                frames_save.append(np.zeros((SAVE_HEIGHT, SAVE_WIDTH), dtype=np.uint8))
-
-        combined_frame_display = np.vstack(frames_disp)
-        combined_frame_save = np.hstack(frames_save)
-
-        # Update the FPS calculation
-        current_time = time.time()
-        self.fps = 1.0 / (current_time - self.last_time)
-        self.last_time = current_time
-
-        # Convert the grayscale frame to a 3-channel image for colored text overlay
-        display_frame = cv2.cvtColor(combined_frame_display, cv2.COLOR_GRAY2BGR)
-
-        # Overlay the FPS and status text on the display frame
-        display_frame = cv2.putText(display_frame, f'FPS: {self.fps:.2f}', (10, 30),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
-        status_text = "RECORDING" if self.recording else "IDLE"
-        status_color = (0, 0, 255) if self.recording else (0, 255, 0)
-        display_frame = cv2.putText(display_frame, status_text, (10, 50),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, status_color, 1, cv2.LINE_AA)
-
-        if self.recording and self.experiment_id:
-            display_frame = cv2.putText(display_frame, f'Experiment ID: {self.experiment_id}', (10, 70),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
-            elapsed_time = time.time() - self.acquisition_start_time
-            elapsed_time_str = time.strftime("%H:%M:%S", time.gmtime(elapsed_time)) + f":{int((elapsed_time % 1) * 100):02d}"
-            display_frame = cv2.putText(display_frame, f'Elapsed Time: {elapsed_time_str}', (10, 90),
-                                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
-
-            if self.frame_count >= 100:
-                interframe_intervals = np.diff(self.frame_data['frame_times'][-100:])
-                if len(interframe_intervals) > 0:
-                    avg_interframe_interval = np.mean(interframe_intervals) * 1000  # Convert to milliseconds
-                    std_interframe_interval = np.std(interframe_intervals) * 1000  # Convert to milliseconds
-                    display_frame = cv2.putText(display_frame,
-                                                f'Avg Interframe: {avg_interframe_interval:.2f}ms +/- {std_interframe_interval:.2f}ms',
-                                                (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
-
-        self.display_image(display_frame)
-
-        if self.recording:
-            self.out.write(combined_frame_save)
-            self.frame_count += 1
-            self.frame_data['frame_count'] = self.frame_count
-            frame_time = current_time - self.start_time
-            self.frame_data['frame_times'].append(frame_time)
-            if self.frame_count % 100 == 0:
-                self.toggle_arduino_output()
+        if self.acq is None:
+            if self.startup.acquisition is None:
+                self.show_startup()
+                return
+            self.on_ready(self.startup.acquisition)
+        # Recordings can also be started and stopped over UDP
+        button_text = 'Stop Recording' if self.acq.recording else 'Start Recording'
+        if self.record_button.text() != button_text:
+            self.record_button.setText(button_text)
+        frame = self.preview.render()
+        if frame is not None:  # None when nothing changed since the last refresh
+            self.display_image(frame)
 
     def display_image(self, frame):
-        qformat = QImage.Format_RGB888
-        img = QImage(frame, frame.shape[1], frame.shape[0], frame.strides[0], qformat)
-        self.image_label.setPixmap(QPixmap.fromImage(img))
-        self.image_label.setScaledContents(True)
+        t0 = time.perf_counter()
+        img = QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_Grayscale8)
+        self.image_label.setPixmap(QPixmap.fromImage(img))  # fromImage copies, the canvas can be reused
+        self.acq.profiler.add('display', time.perf_counter() - t0)
 
     def toggle_recording(self):
-        if self.recording:
-            self.recording = False
+        if self.acq.recording:
+            self.acq.stop_recording()
             self.record_button.setText('Start Recording')
-            self.out.release()
-            self.save_frame_data()
-            self.arduino.write(b'L')  # Set Arduino to low after stopping recording
-            self.experiment_id = None
         else:
             options = QFileDialog.Options()
             options |= QFileDialog.DontUseNativeDialog
@@ -214,59 +141,22 @@ class CameraApp(QWidget):
             if filename:
                 if not filename.endswith('.mp4'):
                     filename += '.mp4'
-                self.start_recording(filename)
-
-    def start_recording(self, filename):
-        self.recording = True
-        self.record_button.setText('Stop Recording')
-        self.final_filename = filename
-        self.frame_count = 0
-        height, width = SAVE_HEIGHT, SAVE_WIDTH * 3  # Combined width for 3 cameras
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        self.out = cv2.VideoWriter(self.final_filename, fourcc, 20.0, (width, height), isColor=False)
-        self.frame_data = {'frame_count': 0, 'frame_times': []}
-        self.start_time = time.time()
-        self.acquisition_start_time = time.time()
-        self.arduino.write(b'L')  # Set Arduino to low at the start of recording
-
-    def handle_udp_message(self, message):
-        command = message[:4]
-        experiment_id = message[5:]
-        if command == "STOP":
-            if self.recording:
-                self.toggle_recording()
-        elif command == "GOGO":
-            self.debug_t0 = time.time()
-            print(f"[DEBUG] UDP GOGO received: t=0.000s, experiment_id={experiment_id}")
-            self.experiment_id = experiment_id
-            save_dir = os.path.join(self.data_root, experiment_id[14:], experiment_id)
-            os.makedirs(save_dir, exist_ok=True)
-            filename = os.path.join(save_dir, f"{experiment_id}_eye1.mp4")
-            self.start_recording(filename)
-
-    def toggle_arduino_output(self):
-        self.arduino.write(b'T')  # Dummy command to toggle digital output
-        if self.debug_t0 is not None:
-            elapsed = time.time() - self.debug_t0
-            print(f"[DEBUG] Digital output toggled: t={elapsed:.3f}s, frame={self.frame_count}")
-        else:
-            print(f"[DEBUG] Digital output toggled: t=NA (no UDP GOGO), frame={self.frame_count}")
-
-    def save_frame_data(self):
-        if self.final_filename:
-            meta_filename = self.final_filename.replace('_eye1.mp4', '_eyeMeta1.pickle')
-            with open(meta_filename, 'wb') as f:
-                pickle.dump(self.frame_data, f)
+                try:
+                    self.acq.start_recording(filename)
+                except (RuntimeError, OSError) as error:
+                    print(f'Could not start recording: {error}')
+                    return
+                self.record_button.setText('Stop Recording')
 
     def closeEvent(self, event):
         self.timer.stop()
-        self.udp_listener.stop()
-        for capture in self.captures:
-            capture.release()
-        if self.recording:
-            self.out.release()
-        if hasattr(self.arduino, 'close'):
-            self.arduino.close()
+        self.control_server.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        # Closing during startup waits for the devices being opened, so they are released
+        acq = self.startup.wait()
+        if acq is not None:
+            acq.close()
         event.accept()  # Ensure the event is accepted to close the application
 
 if __name__ == '__main__':
@@ -0,0 +1,143 @@
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from acquisition import Acquisition, open_arduino
+from camera_settings import negotiate, parse_camera_settings
+from config import (UDP_LISTEN_PORT, DATA_ROOT, CAMERAS, ARDUINO_PORT, DESIRED_FPS,
+                    RECORDING_BACKEND, MULTI_STREAM, SAVE_PICKLE, SAVE_PROFILE, METRICS_PORT,
+                    SYNC_EVERY_N_FRAMES, SYNC_MODE, SEGMENT_MINUTES, DISP_WIDTH, DISP_HEIGHT,
+                    SAVE_WIDTH, SAVE_HEIGHT, CAMERA_ROIS, ROI_SAVE_SIZE, CAMERA_SETTINGS)
+from control_server import ControlServer
+from frame_sources import open_source
+from metrics_server import MetricsServer
+from startup import Startup
+from sync_driver import SYNC_MODES, LoopbackSerial, SyncSchedule
+from writer_backends import BACKENDS
+
+
+def run_acquisition(acq, duration=None, stop_event=None):
+    # Runs the acquisition clock until duration seconds have passed or stop_event is set
+    stop_event = stop_event or threading.Event()
+    t_end = None if duration is None else time.perf_counter() + duration
+    acq.start()
+    try:
+        # Wait in short steps so Ctrl+C is handled promptly on Windows
+        while not stop_event.is_set():
+            remaining = 0.5 if t_end is None else t_end - time.perf_counter()
+            if remaining <= 0:
+                break
+            stop_event.wait(min(remaining, 0.5))
+    finally:
+        acq.scheduler.stop()
+    stats = acq.scheduler.stats()
+    print(f"Achieved {stats['achieved_fps']:.3f} fps (target {stats['target_fps']:.3f}) over {stats['ticks']} ticks, "
+          f"{stats['missed_deadlines']} missed deadlines, max lateness {stats['max_lateness_ms']:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run acquisition without the Qt window')
+    parser.add_argument('--source', action='append',
+                        help="frame source per camera: camera index, 'synthetic[:WxH[@fps]]' or 'file:<path>' "
+                             '(repeat for several cameras, default: CAMERAS)')
+    parser.add_argument('--fps', type=float, default=DESIRED_FPS)
+    parser.add_argument('--data-root', default=DATA_ROOT)
+    parser.add_argument('--backend', default=RECORDING_BACKEND, choices=sorted(BACKENDS))
+    parser.add_argument('--multi-stream', action='store_true', default=MULTI_STREAM, help='one file per camera')
+    parser.add_argument('--port', type=int, default=UDP_LISTEN_PORT, help='UDP control port, 0 disables it')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help='Prometheus metrics port on 127.0.0.1, 0 disables it')
+    parser.add_argument('--profile', action='store_true', default=SAVE_PROFILE,
+                        help="save stage timing histograms as '<recording>_eyeProfile1.json'")
+    parser.add_argument('--record', metavar='FILE', help='start recording to FILE immediately')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds')
+    parser.add_argument('--no-arduino', action='store_true', help='use a loopback serial device instead of the Arduino')
+    parser.add_argument('--sync-every', type=int, default=SYNC_EVERY_N_FRAMES, help='frames between sync commands')
+    parser.add_argument('--sync-mode', default=SYNC_MODE, choices=SYNC_MODES)
+    parser.add_argument('--segment-minutes', type=float, default=SEGMENT_MINUTES, help='new file every N minutes, 0 for one file')
+    parser.add_argument('--segment-frames', type=int, help='new file every N frames (overrides --segment-minutes)')
+    parser.add_argument('--roi', action='append', metavar='CAM:X,Y,W,H',
+                        help='save only this box of camera CAM (camera index or source position), repeatable')
+    parser.add_argument('--camera', action='append', metavar='CAM:KEY=VALUE,...',
+                        help='driver settings of camera CAM, keys: width, height, fourcc, exposure, gain, '
+                             'auto_exposure, buffer_size, y_plane (e.g. 0:width=640,height=480,fourcc=YUY2,y_plane=1)')
+    parser.add_argument('--save-size', metavar='WxH', help='save size per camera (default SAVE_WIDTH x SAVE_HEIGHT, '
+                                                           'or ROI_SAVE_SIZE with ROIs)')
+    args = parser.parse_args()
+
+    # Listening before any device is opened, early commands get the startup state and GOGO waits
+    startup = Startup()
+    control_server = None
+    if args.port:
+        control_server = ControlServer(None, args.port, startup=startup)
+        control_server.start()
+
+    sources = args.source or CAMERAS
+    # Camera indices name the per-camera files, other sources are numbered by position
+    camera_ids = [int(spec) if str(spec).isdigit() else i for i, spec in enumerate(sources)]
+    rois = dict(CAMERA_ROIS)
+    camera_settings = dict(CAMERA_SETTINGS)
+    for spec in args.camera or []:
+        cam, settings = parse_camera_settings(spec)
+        camera_settings[cam] = settings
+    for spec in args.roi or []:
+        cam, box = spec.split(':')
+        rois[int(cam)] = tuple(int(v) for v in box.split(','))
+    if args.save_size:
+        save_size = tuple(int(v) for v in args.save_size.lower().split('x'))
+    else:
+        save_size = ROI_SAVE_SIZE if rois and ROI_SAVE_SIZE else (SAVE_WIDTH, SAVE_HEIGHT)
+    def configure(position, capture):
+        # Runs on the camera's startup thread, under its open timeout
+        return negotiate(capture, camera_settings.get(camera_ids[position]), args.fps)
+
+    def build(captures, arduino, camera_info):
+        return Acquisition(captures, args.data_root, args.fps, save_size,
+                           (DISP_WIDTH, DISP_HEIGHT), arduino=arduino, backend=args.backend,
+                           camera_ids=camera_ids, multi_stream=args.multi_stream, save_pickle=SAVE_PICKLE,
+                           sync_schedule=SyncSchedule(args.sync_every, args.sync_mode),
+                           segment_frames=args.segment_frames or int(args.segment_minutes * 60 * args.fps) or None,
+                           rois=rois, camera_settings=camera_settings, save_profile=args.profile,
+                           camera_info=camera_info)
+
+    open_serial = LoopbackSerial if args.no_arduino else lambda: open_arduino(ARDUINO_PORT)
+    acq = startup.run(sources, lambda spec: open_source(spec, args.fps), open_serial, build, control_server,
+                      configure=configure)
+    if acq is None:
+        if control_server is not None:
+            control_server.stop()
+        sys.exit(1)
+    metrics_server = MetricsServer(acq, args.metrics_port)
+    if args.metrics_port:
+        metrics_server.start()
+    if args.record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.record)), exist_ok=True)
+        try:
+            acq.start_recording(args.record)
+        except (RuntimeError, OSError) as error:
+            print(f'Could not start recording: {error}')
+            if control_server is not None:
+                control_server.stop()
+            metrics_server.stop()
+            acq.close()
+            sys.exit(1)
+
+    print(f'Acquiring from {len(sources)} sources at {args.fps} fps, Ctrl+C to stop')
+    # Shut down cleanly when terminated by a controller, e.g. coordinator.py --local
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    try:
+        run_acquisition(acq, args.duration, stop_event)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if control_server is not None:
+            control_server.stop()
+        metrics_server.stop()
+        acq.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,71 @@
+import argparse
+import json
 import socket
+import time
+import numpy as np
 
 def send_udp_message(message, address="127.0.0.1", port=1813):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.sendto(message.encode('utf-8'), (address, port))
     sock.close()
 
+def send_command(message, address="127.0.0.1", port=1813, timeout=10.0, sock=None):
+    # Sends one command and waits for its JSON acknowledgement. Returns (reply, round trip seconds),
+    # reply is None on timeout.
+    own_sock = sock is None
+    if own_sock:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(timeout)
+    try:
+        t0 = time.perf_counter()
+        sock.sendto(message.encode('utf-8'), (address, port))
+        try:
+            data, _ = sock.recvfrom(65536)
+        except socket.timeout:
+            return None, time.perf_counter() - t0
+        return json.loads(data.decode('utf-8')), time.perf_counter() - t0
+    finally:
+        if own_sock:
+            sock.close()
+
+def ping_latency(n, address="127.0.0.1", port=1813, command="PING"):
+    # Round trip times in milliseconds of n sequential commands, lost replies are left out
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rtts = []
+    try:
+        for _ in range(n):
+            reply, rtt = send_command(command, address, port, timeout=1.0, sock=sock)
+            if reply is not None:
+                rtts.append(1000 * rtt)
+    finally:
+        sock.close()
+    return np.array(rtts)
+
+def print_latency(name, rtts, n):
+    if len(rtts) == 0:
+        print(f'{name}: no replies')
+        return
+    p50, p95, p99 = np.percentile(rtts, [50, 95, 99])
+    print(f'{name}: {len(rtts)}/{n} replies, round trip p50 {p50:.3f} ms, p95 {p95:.3f} ms, '
+          f'p99 {p99:.3f} ms, max {rtts.max():.3f} ms')
+
 if __name__ == "__main__":
-    # Example usage:
-    expID = '2016-10-14_09_CFAP049'
-    udp_command = 'GOGO'
-    send_udp_message(udp_command+'*'+expID)  # Start recording
-    input("Press Enter to stop recording...")
-    send_udp_message("STOP")  # Stop recording
+    parser = argparse.ArgumentParser(description='Send commands to the acquisition control server')
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1813)
+    parser.add_argument('--ping', type=int, metavar='N', help='measure the round trip of N PING and STATUS commands')
+    parser.add_argument('--exp-id', default='2016-10-14_09_CFAP049')
+    args = parser.parse_args()
+
+    if args.ping:
+        for command in ('PING', 'STATUS'):
+            print_latency(command, ping_latency(args.ping, args.address, args.port, command), args.ping)
+    else:
+        # Example usage: start a recording, wait, stop it
+        reply, rtt = send_command('GOGO' + '*' + args.exp_id, args.address, args.port)  # Start recording
+        print(f'GOGO round trip {1000 * rtt:.1f} ms: {reply}')
+        if reply and reply.get('ok'):
+            print(f"Recording started {1000 * (reply['start_time'] - reply['received']):.1f} ms after GOGO arrived")
+        input("Press Enter to stop recording...")
+        reply, rtt = send_command("STOP", args.address, args.port)  # Stop recording
+        print(f'STOP round trip {1000 * rtt:.1f} ms: {reply}')
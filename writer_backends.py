@@ -0,0 +1,147 @@
+import json
+import os
+import subprocess
+import time
+import numpy as np
+
+# Encoder backends run inside the writer process (see frame_writer.py). They all take
+# uint8 frames of one fixed shape and keep track of how many bytes they wrote and how long
+# write() took, so backends can be compared on a given rig.
+
+FFMPEG_BINARY = 'ffmpeg'  # Full path if ffmpeg is not on the PATH
+RAW_CHUNK_FRAMES = 256  # The raw file grows and is memory-mapped this many frames at a time
+
+
+class WriterBackend:
+    extension = None
+
+    def __init__(self, filename, fps, shape):
+        self.filename = filename
+        self.fps = fps
+        self.shape = tuple(shape)
+        self.frames_written = 0
+        self.encode_time = 0.0
+        self.t_open = time.perf_counter()
+
+    def write(self, frame):
+        t0 = time.perf_counter()
+        self._write(frame)
+        self.encode_time += time.perf_counter() - t0
+        self.frames_written += 1
+
+    def bytes_written(self):
+        return os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+
+    def stats(self):
+        duration = time.perf_counter() - self.t_open
+        n_bytes = self.bytes_written()
+        return {'backend': self.name,
+                'frames_written': self.frames_written,
+                'bytes_written': n_bytes,
+                'bytes_per_s': n_bytes / duration if duration > 0 else 0.0,
+                'encode_ms_mean': 1000 * self.encode_time / self.frames_written if self.frames_written else 0.0}
+
+
+class Mp4vBackend(WriterBackend):
+    name = 'mp4v'
+    extension = '.mp4'
+
+    def __init__(self, filename, fps, shape):
+        import cv2
+        super().__init__(filename, fps, shape)
+        height, width = self.shape[:2]
+        self.out = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height),
+                                   isColor=len(self.shape) == 3)
+        if not self.out.isOpened():
+            raise IOError(f'Could not open {filename} for writing with the mp4v codec')
+
+    def _write(self, frame):
+        self.out.write(frame)
+
+    def close(self):
+        self.out.release()
+
+
+class FFV1Backend(WriterBackend):
+    # Lossless FFV1 in Matroska through an ffmpeg pipe. Every frame is a keyframe (-g 1) so
+    # any frame can be decoded on its own. encode_ms_mean is the time spent blocked on the
+    # pipe, i.e. how far ffmpeg is from keeping up, not ffmpeg's own CPU time.
+    name = 'ffv1'
+    extension = '.mkv'
+
+    def __init__(self, filename, fps, shape):
+        super().__init__(filename, fps, shape)
+        height, width = self.shape[:2]
+        pix_fmt = 'bgr24' if len(self.shape) == 3 else 'gray'
+        self.process = subprocess.Popen(
+            [FFMPEG_BINARY, '-y', '-loglevel', 'error',
+             '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', f'{width}x{height}', '-r', f'{fps}', '-i', '-',
+             '-c:v', 'ffv1', '-level', '3', '-g', '1', '-slices', '4', '-slicecrc', '1', filename],
+            stdin=subprocess.PIPE)
+
+    def _write(self, frame):
+        self.process.stdin.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class RawBackend(WriterBackend):
+    # Uncompressed frames back to back in one file, written through a memory map that is
+    # extended RAW_CHUNK_FRAMES at a time. Costs a memcpy per frame and no encoding. The
+    # shape, dtype and frame count go into '<file>.json' on close, read back with read_raw().
+    name = 'raw'
+    extension = '.raw'
+
+    def __init__(self, filename, fps, shape):
+        super().__init__(filename, fps, shape)
+        self.frame_bytes = int(np.prod(self.shape))
+        self.file = open(filename, 'w+b')
+        self.chunk = None
+        self.chunk_start = 0
+
+    def _map_chunk(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+            self.chunk = None
+        self.chunk_start = self.frames_written
+        self.file.truncate((self.chunk_start + RAW_CHUNK_FRAMES) * self.frame_bytes)
+        self.chunk = np.memmap(self.file, dtype=np.uint8, mode='r+', offset=self.chunk_start * self.frame_bytes,
+                               shape=(RAW_CHUNK_FRAMES,) + self.shape)
+
+    def _write(self, frame):
+        if self.chunk is None or self.frames_written - self.chunk_start == RAW_CHUNK_FRAMES:
+            self._map_chunk()
+        self.chunk[self.frames_written - self.chunk_start] = frame
+
+    def bytes_written(self):
+        return self.frames_written * self.frame_bytes
+
+    def close(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+            self.chunk = None
+        self.file.truncate(self.frames_written * self.frame_bytes)
+        self.file.close()
+        with open(self.filename + '.json', 'w') as f:
+            json.dump({'shape': list(self.shape), 'dtype': 'uint8', 'fps': self.fps,
+                       'n_frames': self.frames_written}, f, indent=2)
+
+
+BACKENDS = {backend.name: backend for backend in (Mp4vBackend, FFV1Backend, RawBackend)}
+
+
+def make_backend(name, filename, fps, shape):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown writer backend '{name}', choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name](filename, fps, shape)
+
+
+def read_raw(filename):
+    # Memory-mapped (n_frames, height, width[, 3]) array of a file written by RawBackend
+    with open(filename + '.json') as f:
+        header = json.load(f)
+    if header['n_frames'] == 0:
+        return np.zeros([0] + header['shape'], dtype=header['dtype'])
+    return np.memmap(filename, dtype=header['dtype'], mode='r', shape=tuple([header['n_frames']] + header['shape']))